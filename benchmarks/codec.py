@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Benchmark for dumping and loading a synthetic library of regular
+collections as json and in the binary form of bgmcli.api.codec.
+
+Usage:
+    python benchmarks/codec.py [n_subjects]
+"""
+
+import sys
+import time
+import random
+
+
+def make_library(n_subjects):
+    """Make n_subjects anime collections with 1 to 26 episodes each"""
+    from bgmcli.api.element import BangumiAnime, BangumiEpisode
+    from bgmcli.api.collection import BangumiAnimeCollection,\
+        BangumiEpisodeCollection
+    rand = random.Random(0)
+    colls = []
+    for i in xrange(n_subjects):
+        n_eps = rand.randint(1, 26)
+        sub = BangumiAnime(unicode(i), u'Title {0}'.format(i),
+                           u'标题 {0}'.format(i), n_eps,
+                           info_box=u'话数: {0}\n放送开始: 2015年4月{1}日'
+                           .format(n_eps, rand.randint(1, 30)))
+        eps = [BangumiEpisode(unicode(i * 100 + j), j + 1, 'EP', 'air',
+                              u'Episode {0}'.format(j + 1), u'', sub)
+               for j in xrange(n_eps)]
+        sub.eps = eps
+        n_watched = rand.randint(0, n_eps)
+        ep_colls = [BangumiEpisodeCollection(
+            ep, 'watched' if j < n_watched else None)
+            for j, ep in enumerate(eps)]
+        colls.append(BangumiAnimeCollection(
+            sub, rand.randint(1, 5), rand.randint(0, 10),
+            rand.sample([u'TV', u'原创', u'科幻', u'2015年4月'], 2), u'',
+            n_watched, ep_colls))
+    return colls
+
+
+def main():
+    from bgmcli.api import codec
+    from bgmcli.api.collection import BangumiAnimeCollection
+    n_subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    colls = make_library(n_subjects)
+
+    start = time.time()
+    json_lines = u'\n'.join(coll.to_json() for coll in colls).encode('utf-8')
+    json_dump = time.time() - start
+    start = time.time()
+    [BangumiAnimeCollection.from_json(line)
+     for line in json_lines.decode('utf-8').split(u'\n')]
+    json_load = time.time() - start
+
+    start = time.time()
+    data = codec.dumps(colls)
+    binary_dump = time.time() - start
+    start = time.time()
+    codec.loads(data)
+    binary_load = time.time() - start
+
+    print('{0} subjects'.format(n_subjects))
+    for name, dump, load, size in (
+            ('json', json_dump, json_load, len(json_lines)),
+            ('binary', binary_dump, binary_load, len(data))):
+        print('{0:7} dump {1:.2f}s  load {2:.2f}s  size {3:.1f}MB'
+              .format(name, dump, load, size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
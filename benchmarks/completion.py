@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Benchmark for cost of one completion keystroke, comparing the WordCompleter
+over a list of all titles with the TitleCompleter over a TitleIndex
+
+Usage:
+    python benchmarks/completion.py [n_titles]
+"""
+
+import sys
+import timeit
+from prompt_toolkit.contrib.completers import WordCompleter
+from prompt_toolkit.document import Document
+from bgmcli.cli.title_index import TitleIndex, TitleCompleter
+from stub_server import make_subjects
+
+
+def main():
+    n_titles = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    titles = [ch_title for _, _, ch_title in make_subjects(n_titles)]
+    commands = [u'kandao', u'kanguo', u'lseps']
+    document = Document(u'kandao ' + titles[n_titles // 2][:3])
+    index = TitleIndex(titles)
+    completers = [
+        ('WordCompleter', lambda: WordCompleter(commands + titles)),
+        ('TitleCompleter', lambda: TitleCompleter(commands, lambda: index))]
+    print 'titles: {0}'.format(n_titles)
+    for name, make_completer in completers:
+        completer = make_completer()
+        number = 20
+        total = timeit.timeit(
+            lambda: list(completer.get_completions(document, None)),
+            number=number)
+        print '{0:<16} {1:8.3f}ms per keystroke'.format(name,
+                                                        total / number * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Benchmark for lookup of subject names with SubjectMatcher, for exact
+names, names with typos and pinyin initials
+
+Usage:
+    python benchmarks/matching.py [n_subjects]
+"""
+
+import sys
+import time
+import timeit
+from bgmcli.cli.aliases import PinyinAliasCache
+from bgmcli.cli.matcher import SubjectMatcher
+from stub_server import make_subjects
+
+
+def main():
+    n_subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    subjects = make_subjects(n_subjects)
+    alias_cache = PinyinAliasCache('/dev/null')
+    matcher = SubjectMatcher()
+    start = time.time()
+    for sub_id, title, ch_title in subjects:
+        matcher.add(sub_id, [title, ch_title] +
+                    alias_cache.get_aliases(ch_title))
+    print 'subjects: {0}, names: {1}, indexed in {2:.0f}ms'.format(
+        n_subjects, len(matcher), (time.time() - start) * 1000)
+
+    # a subject with names long enough to be told apart from others
+    sub_id, title, ch_title = next(
+        subject for subject in subjects[n_subjects // 3:]
+        if len(subject[1]) >= 10 and len(subject[2]) >= 4)
+    pinyin, initials = alias_cache.get_aliases(ch_title)
+    queries = [('exact', ch_title), ('typo in title', title[:-1] + u'x'),
+               ('typo in pinyin', pinyin[:3] + pinyin[4:]),
+               ('initials', initials), ('missing', u'no such subject')]
+    for name, query in queries:
+        number = 200
+        # best match as used for commands, top 5 as used for completion
+        best_total = timeit.timeit(lambda: matcher.match(query, 1),
+                                   number=number)
+        top_total = timeit.timeit(lambda: matcher.match(query, 5),
+                                  number=number)
+        results = matcher.match(query, 1)
+        found = results[0][0] == sub_id if results else False
+        print '{0:<16} best: {1:6.3f}ms  top 5: {2:6.3f}ms  found: {3}'.format(
+            name, best_total / number * 1000, top_total / number * 1000,
+            found)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Benchmark for crawling regular collections of a watching list against a
+local stub server, parsing pages in the fetching threads and in a pool of
+processes.
+
+Usage:
+    python benchmarks/parsing.py [n_subjects] [n_threads] [latency]
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from stub_server import StubBangumiServer
+
+
+def crawl(n_threads, parser_pool):
+    """Fetch the list and all regular collections on it with n_threads"""
+    from bgmcli.api import BangumiSession
+    session = BangumiSession('stub@example.com', 'password',
+                             parser_pool=parser_pool)
+    start = time.time()
+    colls = session.get_dummy_collections('anime', 3)
+    pool = ThreadPool(n_threads)
+    try:
+        # episode collections are loaded on first access
+        pool.map(lambda coll: session.get_sub_collection(coll.subject.id_)
+                 .ep_collections, colls)
+    finally:
+        pool.close()
+        pool.join()
+    return time.time() - start
+
+
+def main():
+    from bgmcli.api.parsing import ParserPool
+    n_subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    n_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    # fork workers before any other thread is started
+    parser_pool = ParserPool()
+    server = StubBangumiServer(n_subjects, latency).start()
+    os.environ['http_proxy'] = server.proxy_url
+    os.environ.pop('no_proxy', None)
+    try:
+        print ('subjects: {0}, threads: {1}, latency: {2:.0f}ms, cpus: {3}'
+               .format(n_subjects, n_threads, latency * 1000,
+                       multiprocessing.cpu_count()))
+        for name, pool in (('in threads', None), ('process pool', parser_pool)):
+            elapsed = crawl(n_threads, pool)
+            print '{0:<14} {1:8.2f}s  {2:6.1f} subjects/s'.format(
+                name, elapsed, n_subjects / elapsed)
+    finally:
+        parser_pool.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
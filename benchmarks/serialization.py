@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Benchmark for size and speed of json of subject collections, in the
+nested layout of schema 1, where every nested object was json text of its
+own, and in the single pass layout of to_dict.
+
+Usage:
+    python benchmarks/serialization.py [n_collections]
+"""
+
+import os
+import sys
+import json
+import time
+
+_TESTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'tests')
+
+
+def legacy_to_json(sub_coll):
+    """Encode like to_json of schema 1, dumping each nested object to json
+    text before dumping the object holding it
+    """
+    def dumps(data):
+        data = {'_' + key: value for key, value in data.items()}
+        data['version'] = '0.0.0'
+        return json.dumps(data, ensure_ascii=False)
+
+    data = sub_coll.to_dict()
+    data['subject'] = dumps(data['subject'])
+    data['ep_collections'] = [
+        dumps(dict(ep_coll, episode=dumps(ep_coll['episode'])))
+        for ep_coll in data['ep_collections']]
+    return dumps(data)
+
+
+def time_it(func, items):
+    start = time.time()
+    results = [func(item) for item in items]
+    return time.time() - start, results
+
+
+def main():
+    from bgmcli.api.collection import BangumiAnimeCollection
+    n_colls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with open(os.path.join(_TESTS_PATH, 'sub_html')) as f:
+        sub_html = f.read()
+    with open(os.path.join(_TESTS_PATH, 'ep_html')) as f:
+        ep_html = f.read()
+    sub_coll = BangumiAnimeCollection.from_html(sub_html, ep_html)
+    colls = [sub_coll] * n_colls
+
+    for name, encode in (('nested', legacy_to_json),
+                         ('to_dict', BangumiAnimeCollection.to_json)):
+        encode_time, texts = time_it(encode, colls)
+        decode_time, _ = time_it(BangumiAnimeCollection.from_json, texts)
+        size = sum(len(text.encode('utf-8')) for text in texts)
+        print('{0:8} encode {1:.3f}s  decode {2:.3f}s  size {3} bytes'
+              .format(name, encode_time, decode_time, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Benchmark for start-up time of the CLI backend against a local stub
+server, with and without a snapshot of the library.
+
+Usage:
+    python benchmarks/startup.py [n_subjects] [latency]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from stub_server import StubBangumiServer
+
+
+def time_startup(snapshot_path, alias_cache_path):
+    """Time construction of CLIBackend until the prompt could be shown, and
+    until the refresh in background finished
+    """
+    from bgmcli.cli.backend import CLIBackend
+    start = time.time()
+    backend = CLIBackend('stub@example.com', 'password', snapshot_path,
+                         alias_cache_path)
+    backend.get_user_id()
+    backend.get_completion_list()
+    prompt_time = time.time() - start
+    backend.wait_for_refresh()
+    refresh_time = time.time() - start
+    backend.close()
+    return prompt_time, refresh_time
+
+
+def main():
+    n_subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    server = StubBangumiServer(n_subjects, latency).start()
+    os.environ['http_proxy'] = server.proxy_url
+    os.environ.pop('no_proxy', None)
+    tmp_dir = tempfile.mkdtemp()
+    snapshot_path = os.path.join(tmp_dir, 'snapshot')
+    alias_cache_path = os.path.join(tmp_dir, 'pinyin-cache')
+    try:
+        print 'subjects: {0}, latency: {1:.0f}ms'.format(n_subjects,
+                                                         latency * 1000)
+        for name in ('cold (no snapshot)', 'warm (snapshot)'):
+            prompt_time, refresh_time = time_startup(snapshot_path,
+                                                     alias_cache_path)
+            print ('{0:<20} prompt: {1:8.1f}ms  refreshed: {2:8.1f}ms'
+                   .format(name, prompt_time * 1000, refresh_time * 1000))
+    finally:
+        shutil.rmtree(tmp_dir)
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
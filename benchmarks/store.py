@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Benchmark for opening a snapshot store of a synthetic library and
+loading single collections and summaries from it, against loading a file
+of json lines.
+
+Usage:
+    python benchmarks/store.py [n_subjects]
+"""
+
+import os
+import io
+import sys
+import time
+import shutil
+import random
+import tempfile
+from codec import make_library
+
+
+def main():
+    from bgmcli.api.collection import BangumiAnimeCollection
+    from bgmcli.api.store import SnapshotStore, write_snapshot_store
+    n_subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    colls = make_library(n_subjects)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        json_path = os.path.join(tmp_dir, 'library.jsonl')
+        with io.open(json_path, 'w', encoding='utf-8') as f:
+            for coll in colls:
+                f.write(coll.to_json() + u'\n')
+        store_path = os.path.join(tmp_dir, 'library.bgms')
+        write_snapshot_store(store_path, colls)
+        del colls
+        sub_ids = random.Random(0).sample(
+            [unicode(i) for i in xrange(n_subjects)], 100)
+
+        start = time.time()
+        with io.open(json_path, encoding='utf-8') as f:
+            library = {}
+            for line in f:
+                coll = BangumiAnimeCollection.from_json(line)
+                library[coll.subject.id_] = coll
+        print('json lines: load all {0:.2f}s'.format(time.time() - start))
+
+        start = time.time()
+        store = SnapshotStore(store_path)
+        open_time = time.time() - start
+        start = time.time()
+        for sub_id in sub_ids:
+            store.get(sub_id)
+        get_time = (time.time() - start) / len(sub_ids)
+        start = time.time()
+        sum(summary['n_watched_eps'] for summary in store.iter_summaries())
+        summaries_time = time.time() - start
+        store.close()
+        print('store: open {0:.2f}ms  get {1:.2f}ms  all summaries {2:.2f}s'
+              .format(open_time * 1000, get_time * 1000, summaries_time))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
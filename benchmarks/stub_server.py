@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""A local stub of Bangumi for benchmarks.
+
+The server acts as a HTTP proxy, so that a `BangumiSession` created for
+"bgm.tv" can be pointed to it by setting the "http_proxy" environment
+variable, without touching any code under test. Pages are rendered from the
+fixtures under tests/ with ids and titles substituted, and every request is
+delayed by a configurable latency to mimic a round trip to Bangumi.
+"""
+
+import os
+import re
+import time
+import random
+import threading
+import urlparse
+from collections import Counter
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, 'tests')
+ITEMS_PER_PAGE = 24
+
+_LI_TEMPLATE = u'''<li id="item_{id_}" class="item clearit">
+<div class="inner"><h3>
+<a href="/subject/{id_}" class="l">{ch_title}</a> <small class="grey">{title}</small>
+</h3>
+<p class="collectInfo"><span class="sstars{rating} starsinfo"></span>
+<span class="tip">标签: TV stub</span></p>
+</div></li>'''
+
+
+def _read_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name)) as f:
+        return f.read().decode('utf-8')
+
+
+def make_subjects(n_subjects, first_id=100000, seed=0):
+    """Create (id, title, ch_title) for synthetic subjects, with titles made
+    of random syllables and random common Chinese characters
+
+    Args:
+        n_subjects (int): number of subjects
+        first_id (int): id of the first subject
+        seed (int): seed for the random titles
+
+    Returns:
+        list[tuple]: (sub_id, title, ch_title) for each subject
+    """
+    rand = random.Random(seed)
+    syllables = [c + v for c in 'kstnhmyrwgzdbp' for v in 'aiueo']
+    subjects = []
+    for i in xrange(n_subjects):
+        words = [u''.join(rand.choice(syllables)
+                          for _ in xrange(rand.randint(1, 4)))
+                 for _ in xrange(rand.randint(1, 3))]
+        title = u' '.join(words).capitalize()
+        ch_title = u''.join(unichr(rand.randint(0x4e00, 0x9fa5))
+                            for _ in xrange(rand.randint(2, 8)))
+        subjects.append((str(first_id + i), title, ch_title))
+    return subjects
+
+
+class StubBangumiHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        self.rfile.read(length)
+        self._handle('POST')
+
+    def _handle(self, method):
+        stub = self.server.stub
+        url = urlparse.urlparse(self.path)
+        path, query = url.path, urlparse.parse_qs(url.query)
+        stub.count(path)
+        time.sleep(stub.latency)
+        body = stub.render(method, path, query)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubBangumiServer(object):
+    """Stub Bangumi server for the watching list of one user
+
+    Args:
+        n_subjects (int): number of subjects in the watching list
+        latency (float): seconds to delay every request
+    """
+
+    def __init__(self, n_subjects=100, latency=0.05):
+        self.latency = latency
+        self.subjects = make_subjects(n_subjects)
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._home = _read_fixture('on_hold_page')
+        self._sub_html = _read_fixture('sub_html')
+        self._ep_html = _read_fixture('ep_html')
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0),
+                                            StubBangumiHandler)
+        self._server.stub = self
+        self._thread = None
+        self._expired = False
+
+    @property
+    def proxy_url(self):
+        """str: url to be used as "http_proxy" """
+        return 'http://127.0.0.1:{0}'.format(self._server.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def expire_login(self):
+        """Answer with logged out pages until next login"""
+        self._expired = True
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] += 1
+
+    def render(self, method, path, query):
+        if path == '/FollowTheRabbit':
+            self._expired = False
+            return (u'<html><head><meta charset="utf-8" /></head>'
+                    u'<body>欢迎您回来。现在将转入登录前页面</body></html>')
+        if self._expired:
+            return (u'<html><head><meta charset="utf-8" /></head>'
+                    u'<body><a href="/login">登录</a></body></html>')
+        if path in ('', '/') or path.startswith('/logout/'):
+            return self._home
+        match = re.match(r'^/anime/list/[^/]+/do$', path)
+        if match:
+            page = int(query.get('page', ['1'])[0])
+            return self._render_list(page)
+        match = re.match(r'^/subject/ep/(\d+)/status/\w+$', path)
+        if match and 'ajax' in query:
+            return u'{"status":"ok"}'
+        elif match:
+            # episode ids are made of subject id and 7 digits
+            return self._render_subject(match.group(1)[:-7], False)
+        if (path.startswith('/subject/set/watched/') or
+                re.match(r'^/subject/\d+/(interest/update|remove)$', path)):
+            return self._home
+        match = re.match(r'^/subject/(\d+)(/ep)?$', path)
+        if match:
+            return self._render_subject(match.group(1), bool(match.group(2)))
+        return None
+
+    def _render_list(self, page):
+        n_pages = max(1, -(-len(self.subjects) // ITEMS_PER_PAGE))
+        start = (page - 1) * ITEMS_PER_PAGE
+        items = [_LI_TEMPLATE.format(id_=id_, title=title, ch_title=ch_title,
+                                     rating=(int(id_) % 10) + 1)
+                 for id_, title, ch_title
+                 in self.subjects[start:start + ITEMS_PER_PAGE]]
+        pages = u''.join(u'<a href="?page={0}" class="p">{0}</a>'.format(p)
+                         for p in xrange(1, n_pages + 1) if p != page)
+        multipage = (u'<div id="multipage"><strong class="p_cur">{0}'
+                     u'</strong>{1}</div>'.format(page, pages)
+                     if n_pages > 1 else u'<div id="multipage"></div>')
+        list_html = (u'<ul id="browserItemList">{0}</ul>{1}'
+                     .format(u''.join(items), multipage))
+        return re.sub(u'<ul id="browserItemList".*?<div id="multipage">'
+                      u'</div>', lambda m: list_html, self._home,
+                      flags=re.DOTALL)
+
+    def _render_subject(self, sub_id, eps_page):
+        html = self._ep_html if eps_page else self._sub_html
+        html = html.replace(u'/subject/253"', u'/subject/{0}"'.format(sub_id))
+        # keep episode ids distinct between subjects
+        return re.sub(u'/ep/(\\d+)"', lambda m: u'/ep/{0}{1:07d}"'.format(
+            sub_id, int(m.group(1))), html)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Stress test of one BangumiSession shared by a pool of worker threads,
+against a local stub server. Workers fetch subject collections, change
+episodes and numbers of watched episodes of a few shared subjects, while the
+login expires and is renewed from whichever worker notices it first.
+
+Usage:
+    python benchmarks/thread_safety.py [n_threads] [n_tasks] [latency]
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter
+from multiprocessing.pool import ThreadPool
+
+from stub_server import StubBangumiServer
+
+
+def run_task(session, password, sub_colls, task):
+    """Run one task on a random shared subject collection, logging in again
+    once if the login expired
+    """
+    from bgmcli.api.exception import SessionExpiredError
+    rand = random.Random(task)
+    sub_coll = sub_colls[rand.randrange(len(sub_colls))]
+    for attempt in (0, 1):
+        try:
+            if task % 3 == 0:
+                fetched = session.get_sub_collection(sub_coll.subject.id_)
+                return len(fetched.ep_collections) == 31
+            elif task % 3 == 1:
+                ep_coll = sub_coll.ep_collections[rand.randrange(26)]
+                ep_coll.c_status = rand.choice(['watched', 'queue', 'drop'])
+                return session.set_ep_collection(ep_coll)
+            else:
+                sub_coll.n_watched_eps = rand.randrange(1, 26)
+                return (session.set_n_watched_eps(sub_coll) and
+                        len(sub_coll.ep_collections) == 31)
+        except SessionExpiredError:
+            if attempt:
+                raise
+            session.relogin(password)
+
+
+def main():
+    from bgmcli.api import BangumiSession
+    n_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    n_tasks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+    server = StubBangumiServer(8, latency).start()
+    os.environ['http_proxy'] = server.proxy_url
+    os.environ.pop('no_proxy', None)
+    try:
+        session = BangumiSession('stub@example.com', 'password',
+                                 pool_size=n_threads)
+        sub_colls = [session.get_sub_collection(sub_id)
+                     for sub_id, _, _ in server.subjects]
+        outcomes = Counter()
+        lock = threading.Lock()
+
+        def work(task):
+            if task == n_tasks // 2:
+                server.expire_login()
+            try:
+                result = 'ok' if run_task(session, 'password', sub_colls,
+                                          task) else 'failed'
+            except Exception as e:
+                result = type(e).__name__
+            with lock:
+                outcomes[result] += 1
+
+        pool = ThreadPool(n_threads)
+        start = time.time()
+        try:
+            pool.map(work, xrange(n_tasks))
+        finally:
+            pool.close()
+            pool.join()
+        elapsed = time.time() - start
+        print ('threads: {0}, tasks: {1}, latency: {2:.0f}ms'
+               .format(n_threads, n_tasks, latency * 1000))
+        print '{0:.2f}s, {1:.0f} tasks/s, outcomes: {2}'.format(
+            elapsed, n_tasks / elapsed, dict(outcomes))
+        consistent = all(ep_c.sub_collection is sub_coll
+                         for sub_coll in sub_colls
+                         for ep_c in sub_coll.ep_collections)
+        print 'episode collections consistent: {0}'.format(consistent)
+        return 0 if consistent and outcomes['ok'] == n_tasks else 1
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
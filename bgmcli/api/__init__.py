@@ -1,10 +1,17 @@
 """This is an unofficial API for Bangumi.tv, implemented by sending http
 requests and parsing responses. 
-This Library is NOT supposed to be thread-safe, but it should be fine to use
-multiple threads to retrieve data from Bangumi, as Requests, the underlying
-library for sending HTTP requests is thread-safe.
+A BangumiSession can be shared by many threads, see its docstring for the
+pool_size to create it with. Collection objects are not locked themselves,
+so one should not be changed from several threads without going through the
+session.
 """
 
-__all__ = ['BangumiSession']
+__all__ = ['BangumiSession', 'SessionPool', 'RateLimiter', 'Pipeline',
+           'JSONLinesSink', 'SQLiteSink', 'CallbackSink', 'dump_collections',
+           'iter_load_collections']
  
-from .session import BangumiSession
\ No newline at end of file
+from .session import BangumiSession
+from .sessionpool import SessionPool
+from .ratelimit import RateLimiter
+from .pipeline import Pipeline, JSONLinesSink, SQLiteSink, CallbackSink
+from .jsonlines import dump_collections, iter_load_collections
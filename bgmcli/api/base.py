@@ -1,6 +1,17 @@
 """Library containing base for all element and collection classes
 """
 
+import json
+import pkg_resources
+
+
+CUR_VERSION = pkg_resources.require("bgmcli")[0].version
+
+# version of the layout of dicts produced by to_dict. Version 1 is the
+# layout before to_dict, where nested objects were json text of their own
+SCHEMA_VERSION = 2
+
+
 class BangumiBase(object):
     """Interface for all element and collection classes"""
 
@@ -15,10 +26,54 @@ class BangumiBase(object):
         raise NotImplementedError
 
     @classmethod
-    def from_json(cls, json_text):
-        """Create element object from serialized form"""
+    def from_dict(cls, data):
+        """Create element object from a dict produced by to_dict, or by
+        json.loads of json text of any schema version
+        """
+        raise NotImplementedError
+
+    def to_dict(self):
+        """Transform to a dict of plain values, lists and dicts, with nested
+        objects as dicts
+        """
         raise NotImplementedError
 
+    @classmethod
+    def from_json(cls, json_text):
+        """Create element object from serialized form
+
+        Args:
+            json_text (unicode): json text produced by to_json, of current
+                or older schema versions
+
+        Returns:
+            BangumiBase: created from data in json text
+        """
+        return cls.from_dict(json.loads(json_text))
+
     def to_json(self):
-        """Transform to a serializable from"""
-        raise NotImplementedError
\ No newline at end of file
+        """Transform to a serializable from
+
+        Returns:
+            unicode: json text of to_dict with versions added
+        """
+        data = self.to_dict()
+        data['version'] = CUR_VERSION
+        data['schema'] = SCHEMA_VERSION
+        return json.dumps(data, ensure_ascii=False)
+
+    @staticmethod
+    def _kwargs_from_dict(data):
+        """Get constructor arguments from data of any schema version.
+        Schema 1 uses names of attributes, with leading underscores
+        """
+        return {(key[1:] if key.startswith('_') else key): value
+                for key, value in data.items()
+                if key not in ('version', 'schema')}
+
+    @staticmethod
+    def _nested_dict(value):
+        """Get dict of a nested object, which is json text in schema 1"""
+        if isinstance(value, basestring):
+            return json.loads(value)
+        return value
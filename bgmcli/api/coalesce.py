@@ -0,0 +1,138 @@
+"""Coalescing of writes submitted in quick succession, so that they can be
+sent in fewer requests
+"""
+
+import threading
+from collections import OrderedDict, Counter
+
+
+class WriteCoalescer(object):
+    """Collects writes for the same key, e.g. the same subject, submitted
+    within window seconds of the first pending one, and passes them together
+    to send from a timer thread once the window is over.
+
+    Note:
+        Please pass coalesce_window to BangumiSession to coalesce changes of
+        episode statuses
+
+    Args:
+        window (float): seconds from the first pending write of a key until
+            writes of the key are sent
+        send (callable): called with a key and the list of items submitted
+            for it, in order, returns True if successful
+    """
+
+    def __init__(self, window, send):
+        self._window = window
+        self._send = send
+        self._pending = OrderedDict()
+        self._timers = {}
+        # key -> number of sends in progress
+        self._sending = Counter()
+        self._failures = []
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return sum(len(items) for items in self._pending.values())
+
+    def submit(self, key, item):
+        """Add a write to be sent with other writes of key
+
+        Args:
+            key (hashable): key the write is coalesced by
+            item (object): the write, passed to send
+        """
+        with self._cond:
+            if key in self._pending:
+                self._pending[key].append(item)
+                if key in self._timers:
+                    return
+            else:
+                self._pending[key] = [item]
+            timer = threading.Timer(self._window, self._send_key, (key,))
+            timer.daemon = True
+            self._timers[key] = timer
+            timer.start()
+
+    def requeue(self, key, items):
+        """Put back writes of a failed send, e.g. after the login expired,
+        ahead of writes submitted for key since. They are sent by the next
+        flush, or with writes submitted for key later
+
+        Args:
+            key (hashable): key of the writes
+            items (list): the writes, in order
+        """
+        with self._cond:
+            self._pending[key] = list(items) + self._pending.get(key, [])
+
+    def flush(self, keys=None):
+        """Send pending writes without waiting for their windows, and wait
+        until writes being sent are done
+
+        Args:
+            keys (iterable[hashable]): keys of the writes, None for all keys
+
+        Returns:
+            list[tuple(hashable, list, Exception)]: keys, items and errors
+                of sends that failed since they were last taken, see
+                take_failures
+        """
+        if keys is not None:
+            keys = set(keys)
+        with self._cond:
+            to_send = [key for key in self._pending
+                       if keys is None or key in keys]
+            for key in to_send:
+                timer = self._timers.pop(key, None)
+                if timer is not None:
+                    timer.cancel()
+        for key in to_send:
+            self._send_key(key)
+        with self._cond:
+            while any(n_sending for key, n_sending in self._sending.items()
+                      if keys is None or key in keys):
+                self._cond.wait()
+        return self.take_failures(keys)
+
+    def take_failures(self, keys=None):
+        """Get sends that failed, without sending pending writes. Each
+        failure is only returned once
+
+        Args:
+            keys (iterable[hashable]): keys of the writes, None for all keys
+
+        Returns:
+            list[tuple(hashable, list, Exception)]: keys, items and errors
+                of sends that failed. Error is None if send returned False
+        """
+        if keys is not None:
+            keys = set(keys)
+        with self._cond:
+            failures = [failure for failure in self._failures
+                        if keys is None or failure[0] in keys]
+            self._failures = [failure for failure in self._failures
+                              if not (keys is None or failure[0] in keys)]
+        return failures
+
+    def _send_key(self, key):
+        with self._cond:
+            items = self._pending.pop(key, None)
+            self._timers.pop(key, None)
+            if items is None:
+                # sent by flush meanwhile
+                return
+            self._sending[key] += 1
+        error = None
+        try:
+            succeeded = self._send(key, items)
+        except Exception as e:
+            succeeded, error = False, e
+        with self._cond:
+            self._sending[key] -= 1
+            if not self._sending[key]:
+                del self._sending[key]
+            if not succeeded:
+                self._failures.append((key, items, error))
+            self._cond.notify_all()
@@ -0,0 +1,320 @@
+"""Compact binary form of elements and collections, an alternative to json
+for large snapshots
+
+The binary form encodes the same dicts as to_dict, so objects round-trip
+exactly as they do through json. Every string, including dict keys and
+values repeated across objects like ep_type and c_status, is stored once in
+a string table and referenced by index.
+
+Layout::
+
+    magic "BGMB", format version (1 byte)
+    string table: count, then length and utf-8 bytes of each string
+    objects: count, then for each the index of its class name in the
+        string table and the encoded dict
+
+Counts, lengths, indexes and integers are unsigned LEB128 varints, integers
+zigzag encoded first. Each value is prefixed by a one byte tag.
+"""
+
+import struct
+from .element import BangumiDummySubject, BangumiAnime, BangumiEpisode
+from .collection import BangumiDummySubjectCollection,\
+    BangumiAnimeCollection, BangumiEpisodeCollection
+
+
+MAGIC = b'BGMB'
+FORMAT_VERSION = 1
+
+_CLASSES = {cls.__name__: cls for cls in (
+    BangumiDummySubject, BangumiAnime, BangumiEpisode,
+    BangumiDummySubjectCollection, BangumiAnimeCollection,
+    BangumiEpisodeCollection)}
+
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _LIST, _DICT = range(8)
+_DOUBLE = struct.Struct(b'<d')
+
+
+class StringTable(object):
+    """Strings of an encoded form, assigning each distinct string an index
+    on first use
+    """
+
+    def __init__(self):
+        self.strings = []
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def index(self, string):
+        """Get index of string, adding it to the table if not there yet
+
+        Args:
+            string (str or unicode): the string
+
+        Returns:
+            int: index of string in the table
+        """
+        index = self._indexes.get(string)
+        if index is None:
+            index = self._indexes[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+
+def write_varint(buf, value):
+    """Append an unsigned varint to buf
+
+    Args:
+        buf (bytearray): the buffer
+        value (int): non-negative integer
+    """
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def read_varint(data, pos):
+    """Read an unsigned varint from data at pos
+
+    Args:
+        data (bytearray or buffer): encoded bytes
+        pos (int): position of the varint
+
+    Returns:
+        value, pos: the integer and position after it
+    """
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_value(buf, value, strings):
+    """Append value, made of what to_dict produces, to buf
+
+    Args:
+        buf (bytearray): the buffer
+        value: None, bool, int, float, string, or list or dict of them.
+            Integer dict keys become strings, as they do in json
+        strings (StringTable): table strings are added to
+
+    Raises:
+        TypeError: if value has anything else in it
+        ValueError: if a dict has a key neither string nor integer
+    """
+    value_type = type(value)
+    if value_type is unicode or value_type is str:
+        buf.append(_STR)
+        write_varint(buf, strings.index(value))
+    elif value_type is dict:
+        buf.append(_DICT)
+        write_varint(buf, len(value))
+        for key, item in value.items():
+            key_type = type(key)
+            if key_type is int or key_type is long:
+                key = unicode(key)
+            elif key_type is not unicode and key_type is not str:
+                raise ValueError("Cannot encode dict key {0!r}, keys must be "
+                                 "strings or integers".format(key))
+            write_varint(buf, strings.index(key))
+            encode_value(buf, item, strings)
+    elif value is None:
+        buf.append(_NONE)
+    elif value_type is bool:
+        buf.append(_TRUE if value else _FALSE)
+    elif value_type is int or value_type is long:
+        buf.append(_INT)
+        write_varint(buf, value << 1 if value >= 0 else (~value << 1) | 1)
+    elif value_type is list or value_type is tuple:
+        buf.append(_LIST)
+        write_varint(buf, len(value))
+        for item in value:
+            encode_value(buf, item, strings)
+    elif value_type is float:
+        buf.append(_FLOAT)
+        buf.extend(_DOUBLE.pack(value))
+    else:
+        raise TypeError("Cannot encode {0!r}".format(value))
+
+
+def decode_value(data, pos, strings):
+    """Read a value appended by encode_value from data at pos
+
+    Args:
+        data (bytearray or buffer): encoded bytes
+        pos (int): position of the value
+        strings (list[unicode]): the string table
+
+    Returns:
+        value, pos: the value and position after it
+
+    Raises:
+        ValueError: if data is not valid
+    """
+    tag = data[pos]
+    pos += 1
+    if tag == _STR:
+        index, pos = read_varint(data, pos)
+        return strings[index], pos
+    if tag == _INT:
+        value, pos = read_varint(data, pos)
+        return (value >> 1) ^ -(value & 1), pos
+    if tag == _NONE:
+        return None, pos
+    if tag == _DICT:
+        n_items, pos = read_varint(data, pos)
+        value = {}
+        for _ in xrange(n_items):
+            key, pos = read_varint(data, pos)
+            value[strings[key]], pos = decode_value(data, pos, strings)
+        return value, pos
+    if tag == _LIST:
+        n_items, pos = read_varint(data, pos)
+        value = [None] * n_items
+        for i in xrange(n_items):
+            value[i], pos = decode_value(data, pos, strings)
+        return value, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(bytes(data[pos:pos + 8]))[0], pos + 8
+    raise ValueError("Unknown tag {0} at {1}".format(tag, pos - 1))
+
+
+def encode_strings(buf, strings):
+    """Append the string table to buf
+
+    Args:
+        buf (bytearray): the buffer
+        strings (StringTable): the string table
+    """
+    write_varint(buf, len(strings))
+    for string in strings.strings:
+        encoded = (string.encode('utf-8') if isinstance(string, unicode)
+                   else string)
+        write_varint(buf, len(encoded))
+        buf.extend(encoded)
+
+
+def decode_strings(data, pos):
+    """Read the string table appended by encode_strings
+
+    Args:
+        data (bytearray or buffer): encoded bytes
+        pos (int): position of the table
+
+    Returns:
+        strings, pos: list of unicode and position after the table
+    """
+    n_strings, pos = read_varint(data, pos)
+    strings = []
+    for _ in xrange(n_strings):
+        length, pos = read_varint(data, pos)
+        strings.append(bytes(data[pos:pos + length]).decode('utf-8'))
+        pos += length
+    return strings, pos
+
+
+def get_class(name):
+    """Get element or collection class by name
+
+    Args:
+        name (unicode): class name
+
+    Returns:
+        type: the class
+
+    Raises:
+        ValueError: if name is not a class that can be encoded
+    """
+    try:
+        return _CLASSES[name]
+    except KeyError:
+        raise ValueError("Unknown class {0}".format(name))
+
+
+def dumps(objects):
+    """Encode elements and collections to the binary form
+
+    Args:
+        objects (iterable[BangumiBase]): elements and collections, in any
+            mix of classes
+
+    Returns:
+        str: the binary form
+    """
+    strings = StringTable()
+    body = bytearray()
+    n_objects = 0
+    for obj in objects:
+        write_varint(body, strings.index(type(obj).__name__))
+        encode_value(body, obj.to_dict(), strings)
+        n_objects += 1
+    buf = bytearray(MAGIC)
+    buf.append(FORMAT_VERSION)
+    encode_strings(buf, strings)
+    write_varint(buf, n_objects)
+    buf.extend(body)
+    return bytes(buf)
+
+
+def loads(data):
+    """Decode elements and collections from the binary form
+
+    Args:
+        data (str): the binary form, produced by dumps
+
+    Returns:
+        list[BangumiBase]: the objects, in the order they were encoded
+
+    Raises:
+        ValueError: if data is not the binary form or is corrupted
+    """
+    data = bytearray(data)
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a binary snapshot")
+    if data[len(MAGIC)] != FORMAT_VERSION:
+        raise ValueError("Unsupported format version {0}"
+                         .format(data[len(MAGIC)]))
+    try:
+        strings, pos = decode_strings(data, len(MAGIC) + 1)
+        n_objects, pos = read_varint(data, pos)
+        objects = []
+        for _ in xrange(n_objects):
+            name, pos = read_varint(data, pos)
+            value, pos = decode_value(data, pos, strings)
+            objects.append(get_class(strings[name]).from_dict(value))
+    except IndexError:
+        raise ValueError("Truncated binary snapshot")
+    return objects
+
+
+def dump(objects, fileobj):
+    """Write elements and collections to a file in the binary form
+
+    Args:
+        objects (iterable[BangumiBase]): elements and collections
+        fileobj (file): file opened in binary mode
+    """
+    fileobj.write(dumps(objects))
+
+
+def load(fileobj):
+    """Read elements and collections written by dump
+
+    Args:
+        fileobj (file): file opened in binary mode
+
+    Returns:
+        list[BangumiBase]: the objects
+    """
+    return loads(fileobj.read())
@@ -3,9 +3,7 @@
 """
 import re
 import weakref
-import json
 from functools import wraps
-import pkg_resources
 from bs4 import BeautifulSoup
 from .element import BangumiEpisode, BangumiAnime, BangumiSubjectFactory,\
     BangumiDummySubject
@@ -16,10 +14,6 @@ from .base import BangumiBase
 from _pyio import __metaclass__
 
 
-
-CUR_VERSION = pkg_resources.require("bgmcli")[0].version
-
-
 def require_session(method):
     """Decorator function that raises AttributeError if session is not set"""
     @wraps(method)
@@ -33,6 +27,9 @@ def require_session(method):
 
 class BangumiCollection(BangumiBase):
     """Mixin for collection behaviors"""
+
+    # fields sent by sync_collection
+    _SYNCED_FIELDS = ()
     
     @property
     def session(self):
@@ -46,14 +43,34 @@ class BangumiCollection(BangumiBase):
     @session.setter
     def session(self, session):
         self._session = session
-        if isinstance(self, BangumiAnimeCollection) and self.ep_collections:
-            for ep_c in self.ep_collections:
-                ep_c._session = session
+        if self._dirty and session is not None:
+            session._add_dirty(self)
+        if isinstance(self, BangumiAnimeCollection) and self._ep_collections:
+            for ep_c in self._ep_collections:
+                ep_c.session = session
+
+    @property
+    def dirty_fields(self):
+        """frozenset[str]: names of fields changed through setters since the
+        collection was loaded or last sync'ed
+        """
+        return frozenset(self._dirty)
+
+    @property
+    def is_dirty(self):
+        """bool: True if any field was changed and not sync'ed yet"""
+        return bool(self._dirty)
     
     @require_session
-    def sync_collection(self):
+    def sync_collection(self, force=False):
         """Update Bangumi with current collection data. n_watched_eps is not
-        sync'ed for BangumiAnimeCollection
+        sync'ed for BangumiAnimeCollection. Nothing is sent if no field was
+        changed since the collection was loaded or last sync'ed, unless
+        force is set, e.g. for a collection built with from_dict or
+        from_json, whose fields are not dirty
+        
+        Args:
+            force (bool): send the collection even if no field is dirty
         
         Returns:
             bool: True if successful
@@ -61,6 +78,8 @@ class BangumiCollection(BangumiBase):
         Raises:
             AttributeError: if session is not set
         """
+        if not force and not self._dirty.intersection(self._SYNCED_FIELDS):
+            return True
         return self._session.set_collection(self)
 
     @require_session
@@ -84,7 +103,8 @@ class BangumiCollection(BangumiBase):
             return False
         else:
             for key, value in self.__dict__.items():
-                if key in ['_session', '_ep_collections', '_sub_collection']:
+                if key in ['_session', '_ep_collections', '_sub_collection',
+                           '_dirty']:
                     continue
                 if value != getattr(other, key):
                     return False
@@ -93,6 +113,23 @@ class BangumiCollection(BangumiBase):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def _set_field(self, name, value):
+        """Set value of field name, marking it dirty if changed"""
+        if getattr(self, '_' + name) != value:
+            setattr(self, '_' + name, value)
+            self._dirty.add(name)
+            if self._session is not None:
+                self._session._add_dirty(self)
+
+    def _mark_clean(self, *fields):
+        """Mark fields as sync'ed, all fields if none is given"""
+        if fields:
+            self._dirty.difference_update(fields)
+        else:
+            self._dirty.clear()
+        if not self._dirty and self._session is not None:
+            self._session._discard_dirty(self)
+
 
 class SubjectCollectionMeta(type):
     """Metaclass for BangumiSubjectCollection. Helps to register subclasses in 
@@ -151,6 +188,7 @@ class BangumiSubjectCollection(BangumiCollection):
     _VALID_C_STATUS = tuple(range(1, 6))
     __metaclass__ = SubjectCollectionMeta
     _SUB_TYPE = None
+    _SYNCED_FIELDS = ('c_status', 'rating', 'tags', 'comment')
     
     def __init__(self, subject, c_status=None, rating=None, tags=None,
                  comment=None):
@@ -160,6 +198,7 @@ class BangumiSubjectCollection(BangumiCollection):
         self._tags = tags if tags else []
         self._comment = comment if comment else u""
         self._session = None
+        self._dirty = set()
         
     @classmethod
     def from_html(cls, sub_html, ep_html):
@@ -230,7 +269,7 @@ class BangumiSubjectCollection(BangumiCollection):
     @c_status.setter
     def c_status(self, value):
         if value in self._VALID_C_STATUS:
-            self._c_status = value
+            self._set_field('c_status', value)
         else:
             raise ValueError("Invalid value provided")
 
@@ -246,18 +285,19 @@ class BangumiSubjectCollection(BangumiCollection):
     @rating.setter
     def rating(self, value):
         if value is None:
-            self._rating = value
+            self._set_field('rating', value)
         else:
             value = int(value)
             if value >= 1 and value <= 10:
-                self._rating = value
+                self._set_field('rating', value)
             else:
                 raise ValueError("Value must be between 1 to 10, got {0}"
                                  .format(value))
     
     @property
     def tags(self):
-        """list[unicode]: a list of tags for this collection
+        """list[unicode]: a list of tags for this collection. Changes made to
+        the list in place are not tracked for sync, please set a new list
         
         setter will check datatype and raise TypeError
         """
@@ -273,7 +313,7 @@ class BangumiSubjectCollection(BangumiCollection):
             if not isinstance(tag, unicode):
                 raise TypeError("each tag must be unicode strings, got {0}"
                                 .format(type(tag)))
-        self._tags = value         
+        self._set_field('tags', value)
         
     @property
     def comment(self):
@@ -289,7 +329,7 @@ class BangumiSubjectCollection(BangumiCollection):
         if not isinstance(value, unicode):
             raise TypeError("comment must be a unicode strings, got {0}"
                             .format(type(value)))
-        self._comment = value
+        self._set_field('comment', value)
 
 
 class BangumiDummySubjectCollection(BangumiSubjectCollection):
@@ -324,7 +364,35 @@ class BangumiDummySubjectCollection(BangumiSubjectCollection):
         comment = (comment_soup.find(class_='text').text if comment_soup
                    else None)
         return cls(subject, c_status, rating, tags, comment)
-    
+
+    @classmethod
+    def from_dict(cls, data):
+        """Convert back from dict
+
+        Args:
+            data (dict): dict produced by to_dict
+
+        Returns:
+            BangumiDummySubjectCollection: created from data
+        """
+        kwargs = cls._kwargs_from_dict(data)
+        kwargs['subject'] = BangumiDummySubject.from_dict(
+            cls._nested_dict(kwargs['subject']))
+        return cls(**kwargs)
+
+    def to_dict(self):
+        """Convert to dict
+
+        Note:
+            session is dropped
+
+        Returns:
+            dict: converted dict
+        """
+        return {'subject': self._subject.to_dict(),
+                'c_status': self._c_status, 'rating': self._rating,
+                'tags': self._tags, 'comment': self._comment}
+
     @require_session
     def to_regular_collection(self):
         new_coll = self.session.get_sub_collection(self.subject.id_)
@@ -378,7 +446,9 @@ class BangumiAnimeCollection(BangumiSubjectCollection):
         Args:
             subject (BangumiAnime): subject belonging to the collection
             sub_soup (BeautifulSoup): parsed html for the subject main page
-            ep_soup (BeautifulSoup): parsed html for the episodes page
+            ep_soup (BeautifulSoup): parsed html for the episodes page, None
+                to leave episode collections to be loaded with the session
+                on first access
             
         Returns:
             BangumiAnimeCollection: subject collection with provided data
@@ -402,55 +472,70 @@ class BangumiAnimeCollection(BangumiSubjectCollection):
             tags = collect_form.find(id='tags')['value'].strip().split(' ')
             comment = collect_form.find(id='comment').text
             n_watched_eps = get_n_watched_eps_from_soup(sub_soup)
+            if ep_soup is None:
+                sub_coll = cls(subject, status, rating, tags, comment,
+                               n_watched_eps)
+                sub_coll._ep_collections = None
+                return sub_coll
             ep_collections = (BangumiEpisodeCollection
                               .ep_colls_for_sub_from_soup(subject, ep_soup))
             return cls(subject, status, rating, tags, comment, n_watched_eps,
                        ep_collections)
 
     @classmethod
-    def from_json(cls, json_text):
-        """Convert back from json
+    def from_dict(cls, data):
+        """Convert back from dict
         
         Args:
-            json_text (unicode): json text to convert from
+            data (dict): dict produced by to_dict
             
         Returns:
-            BangumiAnimeCollection: created from data in json text
-        """
-        kwargs = json.loads(json_text)
-        kwargs.pop('version', (0, 0, 1))
-        kwargs = {(key[1:] if key.startswith('_') else key): value
-                  for key, value in kwargs.items()}
-        kwargs['ep_collections'] = [BangumiEpisodeCollection.from_json(j_text)
-                                    for j_text in kwargs['ep_collections']]
-        kwargs['subject'] = BangumiAnime.from_json(kwargs['subject'])
+            BangumiAnimeCollection: created from data
+        """
+        kwargs = cls._kwargs_from_dict(data)
+        kwargs['subject'] = BangumiAnime.from_dict(
+            cls._nested_dict(kwargs['subject']))
+        if kwargs['ep_collections'] is None:
+            sub_coll = cls(**kwargs)
+            sub_coll._ep_collections = None
+            return sub_coll
+        kwargs['ep_collections'] = [
+            BangumiEpisodeCollection.from_dict(cls._nested_dict(ep_coll))
+            for ep_coll in kwargs['ep_collections']]
         sub_coll = cls(**kwargs)
-        sub_coll.subject._eps = [ep_coll.episode for ep_coll
-                                 in sub_coll.ep_collections]
+        # episodes are only kept in episode collections, see to_dict
+        sub_coll.subject.eps = [ep_coll.episode for ep_coll
+                                in sub_coll.ep_collections]
         for ep_coll in sub_coll.ep_collections:
             ep_coll.sub_collection = sub_coll
         for ep in sub_coll.subject.eps:
             ep.subject = sub_coll.subject
         return sub_coll
     
-    def to_json(self):
-        """Convert to json
+    def to_dict(self):
+        """Convert to dict
+
+        Note:
+            episode collections not loaded yet are not loaded for this, and
+            are loaded on first access after converting back and setting
+            session
         
         Returns:
-            unicode: converted json text
-        """
-        kwargs = self.__dict__.copy()
-        kwargs['version'] = CUR_VERSION
-        kwargs.pop('_session')
-        kwargs['_ep_collections'] = [ep_coll.to_json() for ep_coll in
-                                     kwargs['_ep_collections']]
-        # temporarily drop subject._eps to avoid duplicating information,
-        # since _ep_collections already contains data for episodes
-        sub, eps = kwargs['_subject'], kwargs['_subject']._eps
-        kwargs['_subject']._eps = []
-        kwargs['_subject'] = kwargs['_subject'].to_json()
-        sub._eps = eps
-        return json.dumps(kwargs, ensure_ascii=False)
+            dict: converted dict
+        """
+        if self._ep_collections is None:
+            subject = self._subject.to_dict()
+            ep_collections = None
+        else:
+            # episodes are contained in episode collections already
+            subject = self._subject.to_dict(with_eps=False)
+            ep_collections = [ep_coll.to_dict()
+                              for ep_coll in self._ep_collections]
+        return {'subject': subject, 'c_status': self._c_status,
+                'rating': self._rating, 'tags': self._tags,
+                'comment': self._comment,
+                'n_watched_eps': self._n_watched_eps,
+                'ep_collections': ep_collections}
 
     @property
     def n_watched_eps(self):
@@ -468,15 +553,21 @@ class BangumiAnimeCollection(BangumiSubjectCollection):
                          value > len(self.subject.eps)):
             raise ValueError("n_watched_eps must be non-negative and less " + 
                              "than n_eps, got {0}".format(value))
-        self._n_watched_eps = value
+        self._set_field('n_watched_eps', value)
 
     @property
     def ep_collections(self):
         """tuple[BangumiEpisodeCollection]: episode collections belonging to
-        this subject collection
+        this subject collection, loaded with the session on first access if
+        not loaded yet
         
         setter will check type of each entry and raise TypeError if incorrect
+
+        Raises:
+            AttributeError: if they are not loaded and session is not set
         """
+        if self._ep_collections is None:
+            self._load_ep_collections()
         return tuple(self._ep_collections)
     
     @ep_collections.setter
@@ -488,6 +579,11 @@ class BangumiAnimeCollection(BangumiSubjectCollection):
                                 .format(type(ep_coll)))
         self._ep_collections = value
 
+    @property
+    def ep_collections_loaded(self):
+        """bool: True if episode collections are loaded"""
+        return self._ep_collections is not None
+
     @require_session
     def watched_up_to_with_sync(self, ep_info):
         """Set watched episodes up to the one specified, sync immediately
@@ -573,14 +669,33 @@ class BangumiAnimeCollection(BangumiSubjectCollection):
             return search_result[0]
     
     @require_session
-    def sync_n_watched_eps(self):
-        """Sync n_watched_eps, as sync_collection won't do this
+    def sync_n_watched_eps(self, force=False):
+        """Sync n_watched_eps, as sync_collection won't do this. Nothing is
+        sent if it was not changed since loaded or last sync'ed, unless
+        force is set
+        
+        Args:
+            force (bool): send n_watched_eps even if it is not dirty
         
         Returns:
             bool: True if successful
         """
+        if not force and 'n_watched_eps' not in self._dirty:
+            return True
         return self._session.set_n_watched_eps(self)
 
+    @require_session
+    def _load_ep_collections(self):
+        with self._session._lock_object(self):
+            if self._ep_collections is not None:
+                # loaded by another thread meanwhile
+                return
+            ep_colls = self._session._get_ep_colls_for_sub_coll(self)
+            for ep_coll in ep_colls:
+                ep_coll.sub_collection = self
+                ep_coll._session = self._session
+            self._ep_collections = ep_colls
+
 
 class BangumiEpisodeCollection(BangumiCollection):
     """Class representing a episode collection
@@ -596,6 +711,7 @@ class BangumiEpisodeCollection(BangumiCollection):
     """
 
     _VALID_C_STATUS = ('watched', 'watched_up_to', 'queue', 'drop')
+    _SYNCED_FIELDS = ('c_status',)
 
     def __init__(self, episode, c_status=None, sub_collection=None):
         self._episode = episode
@@ -603,6 +719,7 @@ class BangumiEpisodeCollection(BangumiCollection):
         self._sub_collection = (weakref.ref(sub_collection)
                                 if sub_collection else None)
         self._session = None
+        self._dirty = set()
 
     @classmethod
     def from_html(cls, ep_id, html):
@@ -705,52 +822,66 @@ class BangumiEpisodeCollection(BangumiCollection):
         Returns:
             list[BangumiEpisodeCollection]: for all episodes in that subject
         """
+        return cls._ep_colls_for_eps_from_soup(subject.eps, soup)
+
+    @classmethod
+    def ep_colls_from_soup(cls, soup):
+        """Create a list of BangumiEpisodeCollection object, with episodes
+        not belonging to any subject object, from parsed html of the subject
+        episodes page. This is for when only episodes and their statuses are
+        needed
+        
+        Args:
+            soup (BeautifulSoup): the parsed html for the episodes page
+            
+        Returns:
+            list[BangumiEpisodeCollection]: for all episodes in that subject
+        """
+        return cls._ep_colls_for_eps_from_soup(
+            BangumiEpisode.eps_from_soup(soup), soup)
+
+    @classmethod
+    def _ep_colls_for_eps_from_soup(cls, eps, soup):
         ep_collections = []
         coll_infos = (soup.find(class_='line_list')
                       .find_all(class_=re.compile('^status*')))
-        if len(coll_infos) == len(subject.eps):
-            for ep, info in zip(subject.eps, coll_infos):
+        if len(coll_infos) == len(eps):
+            for ep, info in zip(eps, coll_infos):
                 c_status = info['class'][0][6:].lower()
                 ep_collection = cls(ep, c_status)
                 ep_collections.append(ep_collection)
         else:
-            for ep in subject.eps:
+            for ep in eps:
                 ep_collection = cls.from_soup_with_ep(ep, soup)
                 ep_collections.append(ep_collection)
         return ep_collections
 
     @classmethod
-    def from_json(cls, json_text):
-        """Convert back from json
+    def from_dict(cls, data):
+        """Convert back from dict
         
         Args:
-            json_text (unicode): json text to convert from
+            data (dict): dict produced by to_dict
             
         Returns:
-            BangumiEpisodeCollection: created from data in json text
+            BangumiEpisodeCollection: created from data
         """
-        kwargs = json.loads(json_text)
-        kwargs.pop('version', (0, 0, 1))
-        kwargs = {(key[1:] if key.startswith('_') else key): value
-                  for key, value in kwargs.items()}
-        kwargs['episode'] = BangumiEpisode.from_json(kwargs['episode'])
+        kwargs = cls._kwargs_from_dict(data)
+        kwargs['episode'] = BangumiEpisode.from_dict(
+            cls._nested_dict(kwargs['episode']))
         return cls(**kwargs)
     
-    def to_json(self):
-        """Convert to json
+    def to_dict(self):
+        """Convert to dict
         
         Note:
             sub_collection and session are dropped
             
         Returns:
-            unicode: converted json text
-        """
-        kwargs = self.__dict__.copy()
-        kwargs['version'] = CUR_VERSION
-        kwargs.pop('_sub_collection')
-        kwargs.pop('_session')
-        kwargs['_episode'] = kwargs['_episode'].to_json()
-        return json.dumps(kwargs, ensure_ascii=False)
+            dict: converted dict
+        """
+        return {'episode': self._episode.to_dict(),
+                'c_status': self._c_status}
     
     @property
     def episode(self):
@@ -772,7 +903,7 @@ class BangumiEpisodeCollection(BangumiCollection):
         if value not in self._VALID_C_STATUS:
             raise ValueError("Invalid value provided: {0}".format(value))
         else:
-            self._c_status = value
+            self._set_field('c_status', value)
             
     @property
     def sub_collection(self):
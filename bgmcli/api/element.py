@@ -3,16 +3,14 @@
 """
 import re
 import weakref
-import json
+import datetime
 from _pyio import __metaclass__
-import pkg_resources
 from bs4 import BeautifulSoup
 from .base import BangumiBase
 from .utils import get_subject_type_from_soup
 
 
 __all__ = ['BangumiAnime', 'BangumiEpisode']
-CUR_VERSION = pkg_resources.require("bgmcli")[0].version
 
 
 class BangumiElement(BangumiBase):
@@ -54,14 +52,32 @@ class BangumiElement(BangumiBase):
     def to_collection(self, session):
         """Transform to collection of same type."""
         raise NotImplementedError
+
+    def refresh_from(self, other):
+        """Update data in place with other, a newer object of the same
+        element, e.g. fetched again. other_info is kept
+        
+        Args:
+            other (BangumiElement): element of the same class and id
+            
+        Raises:
+            ValueError: if other is not the same element
+        """
+        if not isinstance(other, self.__class__) or other.id_ != self.id_:
+            raise ValueError("Can only refresh from the same element")
+        for key, value in other.__dict__.items():
+            if key != 'other_info':
+                self.__dict__[key] = value
     
     def __eq__(self, other):
         """Excludes attribute BangumiAnime.eps and BangumiEpisode.subject"""
+        if self is other:
+            return True
         if not isinstance(other, self.__class__):
             return False
         else:
             for key, value in self.__dict__.items():
-                if key in ['_eps', '_subject']:
+                if key in ['_eps', '_eps_loader', '_info', '_subject']:
                     continue
                 if value != getattr(other, key):
                     return False
@@ -168,7 +184,32 @@ class BangumiDummySubject(BangumiSubject):
             title = ch_title
             ch_title = None
         return cls(sub_id, title, ch_title)
- 
+
+    @classmethod
+    def from_dict(cls, data):
+        """Convert back from dict
+
+        Args:
+            data (dict): dict produced by to_dict
+
+        Returns:
+            BangumiDummySubject: created from data
+        """
+        kwargs = cls._kwargs_from_dict(data)
+        other_info = kwargs.pop('other_info', {})
+        subject = cls(**kwargs)
+        subject.other_info = other_info
+        return subject
+
+    def to_dict(self):
+        """Convert to dict
+
+        Returns:
+            dict: converted dict
+        """
+        return {'id_': self._id_, 'title': self._title,
+                'ch_title': self._ch_title, 'other_info': self.other_info}
+
 
 class BangumiAnime(BangumiSubject):
     """Class representing an anime subject
@@ -178,18 +219,26 @@ class BangumiAnime(BangumiSubject):
         title (unicode): official title of the anime subject. 
         ch_title (unicode): title of the subject in Chinese or other language.
         eps (list[BangumiEpisode]): episodes belonging to this anime
+        info_box (unicode): text of the info box on the subject main page,
+            one "key: value" per line
     
     Attributes:
         other_info (dict): key-values for other info
     """
     
     _SUB_TYPE = 'anime'
+    _AIR_DATE_KEYS = (u'放送开始', u'上映年度', u'发售日')
+    _STUDIO_KEY = u'动画制作'
 
     def __init__(self, id_, title=None, ch_title=None, n_eps=None,
-                 eps=None):
+                 eps=None, info_box=None):
         super(BangumiAnime, self).__init__(id_, title, ch_title)
         self._n_eps = n_eps
         self._eps = list(eps) if eps else []
+        self._eps_loader = None
+        self._info_box = info_box
+        # parsed from _info_box on first access
+        self._info = None
         for ep in self.eps:
             ep.subject = self
 
@@ -200,7 +249,8 @@ class BangumiAnime(BangumiSubject):
         
         Args:
             sub_html (unicode): parsed html for the subject main page
-            ep_html (unicode): parsed html for the subject's episodes page
+            ep_html (unicode): parsed html for the subject's episodes page,
+                None to leave episodes to be loaded later, see set_eps_loader
             
         Returns:
             BangumiAnime: with data from parsed html
@@ -208,44 +258,85 @@ class BangumiAnime(BangumiSubject):
         sub_id = sub_soup.find(class_='nameSingle').a['href'].split('/')[-1]
         sub_title = sub_soup.find(class_='nameSingle').a.text
         sub_ch_title = sub_soup.find(class_='nameSingle').a['title']
-        sub_n_eps = cls._get_n_eps(sub_soup)
+        info_box = cls._get_info_box_text(sub_soup)
+        sub_n_eps = cls._get_n_eps(info_box)
+        if ep_soup is None:
+            subject = cls(sub_id, sub_title, sub_ch_title, sub_n_eps,
+                          info_box=info_box)
+            subject._eps = None
+            return subject
         sub_eps = BangumiEpisode.eps_from_soup(ep_soup)
-        subject = cls(sub_id, sub_title, sub_ch_title, sub_n_eps, sub_eps)
+        subject = cls(sub_id, sub_title, sub_ch_title, sub_n_eps, sub_eps,
+                      info_box)
         return subject
     
     @classmethod
-    def from_json(cls, json_text):
-        """Convert back from json
+    def from_dict(cls, data):
+        """Convert back from dict
         
         Args:
-            json_text (unicode): json text to convert from
+            data (dict): dict produced by to_dict
             
         Returns:
-            BangumiAnime: created from data in json text
+            BangumiAnime: created from data
         """
-        kwargs = json.loads(json_text)
-        kwargs.pop('version', (0, 0, 1))
-        other_info = kwargs.pop('other_info')
-        kwargs = {(key[1:] if key.startswith('_') else key): value
-                  for key, value in kwargs.items()}
-        kwargs['eps'] = [BangumiEpisode.from_json(j_text)
-                         for j_text in kwargs['eps']]
-        subject = BangumiAnime(**kwargs)
+        kwargs = cls._kwargs_from_dict(data)
+        other_info = kwargs.pop('other_info', {})
+        eps = kwargs.pop('eps')
+        if eps is None:
+            subject = cls(**kwargs)
+            subject._eps = None
+        else:
+            kwargs['eps'] = [BangumiEpisode.from_dict(cls._nested_dict(ep))
+                             for ep in eps]
+            subject = cls(**kwargs)
         subject.other_info = other_info
-        for ep in subject._eps:
-            ep.subject = subject
         return subject
     
-    def to_json(self):
-        """Convert to json
+    def to_dict(self, with_eps=True):
+        """Convert to dict
+
+        Note:
+            episodes not loaded yet are not loaded for this, and have to be
+            loaded again with set_eps_loader after converting back
+
+        Args:
+            with_eps (bool): include episodes. False leaves an empty list,
+                for when episodes are kept elsewhere, e.g. in episode
+                collections
         
         Returns:
-            unicode: converted json text
+            dict: converted dict
+        """
+        if self._eps is None:
+            eps = None
+        elif with_eps:
+            eps = [ep.to_dict() for ep in self._eps]
+        else:
+            eps = []
+        return {'id_': self._id_, 'title': self._title,
+                'ch_title': self._ch_title, 'n_eps': self._n_eps,
+                'info_box': self._info_box, 'other_info': self.other_info,
+                'eps': eps}
+
+    def refresh_from(self, other):
+        """Update data in place with other, a newer object of the same
+        subject, e.g. fetched again. other_info is kept, and so are
+        episodes if other has not loaded them
+        
+        Args:
+            other (BangumiAnime): subject of the same id
+            
+        Raises:
+            ValueError: if other is not the same subject
         """
-        kwargs = self.__dict__.copy()
-        kwargs['_eps'] = [ep.to_json() for ep in kwargs['_eps']]
-        kwargs['version'] = CUR_VERSION
-        return json.dumps(kwargs, ensure_ascii=False)
+        eps = self._eps
+        super(BangumiAnime, self).refresh_from(other)
+        if other._eps is None and eps is not None:
+            self._eps = eps
+            self._eps_loader = None
+        for ep in self._eps or []:
+            ep.subject = self
 
     def to_collection(self, session):
         """Convert to a BangumiSubjectCollection
@@ -278,10 +369,21 @@ class BangumiAnime(BangumiSubject):
         
     @property
     def eps(self):
-        """tuple[BangumiEpisode]: episodes belong to this subject
+        """tuple[BangumiEpisode]: episodes belong to this subject, loaded on
+        first access if not loaded yet, see set_eps_loader
         
         setter will check type of each entry and raise TypeError if incorrect
+
+        Raises:
+            AttributeError: if episodes are not loaded and there is no
+                loader to load them
         """
+        if self._eps is None:
+            if self._eps_loader is None:
+                raise AttributeError("eps not loaded while no loader is set")
+            self.eps = self._eps_loader()
+            for ep in self._eps:
+                ep.subject = self
         return tuple(self._eps)
     
     @eps.setter
@@ -292,21 +394,79 @@ class BangumiAnime(BangumiSubject):
                 raise TypeError("Each entry must be BangumiEpisode, got {0}"
                                 .format(type(ep)))
         self._eps = value
+        self._eps_loader = None
+
+    @property
+    def eps_loaded(self):
+        """bool: True if episodes are loaded"""
+        return self._eps is not None
+
+    def set_eps_loader(self, loader):
+        """Load episodes with loader on first access of eps if they are not
+        loaded yet, so that the episodes page is only fetched when needed
+        
+        Args:
+            loader (callable): takes no argument and returns
+                list[BangumiEpisode], e.g. fetching them with a session
+        """
+        if self._eps is None:
+            self._eps_loader = loader
+
+    @property
+    def info_box(self):
+        """dict: information in the info box on the subject main page, e.g.
+        staff, mapping each key to a list of unicode values. Parsed on first
+        access. NOT supposed to be modified
+        """
+        if self._info is None:
+            self._info = self._parse_info_box(self._info_box or u'')
+        return self._info
+
+    @property
+    def air_date(self):
+        """datetime.date or None: date the anime started airing or was
+        released, None if unknown
+        """
+        for key in self._AIR_DATE_KEYS:
+            for value in self.info_box.get(key, []):
+                match = re.match(u'([0-9]{4})(?:年|-)([0-9]{1,2})(?:月|-)'
+                                 u'([0-9]{1,2})', value)
+                if match:
+                    try:
+                        return datetime.date(*map(int, match.groups()))
+                    except ValueError:
+                        pass
+        return None
+
+    @property
+    def studio(self):
+        """unicode or None: animation studio, None if unknown"""
+        studios = self.info_box.get(self._STUDIO_KEY)
+        return studios[0] if studios else None
 
     @staticmethod
-    def _get_n_eps(soup):
-        info = soup.find(id='infobox').text
-        try:
-            return int(re.search(u'话数: ([0-9]*?)\n', info).group(1))
-        except:
+    def _get_info_box_text(soup):
+        info_box = soup.find(id='infobox')
+        if info_box is None:
             return None
+        lines = (line.strip() for line in info_box.text.split('\n'))
+        return u'\n'.join(line for line in lines if line)
+
+    @staticmethod
+    def _get_n_eps(info_box):
+        match = re.search(u'^话数: ([0-9]+)$', info_box or u'', re.M)
+        return int(match.group(1)) if match else None
         
     @staticmethod
-    def _parse_info_box(soup):
-        info = soup.find(id='infobox').text
-        parsed_dict = dict([line.strip().split(': ')
-                            for line in info.split('\n')])
-        return parsed_dict
+    def _parse_info_box(info_box):
+        parsed = {}
+        for line in info_box.split('\n'):
+            key, sep, value = line.partition(': ')
+            if not sep:
+                continue
+            parsed.setdefault(key, []).extend(
+                v.strip() for v in value.split(u'、') if v.strip())
+        return parsed
 
 
 class BangumiEpisode(BangumiElement):
@@ -414,37 +574,34 @@ class BangumiEpisode(BangumiElement):
         return ep
     
     @classmethod
-    def from_json(cls, json_text):
-        """Convert from json
+    def from_dict(cls, data):
+        """Convert from dict
         
         Note:
-            subject is dropped converting to json, so won't be included here
+            subject is dropped converting to dict, so won't be included here
             
         Returns:
-            BangumiEpisode: created from data in json text
+            BangumiEpisode: created from data
         """
-        kwargs = json.loads(json_text)
-        kwargs.pop('version', (0, 0, 1))
-        other_info = kwargs.pop('other_info')
-        kwargs = {(key[1:] if key.startswith('_') else key): value
-                  for key, value in kwargs.items()}
+        kwargs = cls._kwargs_from_dict(data)
+        other_info = kwargs.pop('other_info', {})
         ep = cls(**kwargs)
         ep.other_info = other_info
         return ep
     
-    def to_json(self):
-        """Convert to json
+    def to_dict(self):
+        """Convert to dict
 
         Note:
             subject is dropped if when converting episode
             
         Returns:
-            unicode: result of converting to json
+            dict: result of converting to dict
         """
-        kwargs = self.__dict__.copy()
-        kwargs['version'] = CUR_VERSION
-        kwargs.pop('_subject')
-        return json.dumps(kwargs, ensure_ascii=False)
+        return {'id_': self._id_, 'ep_num': self._ep_num,
+                'ep_type': self._ep_type, 'status': self._status,
+                'title': self._title, 'ch_title': self._ch_title,
+                'other_info': self.other_info}
     
     @property
     def ep_num(self):
@@ -494,6 +651,22 @@ class BangumiEpisode(BangumiElement):
                             .format(type(value)))
         self._subject = weakref.ref(value)
             
+    def refresh_from(self, other):
+        """Update data in place with other, a newer object of the same
+        episode, e.g. fetched again. other_info and subject are kept, unless
+        it does not belong to any subject yet
+        
+        Args:
+            other (BangumiEpisode): episode of the same id
+            
+        Raises:
+            ValueError: if other is not the same episode
+        """
+        subject = self.subject
+        super(BangumiEpisode, self).refresh_from(other)
+        if subject is not None:
+            self.subject = subject
+
     def to_collection(self, session):
         """Convert to a BangumiEpisodeCollection
         
@@ -15,6 +15,13 @@ class NotLoggedInError(BangumiAPIException):
     pass
 
 
+class SessionExpiredError(NotLoggedInError):
+    """Exception raised when a page responded shows that the login of the
+    session has expired
+    """
+    pass
+
+
 class RequestFailedError(BangumiAPIException):
     """Exception raised when failed to get necessary data"""
 
@@ -0,0 +1,111 @@
+"""Identity map that keeps one object per subject and episode for a session
+"""
+
+import threading
+import weakref
+
+
+class IdentityMap(object):
+    """Maps subject and episode ids to the objects created for them, so that
+    fetching the same subject or episode again updates the object already
+    held by client code instead of creating a duplicate.
+
+    Objects are held by weak references, so memory stays proportional to
+    subjects and episodes still in use.
+
+    Note:
+        Please pass identity_map=True to BangumiSession to use it
+    """
+
+    def __init__(self):
+        self._objects = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def get_subject(self, sub_id):
+        """Get the subject object for sub_id if there is one in use
+
+        Args:
+            sub_id (str): subject id
+
+        Returns:
+            BangumiAnime or None: the subject, None if not in use
+        """
+        return self._objects.get(('subject', sub_id))
+
+    def get_episode(self, ep_id):
+        """Get the episode object for ep_id if there is one in use
+
+        Args:
+            ep_id (str): episode id
+
+        Returns:
+            BangumiEpisode or None: the episode, None if not in use
+        """
+        return self._objects.get(('episode', ep_id))
+
+    def intern_subject(self, subject):
+        """Get the shared object for subject, updated with data in subject.
+        Episodes of subject are interned as well if loaded
+
+        Args:
+            subject (BangumiAnime): subject just created
+
+        Returns:
+            BangumiAnime: subject itself if it's the first for its id, or
+                the shared one updated in place
+        """
+        with self._lock:
+            if subject.eps_loaded:
+                eps = [self.intern_episode(ep) for ep in subject.eps]
+                subject.eps = eps
+                for ep in eps:
+                    ep.subject = subject
+            return self._intern(('subject', subject.id_), subject)
+
+    def intern_episode(self, episode):
+        """Get the shared object for episode, updated with data in episode
+
+        Args:
+            episode (BangumiEpisode): episode just created
+
+        Returns:
+            BangumiEpisode: episode itself if it's the first for its id, or
+                the shared one updated in place
+        """
+        with self._lock:
+            return self._intern(('episode', episode.id_), episode)
+
+    def intern_sub_collection(self, sub_coll):
+        """Replace the subject of sub_coll, and episodes of its episode
+        collections if loaded, with shared objects
+
+        Args:
+            sub_coll (BangumiSubjectCollection): subject collection just
+                created
+        """
+        with self._lock:
+            sub_coll._subject = self.intern_subject(sub_coll.subject)
+            if getattr(sub_coll, 'ep_collections_loaded', False):
+                for ep_coll in sub_coll.ep_collections:
+                    self.intern_ep_collection(ep_coll)
+
+    def intern_ep_collection(self, ep_coll):
+        """Replace the episode of ep_coll with the shared object
+
+        Args:
+            ep_coll (BangumiEpisodeCollection): episode collection just
+                created
+        """
+        ep_coll._episode = self.intern_episode(ep_coll.episode)
+
+    def _intern(self, key, obj):
+        existing = self._objects.get(key)
+        if existing is None:
+            self._objects[key] = obj
+            return obj
+        if existing is not obj:
+            existing.refresh_from(obj)
+        return existing
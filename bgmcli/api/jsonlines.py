@@ -0,0 +1,75 @@
+"""Streaming import and export of collections as JSON lines, one json text
+produced by to_json per line
+"""
+
+import json
+from .collection import BangumiAnimeCollection, BangumiDummySubjectCollection
+
+
+def dump_collections(collections, fileobj, buffer_size=65536):
+    """Write collections to fileobj one per line as they are produced, so
+    that only buffer_size characters are held in memory at a time
+
+    Args:
+        collections (iterable[BangumiSubjectCollection]): collections, can
+            be a generator
+        fileobj (file): file opened for text, e.g. by io.open with utf-8
+            encoding
+        buffer_size (int): number of characters written at a time
+
+    Returns:
+        int: number of collections written
+    """
+    buf = []
+    n_buffered = n_written = 0
+    for coll in collections:
+        line = coll.to_json() + u'\n'
+        buf.append(line)
+        n_buffered += len(line)
+        n_written += 1
+        if n_buffered >= buffer_size:
+            fileobj.write(u''.join(buf))
+            buf = []
+            n_buffered = 0
+    if buf:
+        fileobj.write(u''.join(buf))
+    return n_written
+
+
+def iter_load_collections(fileobj, cls=None):
+    """Read collections written by dump_collections, or any file with json
+    text of a collection per line, one at a time. Blank lines are skipped
+
+    Args:
+        fileobj (file): file opened for text, e.g. by io.open with utf-8
+            encoding
+        cls (type): class of the collections. If None, collections with
+            episode collections are read as BangumiAnimeCollection and
+            others as BangumiDummySubjectCollection
+
+    Yields:
+        BangumiSubjectCollection: the collections, in order of lines
+
+    Raises:
+        ValueError: if a line is not json text of a collection
+    """
+    for line_num, line in enumerate(fileobj, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            coll_cls = cls or _get_collection_class(data)
+            coll = coll_cls.from_dict(data)
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError("Invalid collection at line {0}: {1}"
+                             .format(line_num, e))
+        yield coll
+
+
+def _get_collection_class(data):
+    """Guess class of a collection from json.loads of its json text, where
+    keys of schema 1 have leading underscores
+    """
+    if 'ep_collections' in data or '_ep_collections' in data:
+        return BangumiAnimeCollection
+    return BangumiDummySubjectCollection
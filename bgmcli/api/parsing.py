@@ -0,0 +1,196 @@
+"""Parsing of pages in a pool of processes.
+
+Parsing with BeautifulSoup is pure Python and CPU bound, so parsing in the
+threads sending requests is limited to one core. A ParserPool ships raw
+page bytes to worker processes, which send back compact json of parsed
+elements and collections, as produced by their to_json methods. Objects
+are rebuilt from json in the calling process, which is much cheaper than
+parsing.
+"""
+
+import multiprocessing
+from bs4 import BeautifulSoup
+from .element import BangumiEpisode
+from .collection import BangumiSubjectCollectionFactory,\
+    BangumiDummySubjectCollection, BangumiEpisodeCollection
+from .utils import decode_html
+
+
+# AsyncResult.get without timeout can not be interrupted with Ctrl-C
+_MAX_WAIT = 24 * 60 * 60
+
+
+def _parse_sub_collection(sub_content, ep_content):
+    sub_soup = BeautifulSoup(decode_html(sub_content), 'html.parser')
+    ep_soup = (BeautifulSoup(decode_html(ep_content), 'html.parser')
+               if ep_content is not None else None)
+    sub_coll = BangumiSubjectCollectionFactory.from_soup(sub_soup, ep_soup)
+    return sub_coll._SUB_TYPE, sub_coll.to_json()
+
+
+def _parse_dummy_colls(content, c_status):
+    soup = BeautifulSoup(decode_html(content), 'html.parser')
+    items = soup.find(id='browserItemList').find_all('li')
+    return [BangumiDummySubjectCollection.from_soup_for_li(i, c_status)
+            .to_json() for i in items]
+
+
+def _parse_eps(content):
+    return [ep.to_json() for ep in BangumiEpisode.eps_from_html(
+        decode_html(content))]
+
+
+def _parse_ep_colls(content):
+    soup = BeautifulSoup(decode_html(content), 'html.parser')
+    return [ep_coll.to_json() for ep_coll
+            in BangumiEpisodeCollection.ep_colls_from_soup(soup)]
+
+
+def _build_sub_collection(result):
+    sub_type, json_text = result
+    subclass = BangumiSubjectCollectionFactory.sub_type_subclass_map[sub_type]
+    return subclass.from_json(json_text)
+
+
+def _build_dummy_colls(result):
+    return [BangumiDummySubjectCollection.from_json(json_text)
+            for json_text in result]
+
+
+def _build_eps(result):
+    return [BangumiEpisode.from_json(json_text) for json_text in result]
+
+
+def _build_ep_colls(result):
+    return [BangumiEpisodeCollection.from_json(json_text)
+            for json_text in result]
+
+
+class ParseResult(object):
+    """Result of a page being parsed in a ParserPool
+
+    Note:
+        Please use async methods of ParserPool to create instances
+    """
+
+    def __init__(self, async_result, build):
+        self._async_result = async_result
+        self._build = build
+
+    def get(self):
+        """Wait for the page to be parsed
+
+        Returns:
+            object: the parsed element or collection, or list of them
+
+        Raises:
+            Exception: the error raised parsing the page
+        """
+        return self._build(self._async_result.get(_MAX_WAIT))
+
+    def ready(self):
+        """bool: True if the page has been parsed"""
+        return self._async_result.ready()
+
+
+class ParserPool(object):
+    """Pool of processes parsing pages of Bangumi. Methods are safe to be
+    called from several threads, so that threads fetching pages get them
+    parsed on all cores.
+
+    Pass it to BangumiSession to parse pages of subject collections,
+    episodes and collection lists in the pool.
+
+    Note:
+        As worker processes are forked, it's best created before starting
+        other threads
+
+    Args:
+        n_processes (int): number of worker processes, defaults to number of
+            CPUs
+    """
+
+    def __init__(self, n_processes=None):
+        self._pool = multiprocessing.Pool(n_processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def parse_sub_collection(self, sub_content, ep_content=None):
+        """Parse a subject collection from raw pages
+
+        Args:
+            sub_content (str): raw subject main page
+            ep_content (str): raw subject episodes page, None to leave
+                episodes and episode collections not loaded
+
+        Returns:
+            BangumiSubjectCollection: the subject collection, without session
+        """
+        return self.parse_sub_collection_async(sub_content, ep_content).get()
+
+    def parse_sub_collection_async(self, sub_content, ep_content=None):
+        """Same as parse_sub_collection, without waiting
+
+        Returns:
+            ParseResult: result of BangumiSubjectCollection
+        """
+        return ParseResult(self._pool.apply_async(
+            _parse_sub_collection, (sub_content, ep_content)),
+            _build_sub_collection)
+
+    def parse_dummy_colls(self, content, c_status):
+        """Parse dummy collections from a raw page of a collection list
+
+        Args:
+            content (str): raw page of the collection list
+            c_status (int): c_status of collections in the list
+
+        Returns:
+            list[BangumiDummySubjectCollection]: collections on the page,
+                without session
+        """
+        return self.parse_dummy_colls_async(content, c_status).get()
+
+    def parse_dummy_colls_async(self, content, c_status):
+        """Same as parse_dummy_colls, without waiting
+
+        Returns:
+            ParseResult: result of list[BangumiDummySubjectCollection]
+        """
+        return ParseResult(self._pool.apply_async(
+            _parse_dummy_colls, (content, c_status)), _build_dummy_colls)
+
+    def parse_eps(self, content):
+        """Parse episodes from a raw subject episodes page
+
+        Args:
+            content (str): raw subject episodes page
+
+        Returns:
+            list[BangumiEpisode]: episodes of the subject
+        """
+        return ParseResult(self._pool.apply_async(_parse_eps, (content,)),
+                           _build_eps).get()
+
+    def parse_ep_colls(self, content):
+        """Parse episode collections, with episodes not belonging to any
+        subject object, from a raw subject episodes page
+
+        Args:
+            content (str): raw subject episodes page
+
+        Returns:
+            list[BangumiEpisodeCollection]: episode collections of the
+                subject
+        """
+        return ParseResult(self._pool.apply_async(
+            _parse_ep_colls, (content,)), _build_ep_colls).get()
+
+    def close(self):
+        """Stop worker processes after pending pages are parsed"""
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,456 @@
+"""Staged pipeline for large crawls: items are fetched by a pool of threads,
+parsed by another pool and written to a sink by a single thread. Stages are
+connected by bounded queues, so a slow stage makes the stages before it wait
+instead of piling up pages in memory.
+"""
+
+import io
+import sys
+import time
+import sqlite3
+import threading
+from Queue import Queue, Empty, Full
+
+
+# how long a blocked stage waits before checking for cancellation
+_POLL_INTERVAL = 0.1
+
+# marks the end of items in a queue
+_DONE = object()
+
+
+class StageMetrics(object):
+    """Counters of one stage of a Pipeline, updated while it runs
+
+    Args:
+        name (str): name of the stage
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._processed = 0
+        self._errors = 0
+        self._busy = 0.0
+        self._max_queued = 0
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        """str: name of the stage"""
+        return self._name
+
+    @property
+    def processed(self):
+        """int: number of items processed without error"""
+        return self._processed
+
+    @property
+    def errors(self):
+        """int: number of items that failed"""
+        return self._errors
+
+    @property
+    def busy(self):
+        """float: seconds spent processing items, summed over workers"""
+        return self._busy
+
+    @property
+    def max_queued(self):
+        """int: max number of items seen waiting for the stage"""
+        return self._max_queued
+
+    @property
+    def throughput(self):
+        """float: items processed per second since the stage started"""
+        if self._started is None:
+            return 0.0
+        elapsed = (self._finished or time.time()) - self._started
+        return self._processed / elapsed if elapsed > 0 else 0.0
+
+    def format(self):
+        """Format the counters in one line
+
+        Returns:
+            str: the formatted counters
+        """
+        return ('{0:<6} {1:>6} done {2:>4} failed {3:>8.1f}/s '
+                'busy {4:>7.2f}s max queued {5}'
+                .format(self._name, self._processed, self._errors,
+                        self.throughput, self._busy, self._max_queued))
+
+    def _start(self):
+        with self._lock:
+            if self._started is None:
+                self._started = time.time()
+
+    def _finish(self):
+        self._finished = time.time()
+
+    def _record(self, succeeded, seconds, n_queued):
+        with self._lock:
+            if succeeded:
+                self._processed += 1
+            else:
+                self._errors += 1
+            self._busy += seconds
+            self._max_queued = max(self._max_queued, n_queued)
+
+
+class Pipeline(object):
+    """Fetch -> parse -> store pipeline with bounded queues between stages.
+
+    fetch is called in n_fetchers threads and parse in n_parsers threads;
+    sink.write is called in a single thread, in no particular order of
+    items. An item failing in fetch or parse is recorded in errors and
+    skipped, the pipeline goes on with other items. An error iterating
+    items ends the items, and is raised by run once the items before it
+    are stored.
+
+    The sink is closed when the pipeline finishes, with complete=False if
+    not all items went through it, i.e. it was cancelled or iterating items
+    failed, so that a sink replacing its output as a whole can discard it.
+
+    Args:
+        items (iterable): items to fetch, e.g. subject ids. Consumed lazily
+        fetch (callable): takes an item and returns what parse takes, e.g.
+            raw pages, usually by sending requests
+        parse (callable): takes what fetch returns and returns what the
+            sink writes
+        sink (JSONLinesSink or SQLiteSink or CallbackSink): where parsed
+            objects are written, has write(obj) and close(complete)
+        n_fetchers (int): number of fetching threads
+        n_parsers (int): number of parsing threads. Parsing is CPU bound,
+            more than 1 only helps if parse hands work over to processes,
+            e.g. with a ParserPool
+        max_queued (int): max number of items waiting between two stages
+    """
+
+    def __init__(self, items, fetch, parse, sink, n_fetchers=4, n_parsers=1,
+                 max_queued=16):
+        if n_fetchers < 1 or n_parsers < 1 or max_queued < 1:
+            raise ValueError("numbers of workers and max_queued must be "
+                             "at least 1")
+        self._items = items
+        self._fetch = fetch
+        self._parse = parse
+        self._sink = sink
+        self._n_fetchers = n_fetchers
+        self._n_parsers = n_parsers
+        self._max_queued = max_queued
+        self._cancelled = threading.Event()
+        self._errors = []
+        self._errors_lock = threading.Lock()
+        self._started = None
+        self._finished = None
+        self._metrics = [StageMetrics(name)
+                         for name in ('fetch', 'parse', 'store')]
+
+    def run(self):
+        """Run the pipeline until all items are stored or it's cancelled.
+        Ctrl-C cancels it.
+
+        Returns:
+            list[StageMetrics]: metrics of the fetch, parse and store stages
+
+        Raises:
+            RuntimeError: if the pipeline has already run
+            Exception: any exception raised by iterating items
+        """
+        if self._started is not None:
+            raise RuntimeError("Pipeline can only run once")
+        self._started = time.time()
+        fetch_metrics, parse_metrics, store_metrics = self._metrics
+        to_fetch = Queue(self._max_queued)
+        to_parse = Queue(self._max_queued)
+        to_store = Queue(self._max_queued)
+        remaining = {'fetch': self._n_fetchers, 'parse': self._n_parsers}
+        remaining_lock = threading.Lock()
+        # exc_info of an error iterating items, raised again by run
+        produce_error = []
+
+        def produce():
+            try:
+                for item in self._items:
+                    if not self._put(to_fetch, (item, item)):
+                        break
+            except BaseException:
+                produce_error.append(sys.exc_info())
+            finally:
+                for _ in xrange(self._n_fetchers):
+                    self._put(to_fetch, _DONE)
+
+        def work(stage, func, in_queue, out_queue, metrics, n_next):
+            try:
+                self._work(func, in_queue, out_queue, metrics)
+            finally:
+                # the last worker of a stage tells each worker of the next
+                # stage that it's done
+                with remaining_lock:
+                    remaining[stage] -= 1
+                    last = remaining[stage] == 0
+                if last:
+                    metrics._finish()
+                    for _ in xrange(n_next):
+                        self._put(out_queue, _DONE)
+
+        def store():
+            try:
+                self._store(to_store, store_metrics)
+            finally:
+                store_metrics._finish()
+
+        threads = [threading.Thread(target=produce, name='pipeline-produce')]
+        threads += [threading.Thread(
+            target=work, args=('fetch', self._fetch, to_fetch, to_parse,
+                               fetch_metrics, self._n_parsers),
+            name='pipeline-fetch-{0}'.format(i))
+            for i in xrange(self._n_fetchers)]
+        threads += [threading.Thread(
+            target=work, args=('parse', self._parse, to_parse, to_store,
+                               parse_metrics, 1),
+            name='pipeline-parse-{0}'.format(i))
+            for i in xrange(self._n_parsers)]
+        threads.append(threading.Thread(target=store, name='pipeline-store'))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        complete = False
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(_POLL_INTERVAL)
+            complete = not self.cancelled and not produce_error
+        except KeyboardInterrupt:
+            self.cancel()
+            for thread in threads:
+                thread.join()
+            raise
+        finally:
+            self._sink.close(complete)
+            self._finished = time.time()
+        if produce_error:
+            exc_info = produce_error[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return self.metrics
+
+    def cancel(self):
+        """Stop the pipeline as soon as items being processed are done with.
+        Items already stored stay in the sink. Safe to call from any thread
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        """bool: True if the pipeline has been cancelled"""
+        return self._cancelled.is_set()
+
+    @property
+    def metrics(self):
+        """list[StageMetrics]: metrics of the fetch, parse and store stages"""
+        return list(self._metrics)
+
+    @property
+    def errors(self):
+        """list[tuple(object, Exception)]: items that failed and their
+        errors
+        """
+        with self._errors_lock:
+            return list(self._errors)
+
+    @property
+    def elapsed(self):
+        """float: seconds the pipeline has been running"""
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.time()) - self._started
+
+    def format_summary(self):
+        """Format metrics of all stages and the number of failed items
+
+        Returns:
+            str: the formatted summary
+        """
+        lines = [metrics.format() for metrics in self._metrics]
+        lines.append('{0} items failed, {1:.2f}s elapsed{2}'
+                     .format(len(self._errors), self.elapsed,
+                             ', cancelled' if self.cancelled else ''))
+        return '\n'.join(lines)
+
+    def _work(self, func, in_queue, out_queue, metrics):
+        """Take (item, value) from in_queue, and put (item, func(value))
+        into out_queue until _DONE is taken or cancelled
+        """
+        while True:
+            n_queued = in_queue.qsize()
+            entry = self._get(in_queue)
+            if entry is None or entry is _DONE:
+                return
+            item, value = entry
+            metrics._start()
+            start = time.time()
+            try:
+                result = func(value)
+            except Exception as e:
+                metrics._record(False, time.time() - start, n_queued)
+                self._add_error(item, e)
+                continue
+            metrics._record(True, time.time() - start, n_queued)
+            if not self._put(out_queue, (item, result)):
+                return
+
+    def _store(self, in_queue, metrics):
+        """Write objects taken from in_queue to the sink until _DONE is
+        taken or cancelled
+        """
+        while True:
+            n_queued = in_queue.qsize()
+            entry = self._get(in_queue)
+            if entry is None or entry is _DONE:
+                return
+            item, obj = entry
+            metrics._start()
+            start = time.time()
+            try:
+                self._sink.write(obj)
+            except Exception as e:
+                metrics._record(False, time.time() - start, n_queued)
+                self._add_error(item, e)
+            else:
+                metrics._record(True, time.time() - start, n_queued)
+
+    def _add_error(self, item, error):
+        with self._errors_lock:
+            self._errors.append((item, error))
+
+    def _put(self, queue, entry):
+        """Put entry into queue, blocking while it's full
+
+        Returns:
+            bool: False if cancelled before entry could be put
+        """
+        while not self._cancelled.is_set():
+            try:
+                queue.put(entry, timeout=_POLL_INTERVAL)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _get(self, queue):
+        """Get entry from queue, blocking while it's empty
+
+        Returns:
+            object: the entry, None if cancelled
+        """
+        while not self._cancelled.is_set():
+            try:
+                return queue.get(timeout=_POLL_INTERVAL)
+            except Empty:
+                pass
+        return None
+
+
+class JSONLinesSink(object):
+    """Writes collections or elements to a file, one JSON object per line,
+    as produced by their to_json methods
+
+    Args:
+        path (str or unicode): path of the file, overwritten if it exists
+    """
+
+    def __init__(self, path):
+        self._file = io.open(path, 'w', encoding='utf-8')
+
+    def write(self, obj):
+        """Write obj as one line
+
+        Args:
+            obj (BangumiSubjectCollection or BangumiElement): object to
+                write, anything with a to_json method
+        """
+        self._file.write(obj.to_json() + u'\n')
+
+    def close(self, complete=True):
+        """Flush and close the file. Lines written are kept even if
+        incomplete
+
+        Args:
+            complete (bool): False if not all objects were written
+        """
+        self._file.close()
+
+
+class SQLiteSink(object):
+    """Writes subject collections to table "collections" of an SQLite
+    database, keyed by subject id. A subject written again replaces the
+    previous row, so a crawl can be run again over the same database.
+
+    Args:
+        path (str or unicode): path of the database, created if not exists
+        commit_every (int): number of collections written per transaction
+    """
+
+    def __init__(self, path, commit_every=100):
+        # written by the store thread of Pipeline, created in another one
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS collections '
+                           '(sub_id TEXT PRIMARY KEY, sub_type TEXT, '
+                           'json TEXT)')
+        self._commit_every = commit_every
+        self._n_pending = 0
+
+    def write(self, sub_coll):
+        """Write a subject collection
+
+        Args:
+            sub_coll (BangumiSubjectCollection): the collection
+        """
+        self._conn.execute('INSERT OR REPLACE INTO collections '
+                           'VALUES (?, ?, ?)',
+                           (sub_coll.subject.id_, sub_coll._SUB_TYPE,
+                            sub_coll.to_json()))
+        self._n_pending += 1
+        if self._n_pending >= self._commit_every:
+            self._conn.commit()
+            self._n_pending = 0
+
+    def close(self, complete=True):
+        """Commit pending collections and close the database. Collections
+        written are kept even if incomplete, so a crawl can be resumed
+
+        Args:
+            complete (bool): False if not all collections were written
+        """
+        self._conn.commit()
+        self._conn.close()
+
+
+class CallbackSink(object):
+    """Passes parsed objects to a function
+
+    Args:
+        callback (callable): called with each parsed object, in the store
+            thread of Pipeline
+    """
+
+    def __init__(self, callback):
+        self._callback = callback
+
+    def write(self, obj):
+        """Pass obj to the callback
+
+        Args:
+            obj (object): the parsed object
+        """
+        self._callback(obj)
+
+    def close(self, complete=True):
+        """Nothing to close, for the interface of sinks
+
+        Args:
+            complete (bool): False if not all objects were passed
+        """
+        pass
+
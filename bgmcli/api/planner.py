@@ -0,0 +1,167 @@
+"""Planning of the writes that bring the collection of a subject on Bangumi
+to a target state with the fewest requests
+"""
+
+from .utils import get_ep_colls_up_to_this
+
+
+class PlannedWrite(object):
+    """One request of a write plan
+
+    Attributes:
+        action (str): one of the action constants of this class
+        ep_ids (list[str]): episodes the request is for, empty for actions
+            on the subject collection
+        value (object): c_status for SET_EP_STATUS, n_watched_eps for
+            SET_N_WATCHED_EPS, None otherwise
+        succeeded (bool): outcome of the request, None if not sent
+    """
+
+    SET_COLLECTION = 'set_collection'
+    REMOVE_COLLECTION = 'remove_collection'
+    REMOVE_EP_STATUS = 'remove_ep_status'
+    MARK_WATCHED = 'mark_watched'
+    SET_EP_STATUS = 'set_ep_status'
+    SET_N_WATCHED_EPS = 'set_n_watched_eps'
+
+    __slots__ = ('action', 'ep_ids', 'value', 'succeeded')
+
+    def __init__(self, action, ep_ids=None, value=None):
+        self.action = action
+        self.ep_ids = ep_ids if ep_ids is not None else []
+        self.value = value
+        self.succeeded = None
+
+    def __repr__(self):
+        return 'PlannedWrite({0!r}, {1!r}, {2!r})'.format(
+            self.action, self.ep_ids, self.value)
+
+    def format(self):
+        """Describe the write to show to user
+
+        Returns:
+            unicode: the description
+        """
+        text = self.action
+        if self.ep_ids:
+            text += u' ep ' + u','.join(self.ep_ids)
+        if self.value is not None:
+            text += u' -> {0}'.format(self.value)
+        return text
+
+
+class WritePlan(object):
+    """Ordered writes bringing a subject collection to a target state, one
+    request each
+
+    Args:
+        target (BangumiAnimeCollection): the target state
+        writes (list[PlannedWrite]): the writes in order
+    """
+
+    def __init__(self, target, writes):
+        self.target = target
+        self.writes = writes
+
+    def __len__(self):
+        return len(self.writes)
+
+    def __iter__(self):
+        return iter(self.writes)
+
+    @property
+    def succeeded(self):
+        """bool: True if all writes were sent and succeeded"""
+        return all(write.succeeded for write in self.writes)
+
+    def format(self):
+        """Describe the plan to show to user, one write per line
+
+        Returns:
+            unicode: the description
+        """
+        lines = [u'{0}: {1} requests'.format(self.target.subject.id_,
+                                             len(self.writes))]
+        for write in self.writes:
+            status = {None: u'', True: u' ok', False: u' FAILED'}[
+                write.succeeded]
+            lines.append(u'  ' + write.format() + status)
+        return u'\n'.join(lines)
+
+
+def make_write_plan(target, current):
+    """Work out the writes bringing current to target with the fewest
+    requests.
+
+    The subject collection is set first, as episodes can only be collected
+    for collected subjects. Then statuses of episodes are removed, all
+    episodes to be watched are marked in one request, and other statuses
+    are set one episode at a time. n_watched_eps is only written if target
+    has no episode collections loaded, as marking episodes updates it
+    otherwise
+
+    Args:
+        target (BangumiAnimeCollection): the target state
+        current (BangumiAnimeCollection): the current state on Bangumi, of
+            the same subject
+
+    Returns:
+        WritePlan: the plan
+
+    Raises:
+        ValueError: if target and current are not of the same subject
+    """
+    if target.subject.id_ != current.subject.id_:
+        raise ValueError("Target is for subject {0}, current for {1}"
+                         .format(target.subject.id_, current.subject.id_))
+    writes = []
+    if target.c_status is None:
+        if current.c_status is not None:
+            writes.append(PlannedWrite(PlannedWrite.REMOVE_COLLECTION))
+        return WritePlan(target, writes)
+    if (target.c_status != current.c_status or
+            (target.rating or None) != (current.rating or None) or
+            sorted(target.tags) != sorted(current.tags) or
+            (target.comment or u'') != (current.comment or u'')):
+        writes.append(PlannedWrite(PlannedWrite.SET_COLLECTION))
+
+    ep_writes = []
+    if target.ep_collections_loaded and target.ep_collections:
+        ep_writes = _plan_ep_writes(target, current)
+    elif (target.n_watched_eps is not None and
+          target.n_watched_eps != current.n_watched_eps):
+        writes.append(PlannedWrite(PlannedWrite.SET_N_WATCHED_EPS,
+                                   value=target.n_watched_eps))
+    return WritePlan(target, writes + ep_writes)
+
+
+def _plan_ep_writes(target, current):
+    """Plan writes for episodes whose status in target differs from current
+    """
+    statuses = {}
+    for ep_coll in target.ep_collections:
+        if ep_coll.c_status == 'watched_up_to':
+            for ep_c in get_ep_colls_up_to_this(ep_coll):
+                statuses[ep_c.episode.id_] = 'watched'
+        else:
+            statuses.setdefault(ep_coll.episode.id_, ep_coll.c_status)
+    removed, watched, others = [], [], []
+    for ep_coll in current.ep_collections:
+        ep_id = ep_coll.episode.id_
+        if ep_id not in statuses:
+            continue
+        # uncollected episodes parsed from pages have '' as status
+        c_status = statuses[ep_id] or None
+        if c_status == (ep_coll.c_status or None):
+            continue
+        if c_status is None:
+            removed.append(PlannedWrite(PlannedWrite.REMOVE_EP_STATUS,
+                                        [ep_id]))
+        elif c_status == 'watched':
+            watched.append(ep_id)
+        else:
+            others.append(PlannedWrite(PlannedWrite.SET_EP_STATUS, [ep_id],
+                                       c_status))
+    if watched:
+        removed.append(PlannedWrite(PlannedWrite.MARK_WATCHED, watched))
+    return removed + others
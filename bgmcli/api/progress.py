@@ -0,0 +1,68 @@
+"""Defines airing progress of subject collections, i.e. how far a user has
+watched compared with episodes aired
+"""
+
+
+class BangumiAiringProgress(object):
+    """Airing progress of a subject collection, computed from airing statuses
+    of regular episodes, i.e. episodes of type "EP", and their collection
+    statuses
+
+    Note:
+        Please use BangumiSession.get_airing_progress to create instances
+
+    Args:
+        subject (BangumiSubject): the subject
+        ep_collections (list[BangumiEpisodeCollection]): episode collections
+            of the subject
+    """
+
+    def __init__(self, subject, ep_collections):
+        self._subject = subject
+        ep_colls = [ep_c for ep_c in ep_collections
+                    if ep_c.episode.ep_type == 'EP']
+        self._n_eps = len(ep_colls)
+        self._n_aired = sum(ep_c.episode.status == 'air'
+                            for ep_c in ep_colls)
+        self._n_watched = sum(ep_c.c_status == 'watched'
+                              for ep_c in ep_colls)
+        self._backlog = [ep_c for ep_c in ep_colls
+                         if ep_c.episode.status == 'air' and
+                         ep_c.c_status not in ('watched', 'drop')]
+        self._today = [ep_c for ep_c in ep_colls
+                       if ep_c.episode.status == 'today' and
+                       ep_c.c_status != 'watched']
+
+    @property
+    def subject(self):
+        """BangumiSubject: the subject"""
+        return self._subject
+
+    @property
+    def n_eps(self):
+        """int: number of regular episodes"""
+        return self._n_eps
+
+    @property
+    def n_aired(self):
+        """int: number of regular episodes aired"""
+        return self._n_aired
+
+    @property
+    def n_watched(self):
+        """int: number of regular episodes watched"""
+        return self._n_watched
+
+    @property
+    def backlog(self):
+        """list[BangumiEpisodeCollection]: regular episodes aired but neither
+        watched nor dropped
+        """
+        return list(self._backlog)
+
+    @property
+    def today(self):
+        """list[BangumiEpisodeCollection]: regular episodes airing today and
+        not watched
+        """
+        return list(self._today)
@@ -0,0 +1,48 @@
+"""Rate limiting of requests to Bangumi
+"""
+
+import time
+import threading
+
+
+class RateLimiter(object):
+    """Token bucket limiting the rate of requests, shared by all threads
+    using it. Up to burst requests go out at once, after which requests are
+    spaced 1 / rate seconds apart.
+
+    Args:
+        rate (float): requests per second in the long run
+        burst (int): max number of requests sent without waiting
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self._rate = float(rate)
+        self._burst = burst
+        self._tokens = float(burst)
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self._burst,
+                               self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            # tokens below zero are reserved by threads already waiting
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    @property
+    def rate(self):
+        """float: requests per second in the long run"""
+        return self._rate
+
+    @property
+    def burst(self):
+        """int: max number of requests sent without waiting"""
+        return self._burst
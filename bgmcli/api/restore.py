@@ -0,0 +1,151 @@
+"""Restore of exported collections into an account, writing only what
+differs from the current state of the account and keeping a checkpoint so
+that an interrupted restore resumes where it stopped
+"""
+
+import io
+import os
+import json
+import threading
+
+
+SET_COLLECTION = 'collection'
+SET_N_WATCHED_EPS = 'n_watched_eps'
+# recorded once all writes for a subject are confirmed, or none is needed
+SUBJECT_DONE = 'done'
+
+
+def plan_writes(exported, current):
+    """Work out writes needed for the collection of a subject in the account
+    to match the exported one
+
+    Args:
+        exported (BangumiSubjectCollection): collection as exported
+        current (BangumiSubjectCollection): collection of the same subject
+            currently in the account
+
+    Returns:
+        list[str]: writes in the order they are to be sent, SET_COLLECTION
+            for status, rating, tags and comment, and SET_N_WATCHED_EPS for
+            number of watched episodes
+    """
+    writes = []
+    if exported.c_status is None:
+        return writes
+    if (exported.c_status != current.c_status or
+            (exported.rating or None) != (current.rating or None) or
+            sorted(exported.tags) != sorted(current.tags) or
+            (exported.comment or u'') != (current.comment or u'')):
+        writes.append(SET_COLLECTION)
+    n_watched_eps = getattr(exported, 'n_watched_eps', None)
+    if (n_watched_eps is not None and exported.c_status != 1 and
+            n_watched_eps != (getattr(current, 'n_watched_eps', None) or 0)):
+        writes.append(SET_N_WATCHED_EPS)
+    return writes
+
+
+class RestoreCheckpoint(object):
+    """Writes confirmed by a restore, appended to a file and synced to disk
+    one by one, so that they are known after the process is killed.
+
+    A write confirmed but not recorded yet when the process is killed is
+    sent again on resume, which is harmless as writes set absolute values.
+
+    Args:
+        path (str or unicode): path of the checkpoint file, created if not
+            exists
+        read_only (bool): only read the writes recorded so far, without
+            creating the file, e.g. for a dry run
+    """
+
+    def __init__(self, path, read_only=False):
+        self._path = path
+        self._done = set()
+        self._lock = threading.Lock()
+        line = u'\n'
+        if os.path.exists(path):
+            with io.open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self._done.add((record['sub_id'], record['write']))
+                    except (ValueError, KeyError, TypeError):
+                        # last line cut short by a kill
+                        continue
+        self._file = None
+        if read_only:
+            return
+        self._file = io.open(path, 'a', encoding='utf-8')
+        if not line.endswith(u'\n'):
+            self._file.write(u'\n')
+
+    def __len__(self):
+        return len(self._done)
+
+    def is_done(self, sub_id, write):
+        """Check if a write was confirmed for a subject
+
+        Args:
+            sub_id (unicode): subject id
+            write (str): SET_COLLECTION, SET_N_WATCHED_EPS or SUBJECT_DONE
+
+        Returns:
+            bool: True if recorded
+        """
+        with self._lock:
+            return (sub_id, write) in self._done
+
+    def record(self, sub_id, write):
+        """Record a confirmed write for a subject, returning once the record
+        is on disk
+
+        Args:
+            sub_id (unicode): subject id
+            write (str): SET_COLLECTION, SET_N_WATCHED_EPS or SUBJECT_DONE
+
+        Raises:
+            IOError: if the checkpoint is read only
+        """
+        if self._file is None:
+            raise IOError("Checkpoint {0} is read only".format(self._path))
+        line = json.dumps({'sub_id': sub_id, 'write': write}) + '\n'
+        with self._lock:
+            self._file.write(unicode(line))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._done.add((sub_id, write))
+
+    def close(self):
+        """Close the checkpoint file"""
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RestoreResult(object):
+    """Outcome of the restore of one subject collection
+
+    Attributes:
+        collection (BangumiSubjectCollection): the exported collection
+        writes (list[str]): writes sent, or to be sent for dry run
+        skipped (bool): True if the subject was restored by an earlier run
+        error (Exception): error of the restore, None if it succeeded
+    """
+
+    __slots__ = ('collection', 'writes', 'skipped', 'error')
+
+    def __init__(self, collection, writes=None, skipped=False, error=None):
+        self.collection = collection
+        self.writes = writes if writes is not None else []
+        self.skipped = skipped
+        self.error = error
+
+    @property
+    def succeeded(self):
+        """bool: True if the restore finished without error"""
+        return self.error is None
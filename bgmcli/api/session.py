@@ -3,16 +3,30 @@
 """
 
 import re
+import time
+import weakref
+import threading
+from collections import OrderedDict, Counter, deque
 from functools import wraps
+from multiprocessing.pool import ThreadPool
 import requests
 from bs4 import BeautifulSoup
-from .exception import LoginFailedError, NotLoggedInError, RequestFailedError
+from .exception import LoginFailedError, NotLoggedInError,\
+    RequestFailedError, SessionExpiredError
 from .element import BangumiEpisode, BangumiSubjectFactory
 from .collection import BangumiEpisodeCollection, BangumiSubjectCollection,\
     BangumiSubjectCollectionFactory, BangumiDummySubjectCollection
+from .progress import BangumiAiringProgress
+from .pipeline import Pipeline
+from .identity import IdentityMap
+from .coalesce import WriteCoalescer
+from .singleflight import SingleFlight
+from .planner import PlannedWrite, make_write_plan
+from .restore import RestoreCheckpoint, RestoreResult, plan_writes,\
+    SET_COLLECTION, SUBJECT_DONE
 from .utils import get_ep_colls_up_to_this, check_response, to_unicode,\
     get_user_id_from_html, get_encoding_from_html, get_n_pages,\
-    get_n_watched_eps_from_soup
+    get_n_watched_eps_from_soup, decode_html
 
 
 def require_login(method):
@@ -33,11 +47,22 @@ class BangumiSession(object):
     Note:
         The subject methods currently only work for anime subjects and subject
         collection methods only work for anime collections
+
+    Note:
+        A session can be shared by many threads, e.g. a pool of workers,
+        given pool_size at least the number of threads. Requests changing
+        the same subject collection, and the updates of the collection
+        objects following them, are sent one at a time, while those for
+        different subjects are sent concurrently. relogin can be called from
+        any thread, other threads keep using the previous login until it
+        succeeds
     """
 
     _VALID_DOMAIN = ('bgm.tv', 'bangumi.tv', 'chii.in')
 
-    def __init__(self, email, password, domain='bgm.tv'):
+    def __init__(self, email, password, domain='bgm.tv', rate_limiter=None,
+                 parser_pool=None, identity_map=False, coalesce_window=None,
+                 pool_size=None):
         """Constructs a `BangumiSession`
 
         Args:
@@ -45,6 +70,20 @@ class BangumiSession(object):
             password (str): the password for login
             domain (str): the domain to use for login must be one of
                           ['bgm.tv', 'bangumi.tv', 'chii.in']
+            rate_limiter (RateLimiter): limits the rate of requests sent
+                after login, None for no limit
+            parser_pool (ParserPool): pool of processes to parse pages of
+                subject collections, episodes and collection lists in, None
+                for parsing in the calling thread
+            identity_map (bool): keep one shared object per subject and
+                episode, updated in place when fetched again, instead of
+                creating new ones every time
+            coalesce_window (float): if given, changes of episodes in the
+                same subject collection within this many seconds are sent
+                together, see set_ep_collection. None to send each at once
+            pool_size (int): number of connections to Bangumi kept open for
+                reuse, should be at least the number of threads sharing the
+                session. None for the default of Requests, 10
             
         Raises:
             LoginFailedError: If login failed
@@ -53,13 +92,39 @@ class BangumiSession(object):
         if domain not in self._VALID_DOMAIN:
             raise ValueError("Domain must be one of {0}"
                              .format(self._VALID_DOMAIN))
-        self._session = requests.Session()
         self._base_url = (domain if domain.startswith('http://')
                           else 'http://' + domain)
         self._email = email
+        self._pool_size = pool_size
+        self._session = self._new_http_session()
         self._logged_in = False
-        self._login(email, password)
-        self._gh = self._get_gh()
+        # serializes login, which replaces _session and _gh together
+        self._login_lock = threading.Lock()
+        # locks by sub_id for changes of subject collections, and by object
+        # for loading on first access, kept as long as a thread holds them
+        self._locks = weakref.WeakValueDictionary()
+        self._locks_lock = threading.Lock()
+        self._rate_limiter = rate_limiter
+        self._parser_pool = parser_pool
+        self._identity_map = IdentityMap() if identity_map else None
+        # sub_id -> (time fetched, content) of episodes pages
+        self._ep_pages_cache = {}
+        self._ep_pages_cache_lock = threading.Lock()
+        # concurrent identical reads share one request and parse
+        self._flights = SingleFlight()
+        # collections with fields changed but not sync'ed, by id
+        self._dirty_colls = OrderedDict()
+        self._dirty_colls_lock = threading.Lock()
+        self._ep_writes = (WriteCoalescer(coalesce_window,
+                                          self._send_ep_writes)
+                           if coalesce_window else None)
+        # sub_id -> number of writes failed and not reported yet, counted
+        # across relogins
+        self._failed_writes = Counter()
+        self._failed_writes_lock = threading.Lock()
+        self._login(self._session, email, password)
+        self._gh = self._get_gh(self._session)
+        self._logged_in = True
         self._user_id = self._get_user_id()
         
     def __enter__(self):
@@ -69,16 +134,22 @@ class BangumiSession(object):
         self.logout()
 
     def get_subject(self, sub_id):
-        """Get crucial data for specified subject
+        """Get crucial data for specified subject. Episodes are fetched on
+        first access of eps
+        
         Args:
             sub_id (str): subject id
 
         Returns:
             BangumiAnime: object containing data for specified subject
         """
-        sub_html = self._get_html_for_subject_main(sub_id)
-        ep_html = self._get_html_for_subject_eps(sub_id)
-        return BangumiSubjectFactory.from_html(sub_html, ep_html)
+        sub_soup = BeautifulSoup(self._get_html_for_subject_main(sub_id),
+                                 'html.parser')
+        subject = BangumiSubjectFactory.from_soup(sub_soup, None)
+        if self._identity_map is not None:
+            subject = self._identity_map.intern_subject(subject)
+        self._set_eps_loader(subject)
+        return subject
 
     def get_episode(self, ep_id):
         """Get crucial data for specified episode
@@ -90,7 +161,10 @@ class BangumiSession(object):
         """
         sub_id = self._get_sub_id_for_ep(ep_id)
         html = self._get_html_for_subject_eps(sub_id)
-        return BangumiEpisode.from_html(ep_id, html)
+        episode = BangumiEpisode.from_html(ep_id, html)
+        if self._identity_map is not None:
+            episode = self._identity_map.intern_episode(episode)
+        return episode
 
     def get_episodes_for_sub(self, sub_id):
         """Get crucial data for all episodes under specified subject
@@ -101,11 +175,21 @@ class BangumiSession(object):
             list of BangumiEpisode: list of objects containing data for
                 specified episode
         """
-        html = self._get_html_for_subject_eps(sub_id)
-        return BangumiEpisode.eps_from_html(html)
+        if self._parser_pool is not None:
+            eps = self._parser_pool.parse_eps(
+                self._get_content_for_subject_eps(sub_id))
+        else:
+            html = self._get_html_for_subject_eps(sub_id)
+            eps = BangumiEpisode.eps_from_html(html)
+        if self._identity_map is not None:
+            eps = [self._identity_map.intern_episode(ep) for ep in eps]
+        return eps
 
     def get_sub_collection(self, sub_id):
-        """Get data and collection info for specified subject
+        """Get data and collection info for specified subject. Episodes and
+        episode collections are fetched on first access of subject.eps or
+        ep_collections
+        
         Args:
             sub_id (str): subject id
 
@@ -114,10 +198,17 @@ class BangumiSession(object):
                 subject. Empty collection with only subject if it's not in
                 user's collection
         """
-        sub_html = self._get_html_for_subject_main(sub_id)
-        ep_html = self._get_html_for_subject_eps(sub_id)
-        sub_coll = BangumiSubjectCollectionFactory.from_html(sub_html,
-                                                             ep_html)
+        if self._parser_pool is not None:
+            sub_coll = self._parser_pool.parse_sub_collection(
+                self._get_content_for_subject_main(sub_id))
+        else:
+            sub_soup = BeautifulSoup(self._get_html_for_subject_main(sub_id),
+                                     'html.parser')
+            sub_coll = BangumiSubjectCollectionFactory.from_soup(sub_soup,
+                                                                 None)
+        if self._identity_map is not None:
+            self._identity_map.intern_sub_collection(sub_coll)
+        self._set_loaders(sub_coll)
         sub_coll.session = self
         return sub_coll
 
@@ -133,10 +224,11 @@ class BangumiSession(object):
                 subject. Empty collection with only subject if it's not in
                 user's collection
         """
-        sub_html = self._get_html_for_subject_main(subject.id_)
-        ep_html = self._get_html_for_subject_eps(subject.id_)
+        sub_soup = BeautifulSoup(self._get_html_for_subject_main(subject.id_),
+                                 'html.parser')
         sub_collection = (BangumiSubjectCollectionFactory
-                          .from_html_with_subject(subject, sub_html, ep_html))
+                          .from_soup_with_subject(subject, sub_soup, None))
+        self._set_loaders(sub_collection)
         sub_collection.session = self
         return sub_collection
 
@@ -153,6 +245,8 @@ class BangumiSession(object):
         sub_id = self._get_sub_id_for_ep(ep_id)
         html = self._get_html_for_subject_eps(sub_id)
         ep_coll = BangumiEpisodeCollection.from_html(ep_id, html)
+        if self._identity_map is not None:
+            self._identity_map.intern_ep_collection(ep_coll)
         ep_coll.session = self
         return ep_coll
 
@@ -242,14 +336,23 @@ class BangumiSession(object):
                 'comment': sub_coll.comment, 'update': u'保存'}
         set_coll_url = '{0}/subject/{1}/interest/update?gh={2}'.format(
             self._base_url, sub_coll.subject.id_, self._gh)
-        response = self._post(set_coll_url, data)
-
-        return check_response(response)
+        with self._lock_subject(sub_coll.subject.id_):
+            response = self._post(set_coll_url, data)
+            result = check_response(response)
+            if result:
+                sub_coll._mark_clean(*sub_coll._SYNCED_FIELDS)
+        return result
 
     def set_ep_collection(self, ep_coll):
         """Update the collection info on Bangumi according to provided
         BangumiEpisodeCollection object
 
+        Note:
+            With coalesce_window, changes of episodes in subject collections
+            are sent from a background thread once the window is over, and
+            this returns True as soon as the change is queued. Please call
+            wait_for_writes or check_writes to know if they succeeded
+
         Args:
             ep_coll (BangumiEpisodeCollection): the object containing data
                 to update to Bangumi
@@ -272,24 +375,59 @@ class BangumiSession(object):
         if ep_coll.c_status not in BangumiEpisodeCollection._VALID_C_STATUS:
             raise ValueError('Corrupted c_status value: {0}'
                              .format(ep_coll.c_status))
+        sub_coll = ep_coll.sub_collection
+        if ep_coll.c_status == 'watched_up_to' and sub_coll is None:
+            raise AttributeError("Containing subject collection not " +
+                                 "defined for c_status 'watched_up_to'")
+        self._clear_ep_pages_cache()
+        if self._ep_writes is not None and sub_coll is not None:
+            # sub_coll is kept alive until sent, episodes only refer to it
+            # weakly
+            self._ep_writes.submit(sub_coll.subject.id_,
+                                   (sub_coll, ep_coll, ep_coll.c_status))
+            return True
         if ep_coll.c_status == 'watched_up_to':
-            if ep_coll.sub_collection is None:
-                raise AttributeError("Containing subject collection not " +
-                                     "defined for c_status 'watched_up_to'")
-            else:
-                ep_colls = get_ep_colls_up_to_this(ep_coll)
-                return self._set_watched_eps_in_sub(ep_colls)
-        else:
-            set_url = ('{0}/subject/ep/{1}/status/{2}?gh={3}'
-                       .format(self._base_url, ep_coll.episode.id_,
-                               ep_coll.c_status, self._gh))
-            response = self._get(set_url)
-            # update n_watched_eps in subject collection
-            if ep_coll.sub_collection:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                n_watched_eps = get_n_watched_eps_from_soup(soup)
-                ep_coll.sub_collection.n_watched_eps = n_watched_eps
-        return check_response(response)
+            return self._set_watched_eps_in_sub(
+                get_ep_colls_up_to_this(ep_coll))
+        return self._set_ep_status(ep_coll, ep_coll.c_status)
+
+    def wait_for_writes(self, sub_ids=None):
+        """Send changes of episodes queued with coalesce_window without
+        waiting for the window, and wait until they are sent
+
+        Args:
+            sub_ids (iterable[str]): subjects to send changes of, e.g. before
+                reading their episodes. None for all subjects
+
+        Returns:
+            bool: True if all changes of the subjects sent since last
+                reported succeeded
+
+        Raises:
+            SessionExpiredError: if the login expired while sending changes.
+                They are kept, and sent by the next call after relogin
+        """
+        if self._ep_writes is None:
+            return True
+        if sub_ids is not None:
+            sub_ids = set(sub_ids)
+        return self._report_failed_writes(self._ep_writes.flush(sub_ids),
+                                          sub_ids)
+
+    def check_writes(self):
+        """Check changes of episodes sent once their coalesce_window was
+        over, without sending the ones still queued
+
+        Returns:
+            bool: True if all changes sent since last reported succeeded
+
+        Raises:
+            SessionExpiredError: if the login expired while sending changes.
+                They are kept, and sent by wait_for_writes after relogin
+        """
+        if self._ep_writes is None:
+            return True
+        return self._report_failed_writes(self._ep_writes.take_failures())
 
     def remove_collection(self, collection):
         """Remove the collection on Bangumi and clear c_status locally
@@ -297,6 +435,7 @@ class BangumiSession(object):
         Returns:
             bool: True if successful
         """
+        self._clear_ep_pages_cache()
         if isinstance(collection, BangumiSubjectCollection):
             result = self._remove_sub_collection(collection.subject.id_)
         elif isinstance(collection, BangumiEpisodeCollection):
@@ -304,6 +443,7 @@ class BangumiSession(object):
         else:
             raise TypeError("Collection type invalid!")
         collection._c_status = None
+        collection._mark_clean()
         return result
         
     def set_n_watched_eps(self, sub_collection):
@@ -323,21 +463,10 @@ class BangumiSession(object):
             raise ValueError("c_status must not be 1")
         if sub_collection.n_watched_eps is None:
             raise AttributeError("n_watched_eps must be defined")
-        result = self._set_n_watched_eps(sub_collection.subject.id_,
-                                         sub_collection.n_watched_eps)
-        if result:
-            sub = sub_collection.subject
-            html = self._get_html_for_subject_eps(sub.id_)          
-            sub_collection.ep_collections = (BangumiEpisodeCollection
-                                             .ep_colls_for_sub_from_html(sub,
-                                                                         html))
-            for ep_coll in sub_collection.ep_collections:
-                ep_coll.session = sub_collection.session
-                ep_coll.sub_collection = sub_collection
-            return True
-        else:
-            return False
-        
+        self._clear_ep_pages_cache()
+        with self._lock_subject(sub_collection.subject.id_):
+            return self._set_n_watched_eps_in_sub(sub_collection)
+
     def get_dummy_collections(self, sub_type, c_status, user_id=None):
         """Get a list of dummy collections with basic information for
         subjects in specified c_status and with specified sub_type
@@ -364,21 +493,357 @@ class BangumiSession(object):
         text_c_status = c_status_map[c_status]
         url = '{0}/{1}/list/{2}/{3}'.format(self._base_url, sub_type, user_id,
                                             text_c_status)
-        response = self._get(url)
+        response = self._get(url, shared=True)
         n_pages = get_n_pages(response.text)
         dummy_colls = []
-        for p in xrange(1, n_pages + 1):
-            dummy_colls += self._get_dummy_colls_on_page(url, p, c_status)
+        if self._parser_pool is not None:
+            # fetch next page while previous ones are being parsed
+            results = [self._parser_pool.parse_dummy_colls_async(
+                self._get_content_of_list_page(url, p), c_status)
+                for p in xrange(1, n_pages + 1)]
+            for result in results:
+                dummy_colls += result.get()
+        else:
+            for p in xrange(1, n_pages + 1):
+                dummy_colls += self._get_dummy_colls_on_page(url, p,
+                                                             c_status)
         for coll in dummy_colls:
             coll.session = self
         return dummy_colls
 
+    def get_airing_progress(self, collections, n_workers=8, max_age=600):
+        """Get airing progress for subject collections.
+
+        Progress of regular collections is computed from the episode
+        collections they contain. Episodes pages of dummy collections are
+        fetched concurrently by n_workers threads, and reused for max_age
+        seconds unless episode collections are updated with this session
+        meanwhile
+        
+        Args:
+            collections (list[BangumiAnimeCollection or
+                BangumiDummySubjectCollection]): anime collections
+            n_workers (int): max number of episodes pages fetched at once
+            max_age (float): seconds to reuse a fetched episodes page
+            
+        Returns:
+            list[BangumiAiringProgress]: progress in the order of collections
+        """
+        def get_progress(coll):
+            if isinstance(coll, BangumiDummySubjectCollection):
+                ep_colls = self._get_ep_colls_for_sub(coll.subject.id_,
+                                                      max_age)
+            else:
+                ep_colls = coll.ep_collections
+            return BangumiAiringProgress(coll.subject, ep_colls)
+
+        n_to_fetch = sum(isinstance(coll, BangumiDummySubjectCollection) and
+                         self._get_cached_ep_page(coll.subject.id_,
+                                                  max_age) is None
+                         for coll in collections)
+        if n_to_fetch <= 1:
+            return [get_progress(coll) for coll in collections]
+        pool = ThreadPool(min(n_workers, n_to_fetch))
+        try:
+            return pool.map(get_progress, collections)
+        finally:
+            pool.close()
+            pool.join()
+
+    def catch_up(self, collections, dry_run=False, n_workers=8):
+        """Mark all aired regular episodes that are neither watched nor
+        dropped as watched, for every collection in collections.
+
+        Episodes are worked out locally from airing progress, see
+        get_airing_progress, and a single request is sent for each subject
+        with such episodes. Requests for different subjects are sent
+        concurrently by n_workers threads, within the rate limit of the
+        session
+        
+        Args:
+            collections (list[BangumiAnimeCollection or
+                BangumiDummySubjectCollection]): anime collections
+            dry_run (bool): only work out the episodes without sending
+                requests
+            n_workers (int): max number of requests sent at once
+            
+        Returns:
+            list[tuple(BangumiSubjectCollection,
+                list[BangumiEpisodeCollection], bool)]: collections with
+                episodes to be marked, their episodes, and whether the request
+                succeeded, which is None for dry run
+        """
+        plan = [(coll, progress.backlog) for coll, progress
+                in zip(collections,
+                       self.get_airing_progress(collections, n_workers))
+                if progress.backlog]
+        if dry_run:
+            return [(coll, ep_colls, None) for coll, ep_colls in plan]
+
+        def mark(item):
+            coll, ep_colls = item
+            return coll, ep_colls, self._set_watched_eps_in_sub(ep_colls)
+
+        if len(plan) <= 1:
+            return [mark(item) for item in plan]
+        pool = ThreadPool(min(n_workers, len(plan)))
+        try:
+            return pool.map(mark, plan)
+        finally:
+            pool.close()
+            pool.join()
+
+    def flush(self, n_workers=8):
+        """Sync all collections of this session with fields changed through
+        setters and not sync'ed yet, e.g. after changing many collections in
+        a script.
+
+        Only changed fields are sent. For each subject, the subject
+        collection is sync'ed first, then episode collections, with all
+        episodes to be marked as watched in one request, and then
+        n_watched_eps. Subjects are sync'ed concurrently by n_workers
+        threads, within the rate limit of the session
+
+        Args:
+            n_workers (int): max number of subjects sync'ed at once
+
+        Returns:
+            bool: True if all successful. Collections failed to sync stay
+                dirty and are sync'ed again by the next flush
+        """
+        with self._dirty_colls_lock:
+            colls = self._dirty_colls.values()
+        groups = OrderedDict()
+        for coll in colls:
+            if isinstance(coll, BangumiEpisodeCollection):
+                sub_coll = coll.sub_collection
+                key = (sub_coll.subject.id_ if sub_coll is not None
+                       else 'ep' + coll.episode.id_)
+            else:
+                key = coll.subject.id_
+            groups.setdefault(key, []).append(coll)
+
+        def sync(group):
+            sub_colls = [coll for coll in group
+                         if isinstance(coll, BangumiSubjectCollection)]
+            ep_colls = [coll for coll in group
+                        if isinstance(coll, BangumiEpisodeCollection)]
+            succeeded = all([coll.sync_collection() for coll in sub_colls])
+            # episodes to be marked as watched, by subject collection
+            watched = OrderedDict()
+            for ep_coll in ep_colls:
+                if (ep_coll.c_status == 'watched' and
+                        ep_coll.sub_collection is not None):
+                    watched.setdefault(id(ep_coll.sub_collection),
+                                       []).append(ep_coll)
+            for ep_colls_watched in watched.values():
+                if len(ep_colls_watched) > 1:
+                    succeeded &= self._set_watched_eps_in_sub(
+                        ep_colls_watched)
+            for ep_coll in ep_colls:
+                if ep_coll.is_dirty:
+                    succeeded &= ep_coll.sync_collection()
+            for sub_coll in sub_colls:
+                if 'n_watched_eps' in sub_coll.dirty_fields:
+                    succeeded &= sub_coll.sync_n_watched_eps()
+            return succeeded
+
+        if len(groups) <= 1:
+            succeeded = all([sync(group) for group in groups.values()])
+        else:
+            pool = ThreadPool(min(n_workers, len(groups)))
+            try:
+                succeeded = all(pool.map(sync, groups.values()))
+            finally:
+                pool.close()
+                pool.join()
+        return self.wait_for_writes() and succeeded
+
+    def plan(self, target):
+        """Work out the writes bringing the collection of a subject on
+        Bangumi to target, with the fewest requests. See make_write_plan for
+        the order of writes
+        
+        Args:
+            target (BangumiAnimeCollection): the target state, e.g. a
+                collection fetched before and changed
+            
+        Returns:
+            WritePlan: the plan, against the current state fetched for it
+        """
+        return make_write_plan(target,
+                               self.get_sub_collection(target.subject.id_))
+
+    def apply(self, target, dry_run=False):
+        """Bring the collection of a subject on Bangumi to target, sending
+        only the writes in plan(target), in order. Nothing is refetched
+        after the writes. Sending stops at the first write that fails
+        
+        Args:
+            target (BangumiAnimeCollection): the target state
+            dry_run (bool): only make the plan, without sending it
+            
+        Returns:
+            WritePlan: the plan, with outcome of each write sent
+        """
+        with self._lock_subject(target.subject.id_):
+            write_plan = self.plan(target)
+            if not dry_run:
+                self._send_write_plan(write_plan)
+        return write_plan
+
+    def restore_collections(self, collections, checkpoint_path,
+                            n_workers=4, dry_run=False):
+        """Restore exported subject collections into the account, e.g. after
+        a migration.
+
+        The current collection of each subject is fetched and only fields
+        that differ are written: status, rating, tags and comment with one
+        request, and number of watched episodes with another. Subjects are
+        restored concurrently by n_workers threads, within the rate limit of
+        the session. Each confirmed write is recorded in the checkpoint at
+        checkpoint_path, so that restoring again with the same checkpoint
+        skips subjects and writes already done. Collections are consumed a
+        few at a time as results are iterated, so that a large export is
+        not held in memory at once
+        
+        Args:
+            collections (iterable[BangumiSubjectCollection]): exported
+                collections, e.g. from iter_load_collections
+            checkpoint_path (str or unicode): path of the checkpoint file
+            n_workers (int): max number of subjects restored at once
+            dry_run (bool): only work out the writes, without sending or
+                recording them. The checkpoint is only read
+            
+        Yields:
+            RestoreResult: outcome for each collection, in order
+        """
+        checkpoint = RestoreCheckpoint(checkpoint_path, read_only=dry_run)
+
+        def restore(coll):
+            sub_id = coll.subject.id_
+            if checkpoint.is_done(sub_id, SUBJECT_DONE):
+                return RestoreResult(coll, skipped=True)
+            result = RestoreResult(coll)
+            try:
+                current = self.get_sub_collection(sub_id)
+                writes = [write for write in plan_writes(coll, current)
+                          if not checkpoint.is_done(sub_id, write)]
+                if dry_run:
+                    result.writes = writes
+                    return result
+                for write in writes:
+                    if write == SET_COLLECTION:
+                        succeeded = self.set_sub_collection(coll)
+                    else:
+                        self._clear_ep_pages_cache()
+                        succeeded = self._set_n_watched_eps(
+                            sub_id, coll.n_watched_eps)
+                    if not succeeded:
+                        raise RequestFailedError(
+                            "Failed to write {0} of subject {1}"
+                            .format(write, sub_id))
+                    checkpoint.record(sub_id, write)
+                    result.writes.append(write)
+                checkpoint.record(sub_id, SUBJECT_DONE)
+            except Exception as e:
+                result.error = e
+            return result
+
+        pool = ThreadPool(n_workers)
+        # results in order, at most a few per worker ahead of the one yielded
+        # next, as imap would consume all collections up front
+        pending = deque()
+        try:
+            for coll in collections:
+                pending.append(pool.apply_async(restore, (coll,)))
+                if len(pending) >= 4 * n_workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.close()
+            pool.join()
+            checkpoint.close()
+
+    def make_sub_collection_pipeline(self, sub_ids, sink, n_fetchers=4,
+                                     n_parsers=None, max_queued=16):
+        """Make a pipeline that gets subject collections for sub_ids, as
+        get_sub_collection does, and writes them to sink. Pages are fetched
+        by n_fetchers threads, within the rate limit of the session, and
+        parsed in the ParserPool of the session if there is one
+        
+        Args:
+            sub_ids (iterable[str]): subject ids, consumed lazily
+            sink (JSONLinesSink or SQLiteSink or CallbackSink): where
+                collections are written
+            n_fetchers (int): number of subjects fetched at once
+            n_parsers (int): number of subjects parsed at once, defaults to
+                n_fetchers with a ParserPool and 1 without
+            max_queued (int): max number of subjects waiting between stages
+            
+        Returns:
+            Pipeline: the pipeline, to be run with its run method
+        """
+        def fetch(sub_id):
+            return (self._get_content_for_subject_main(sub_id),
+                    self._get_content_for_subject_eps(sub_id))
+
+        def parse(contents):
+            sub_content, ep_content = contents
+            if self._parser_pool is not None:
+                sub_coll = self._parser_pool.parse_sub_collection(
+                    sub_content, ep_content)
+            else:
+                sub_coll = BangumiSubjectCollectionFactory.from_html(
+                    decode_html(sub_content), decode_html(ep_content))
+            if self._identity_map is not None:
+                self._identity_map.intern_sub_collection(sub_coll)
+            sub_coll.session = self
+            return sub_coll
+
+        if n_parsers is None:
+            n_parsers = n_fetchers if self._parser_pool is not None else 1
+        return Pipeline(sub_ids, fetch, parse, sink, n_fetchers, n_parsers,
+                        max_queued)
+
+    def relogin(self, password):
+        """Login again with the email address of the session, e.g. after the
+        login expired. Collections bound to the session keep working
+        
+        Args:
+            password (str): the password for login
+            
+        Raises:
+            LoginFailedError: If login failed, the previous login is kept
+        """
+        with self._login_lock:
+            session = self._new_http_session()
+            self._login(session, self._email, password)
+            gh = self._get_gh(session)
+            previous = self._session
+            self._session, self._gh = session, gh
+            self._logged_in = True
+        # requests in progress on the previous session fail once it is
+        # closed, as they would with the expired login anyway
+        previous.close()
+
     @require_login
     def logout(self):
-        """Logout the session"""
+        """Logout the session, after sending changes still queued
+
+        Returns:
+            bool: True if all changes queued were sent successfully, see
+                wait_for_writes
+        """
+        try:
+            written = self.wait_for_writes()
+        except SessionExpiredError:
+            written = False
         self._logged_in = False
         self._session.get('{0}/logout/{1}'.format(self._base_url, self._gh))
         self._session.close()
+        return written
         
     @property
     def user_id(self):
@@ -386,6 +851,11 @@ class BangumiSession(object):
         """
         return self._user_id
     
+    @property
+    def identity_map(self):
+        """IdentityMap: shared subjects and episodes, None if not used"""
+        return self._identity_map
+
     @property
     def email(self):
         """str: email address used for login
@@ -396,7 +866,10 @@ class BangumiSession(object):
         """Set all episodes in ep_colls to watched both locally and to Bangumi
 
         Note:
-            All entries in ep_colls must belong to the same subject collection
+            All entries in ep_colls must belong to the same subject
+            collection. For episode collections not belonging to any subject
+            collection, e.g. those for dummy collections, only the request
+            setting them is sent, without refreshing n_watched_eps
             
         Returns:
             bool: True if successful
@@ -406,25 +879,230 @@ class BangumiSession(object):
             if ep_coll.sub_collection is not sub_coll:
                 raise ValueError("Exists entry in ep_coll not belong to " +
                                  "same subject collection!")
-        ep_ids = [ep_c.episode.id_ for ep_c in ep_colls]
-        base_ep_id = ep_ids[-1]
-        ep_ids_str = ','.join(ep_ids)
-        data = {'ep_id': ep_ids_str}
-        set_url = ('{0}/subject/ep/{1}/status/watched?gh={2}&ajax=1'
-                   .format(self._base_url, base_ep_id, self._gh))
-        response = self._post(set_url, data)
-        if (response.status_code == 200 and
-            response.text == u'{"status":"ok"}'):
+        self._clear_ep_pages_cache()
+        with self._lock_subject(sub_coll.subject.id_ if sub_coll else None):
+            return self._set_watched_eps(sub_coll, ep_colls)
+
+    def _set_watched_eps(self, sub_coll, ep_colls):
+        if self._mark_watched([ep_c.episode.id_ for ep_c in ep_colls]):
             # update n_watched_eps as well as ep_collections
-            html = self._get_html_for_subject_main(sub_coll.subject.id_)
-            soup = BeautifulSoup(html, 'html.parser')           
-            sub_coll.n_watched_eps = get_n_watched_eps_from_soup(soup)
+            if sub_coll is not None:
+                html = self._get_html_for_subject_main(sub_coll.subject.id_)
+                soup = BeautifulSoup(html, 'html.parser')           
+                sub_coll.n_watched_eps = get_n_watched_eps_from_soup(soup)
+                sub_coll._mark_clean('n_watched_eps')
             for ep_c in ep_colls:
                 ep_c.c_status = 'watched'
+                ep_c._mark_clean('c_status')
             return True
         else:
             return False
 
+    def _set_loaders(self, sub_coll):
+        """Have episodes of the subject of sub_coll loaded on first access,
+        with episode collections if they are to be loaded as well
+        """
+        subject = sub_coll.subject
+        if subject.eps_loaded:
+            return
+        if sub_coll.ep_collections_loaded:
+            self._set_eps_loader(subject)
+        else:
+            # one episodes page for both. Loading episode collections sets
+            # the episodes, under the lock of the subject
+            subject.set_eps_loader(lambda: [ep_c.episode for ep_c
+                                            in sub_coll.ep_collections])
+
+    def _set_eps_loader(self, subject):
+        """Have episodes of subject loaded on first access, once if several
+        threads access them at once
+        """
+        def load():
+            with self._lock_object(subject):
+                if not subject.eps_loaded:
+                    subject.eps = self.get_episodes_for_sub(subject.id_)
+                    for ep in subject.eps:
+                        ep.subject = subject
+                return subject.eps
+
+        subject.set_eps_loader(load)
+
+    def _get_ep_colls_for_sub_coll(self, sub_coll):
+        """Get episode collections for sub_coll loading them on first access.
+        Episodes of the subject are loaded as well if not loaded yet
+        """
+        subject = sub_coll.subject
+        fetched = self._get_ep_colls_for_sub(subject.id_, 0)
+        with self._lock_object(subject):
+            if not subject.eps_loaded:
+                subject.eps = [ep_c.episode for ep_c in fetched]
+                for ep in subject.eps:
+                    ep.subject = subject
+        c_statuses = {ep_c.episode.id_: ep_c.c_status for ep_c in fetched}
+        return [BangumiEpisodeCollection(ep, c_statuses.get(ep.id_))
+                for ep in subject.eps]
+
+    def _get_ep_colls_for_sub(self, sub_id, max_age):
+        """Get episode collections from episodes page of a subject, with the
+        page cached for max_age seconds. Every call parses the page, so that
+        callers do not share episode objects, unless with identity map
+        """
+        content = self._get_cached_ep_page(sub_id, max_age)
+        if content is None:
+            fetched_at = time.time()
+            content = self._get_content_for_subject_eps(sub_id)
+            with self._ep_pages_cache_lock:
+                self._ep_pages_cache[sub_id] = (fetched_at, content)
+        if self._parser_pool is not None:
+            ep_colls = self._parser_pool.parse_ep_colls(content)
+        else:
+            soup = BeautifulSoup(decode_html(content), 'html.parser')
+            ep_colls = BangumiEpisodeCollection.ep_colls_from_soup(soup)
+        if self._identity_map is not None:
+            for ep_coll in ep_colls:
+                self._identity_map.intern_ep_collection(ep_coll)
+        return ep_colls
+
+    def _get_cached_ep_page(self, sub_id, max_age):
+        with self._ep_pages_cache_lock:
+            cached = self._ep_pages_cache.get(sub_id)
+        if cached is not None and time.time() - cached[0] < max_age:
+            return cached[1]
+        return None
+
+    def _send_write_plan(self, write_plan):
+        """Send writes of a plan in order, until one fails"""
+        target = write_plan.target
+        sub_id = target.subject.id_
+        self._clear_ep_pages_cache()
+        for write in write_plan:
+            if write.action == PlannedWrite.SET_COLLECTION:
+                write.succeeded = self.set_sub_collection(target)
+            elif write.action == PlannedWrite.REMOVE_COLLECTION:
+                write.succeeded = self._remove_sub_collection(sub_id)
+            elif write.action == PlannedWrite.REMOVE_EP_STATUS:
+                write.succeeded = self._remove_ep_collection(
+                    write.ep_ids[0])
+            elif write.action == PlannedWrite.MARK_WATCHED:
+                write.succeeded = self._mark_watched(write.ep_ids)
+            elif write.action == PlannedWrite.SET_EP_STATUS:
+                write.succeeded = check_response(self._get_ep_status_url(
+                    write.ep_ids[0], write.value))
+            else:
+                write.succeeded = self._set_n_watched_eps(sub_id,
+                                                          write.value)
+            if not write.succeeded:
+                return
+        target._mark_clean()
+        if target.ep_collections_loaded:
+            for ep_coll in target.ep_collections:
+                ep_coll._mark_clean()
+
+    def _mark_watched(self, ep_ids):
+        """Mark episodes of a subject as watched with one request"""
+        data = {'ep_id': ','.join(ep_ids)}
+        set_url = ('{0}/subject/ep/{1}/status/watched?gh={2}&ajax=1'
+                   .format(self._base_url, ep_ids[-1], self._gh))
+        response = self._post(set_url, data)
+        return (response.status_code == 200 and
+                response.text == u'{"status":"ok"}')
+
+    def _set_ep_status(self, ep_coll, c_status):
+        """Set status of one episode with the request for it, updating
+        n_watched_eps of the subject collection from the response
+        """
+        sub_coll = ep_coll.sub_collection
+        with self._lock_subject(sub_coll.subject.id_ if sub_coll else None):
+            response = self._get_ep_status_url(ep_coll.episode.id_, c_status)
+            if sub_coll:
+                soup = BeautifulSoup(response.text, 'html.parser')
+                sub_coll.n_watched_eps = get_n_watched_eps_from_soup(soup)
+                sub_coll._mark_clean('n_watched_eps')
+        result = check_response(response)
+        if result and ep_coll.c_status == c_status:
+            ep_coll._mark_clean('c_status')
+        return result
+
+    def _get_ep_status_url(self, ep_id, c_status):
+        return self._get('{0}/subject/ep/{1}/status/{2}?gh={3}'
+                         .format(self._base_url, ep_id, c_status, self._gh))
+
+    def _report_failed_writes(self, failures, sub_ids=None):
+        """Count failed sends of episode changes by subject, putting back
+        the ones failed as the login expired
+
+        Returns:
+            bool: True if no change of sub_ids, or of any subject if None,
+                failed since last reported
+
+        Raises:
+            SessionExpiredError: if any send failed as the login expired
+        """
+        with self._failed_writes_lock:
+            expired = False
+            for sub_id, items, error in failures:
+                if isinstance(error, SessionExpiredError):
+                    self._ep_writes.requeue(sub_id, items)
+                    expired = True
+                else:
+                    self._failed_writes[sub_id] += 1
+            if expired:
+                raise SessionExpiredError("Login expired")
+            if sub_ids is None:
+                sub_ids = list(self._failed_writes)
+            n_failed = sum(self._failed_writes.pop(sub_id, 0)
+                           for sub_id in sub_ids)
+        return not n_failed
+
+    def _send_ep_writes(self, sub_id, writes):
+        """Send changes of episodes of a subject queued within the
+        coalescing window. The last change of each episode wins, and all
+        episodes to be watched are set with one request for each subject
+        collection of the subject
+        """
+        by_coll = OrderedDict()
+        for write in writes:
+            by_coll.setdefault(id(write[0]), []).append(write)
+        succeeded = True
+        with self._lock_subject(sub_id):
+            for coll_writes in by_coll.values():
+                succeeded &= self._send_ep_statuses(coll_writes[0][0],
+                                                    coll_writes)
+        return succeeded
+
+    def _send_ep_statuses(self, sub_coll, writes):
+        statuses = OrderedDict()
+        for _, ep_coll, c_status in writes:
+            if c_status == 'watched_up_to':
+                for ep_c in get_ep_colls_up_to_this(ep_coll):
+                    statuses[id(ep_c)] = (ep_c, 'watched')
+            else:
+                statuses[id(ep_coll)] = (ep_coll, c_status)
+        positions = {id(ep_c): i
+                     for i, ep_c in enumerate(sub_coll.ep_collections)}
+        watched = sorted((ep_c for ep_c, c_status in statuses.values()
+                          if c_status == 'watched'),
+                         key=lambda ep_c: positions.get(id(ep_c), -1))
+        succeeded = True
+        if watched:
+            succeeded = self._set_watched_eps_in_sub(watched)
+        for ep_c, c_status in statuses.values():
+            if c_status != 'watched':
+                succeeded &= self._set_ep_status(ep_c, c_status)
+        return succeeded
+
+    def _add_dirty(self, collection):
+        with self._dirty_colls_lock:
+            self._dirty_colls[id(collection)] = collection
+
+    def _discard_dirty(self, collection):
+        with self._dirty_colls_lock:
+            self._dirty_colls.pop(id(collection), None)
+
+    def _clear_ep_pages_cache(self):
+        with self._ep_pages_cache_lock:
+            self._ep_pages_cache.clear()
+
     def _remove_sub_collection(self, sub_id):
         rm_url = '{0}/subject/{1}/remove?gh={2}'.format(self._base_url,
                                                          sub_id, self._gh)
@@ -437,6 +1115,23 @@ class BangumiSession(object):
         response = self._get(rm_url)
         return check_response(response)
 
+    def _set_n_watched_eps_in_sub(self, sub_collection):
+        result = self._set_n_watched_eps(sub_collection.subject.id_,
+                                         sub_collection.n_watched_eps)
+        if result:
+            sub_collection._mark_clean('n_watched_eps')
+            sub = sub_collection.subject
+            html = self._get_html_for_subject_eps(sub.id_)
+            sub_collection.ep_collections = (BangumiEpisodeCollection
+                                             .ep_colls_for_sub_from_html(sub,
+                                                                         html))
+            for ep_coll in sub_collection.ep_collections:
+                ep_coll.session = sub_collection.session
+                ep_coll.sub_collection = sub_collection
+            return True
+        else:
+            return False
+
     def _set_n_watched_eps(self, sub_id, n_watched_eps):
         set_url = '{0}/subject/set/watched/{1}'.format(self._base_url, sub_id)
         data = {'referer': 'subject', 'submit': u'更新',
@@ -450,7 +1145,7 @@ class BangumiSession(object):
 
     def _get_html_for_ep(self, ep_id):
         ep_url = '{0}/ep/{1}'.format(self._base_url, ep_id)
-        response = self._get(ep_url)
+        response = self._get(ep_url, shared=True)
         response.encoding = get_encoding_from_html(response.text)
         return response.text
 
@@ -462,19 +1157,33 @@ class BangumiSession(object):
 
     def _get_html_for_subject_main(self, sub_id):
         sub_url = '{0}/subject/{1}'.format(self._base_url, sub_id)
-        response = self._get(sub_url)
+        response = self._get(sub_url, shared=True)
         response.encoding = get_encoding_from_html(response.text)
         return response.text
 
     def _get_html_for_subject_eps(self, sub_id):
         sub_url = '{0}/subject/{1}/ep'.format(self._base_url, sub_id)
-        response = self._get(sub_url)
+        response = self._get(sub_url, shared=True)
         response.encoding = get_encoding_from_html(response.text)
         return response.text
     
+    def _get_content_for_subject_main(self, sub_id):
+        return self._get('{0}/subject/{1}'.format(self._base_url, sub_id),
+                         shared=True).content
+
+    def _get_content_for_subject_eps(self, sub_id):
+        return self._get('{0}/subject/{1}/ep'.format(self._base_url, sub_id),
+                         shared=True).content
+
+    def _get_content_of_list_page(self, url, page):
+        response = self._get('{0}?page={1}'.format(url, page), shared=True)
+        if response.status_code != 200:
+            raise RequestFailedError("Request Failed")
+        return response.content
+
     def _get_dummy_colls_on_page(self, url, page, c_status):
         page_url = '{0}?page={1}'.format(url, page)
-        response = self._get(page_url)
+        response = self._get(page_url, shared=True)
         if response.status_code != 200:
             raise RequestFailedError("Request Failed")
         response.encoding = get_encoding_from_html(response.text)
@@ -484,29 +1193,82 @@ class BangumiSession(object):
                 for i in items]
 
 
-    def _login(self, email, password):
+    def _new_http_session(self):
+        session = requests.Session()
+        if self._pool_size is not None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=self._pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+
+    def _lock_subject(self, sub_id):
+        """Get the lock for changes of the collection of a subject"""
+        return self._get_lock(sub_id)
+
+    def _lock_object(self, obj):
+        """Get the lock for loading data of obj on first access, e.g. the
+        episode collections of a subject collection
+        """
+        return self._get_lock(('object', id(obj)))
+
+    def _get_lock(self, key):
+        with self._locks_lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.RLock()
+            return lock
+
+    def _login(self, session, email, password):
         data = {'email': email, 'password': password,
                 'loginsubmit': to_unicode('登录')}
-        response = self._session.post(self._base_url + '/FollowTheRabbit',
-                                      data)
+        response = session.post(self._base_url + '/FollowTheRabbit', data)
         response.encoding = get_encoding_from_html(response.text)
-        if to_unicode('欢迎您回来。现在将转入登录前页面') in response.text:
-            self._logged_in = True
-        else:
+        if to_unicode('欢迎您回来。现在将转入登录前页面') not in response.text:
             print response.text
             raise LoginFailedError("Login failed.")
 
-    def _get_gh(self):
-        response = self._get(self._base_url)
+    def _get_gh(self, session):
+        response = session.get(self._base_url)
         match_result = re.search(
             '<a href="{0}/logout/(.*?)">'.format(self._base_url),
             response.text)
         return match_result.group(1)
     
     @require_login
-    def _get(self, url):
-        return self._session.get(url)
+    def _get(self, url, shared=False):
+        """Send a GET request. If shared, callers of the same url while a
+        request for it is in progress wait for and share its response
+        instead of sending their own. Requests not shared, which include the
+        GET requests changing collections, are sent on their own, and shared
+        reads after them start a new request
+        """
+        if shared:
+            return self._flights.do(('GET', url), self._send_get, url)
+        self._flights.detach()
+        return self._send_get(url)
+
+    def _send_get(self, url):
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        return self._check_expired(self._session.get(url))
     
     @require_login
     def _post(self, url, data):
-        return self._session.post(url, data)
+        self._flights.detach()
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        return self._check_expired(self._session.post(url, data))
+
+    def _check_expired(self, response):
+        """Raise SessionExpiredError if response is a page without the logout
+        link, which every page shows when logged in. Other responses, e.g. to
+        ajax requests, are returned as is. The session stays logged in, so
+        that other threads sharing it get SessionExpiredError as well until
+        relogin
+        """
+        content = response.content
+        if (response.status_code == 200 and content.lstrip()[:1] == b'<' and
+                b'/logout/' not in content):
+            raise SessionExpiredError("Login expired")
+        return response
@@ -0,0 +1,312 @@
+"""Pool of logged-in sessions of several accounts, kept across jobs and
+shared by worker threads
+"""
+
+import threading
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from .session import BangumiSession
+from .ratelimit import RateLimiter
+from .exception import SessionExpiredError
+
+
+class MapResult(object):
+    """Outcome of the call of SessionPool.map for one item
+
+    Attributes:
+        item (object): the item
+        value (object): return value of the call, None if it failed
+        error (Exception): error of the call, None if it succeeded
+    """
+
+    __slots__ = ('item', 'value', 'error')
+
+    def __init__(self, item, value=None, error=None):
+        self.item = item
+        self.value = value
+        self.error = error
+
+    @property
+    def succeeded(self):
+        """bool: True if the call finished without error"""
+        return self.error is None
+
+
+class SessionPool(object):
+    """Keeps logged-in sessions of several accounts, at most one per
+    account, and hands them out to workers. A session is shared by all
+    workers given the same account, as BangumiSession is thread-safe.
+
+    Accounts are logged in on first use, and again when their login expires
+    during run or map. Requests of each account are limited to
+    max_request_rate across its logins, so work spread over n accounts goes
+    up to n times as fast as with one.
+
+    Args:
+        accounts (dict): password by email address of each account
+        max_sessions (int): max number of accounts logged in at a time. Idle
+            sessions of the least recently used accounts are logged out to
+            make room. None for all accounts
+        max_request_rate (float): max requests per second of each account,
+            None for no limit
+        session_factory (callable): called with email, password and the
+            RateLimiter of the account, or None, to log in. None to create
+            BangumiSession with session_kwargs
+        **session_kwargs: passed to BangumiSession, e.g. pool_size
+
+    Raises:
+        ValueError: if there is no account or max_sessions is less than 1
+    """
+
+    def __init__(self, accounts, max_sessions=None, max_request_rate=None,
+                 session_factory=None, **session_kwargs):
+        if not accounts:
+            raise ValueError("No account provided")
+        if max_sessions is not None and max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self._accounts = OrderedDict(sorted(accounts.items()))
+        self._max_sessions = max_sessions or len(accounts)
+        self._rate_limiters = {
+            email: (RateLimiter(max_request_rate,
+                                max(1, int(max_request_rate)))
+                    if max_request_rate else None)
+            for email in self._accounts}
+        self._session_factory = session_factory or (
+            lambda email, password, rate_limiter: BangumiSession(
+                email, password, rate_limiter=rate_limiter, **session_kwargs))
+        # email -> session, least recently used first, None while logging in
+        self._sessions = OrderedDict()
+        self._n_in_use = Counter()
+        # email -> number of logins, to login again once per expiry
+        self._n_logins = Counter()
+        self._login_locks = {email: threading.Lock()
+                             for email in self._accounts}
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return sum(1 for session in self._sessions.values()
+                       if session is not None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def accounts(self):
+        """list[str]: email addresses of the accounts"""
+        return list(self._accounts)
+
+    def acquire(self, email=None):
+        """Get a logged-in session, logging in if needed. Please release it
+        once done
+
+        Args:
+            email (str): account of the session. None for the account with
+                fewest workers, preferring those logged in
+
+        Returns:
+            BangumiSession: the session
+
+        Raises:
+            KeyError: if email is not one of the accounts
+            LoginFailedError: if login failed
+        """
+        if email is not None and email not in self._accounts:
+            raise KeyError(email)
+        evicted = []
+        with self._cond:
+            while True:
+                chosen = email or self._pick_account()
+                if chosen in self._sessions or self._make_room(evicted):
+                    break
+                self._cond.wait()
+            self._n_in_use[chosen] += 1
+            # most recently used last
+            self._sessions[chosen] = self._sessions.pop(chosen, None)
+        for session in evicted:
+            self._logout(session)
+        try:
+            return self._get_logged_in(chosen)
+        except Exception:
+            with self._cond:
+                self._n_in_use[chosen] -= 1
+                if self._sessions.get(chosen, True) is None:
+                    del self._sessions[chosen]
+                self._cond.notify_all()
+            raise
+
+    def release(self, session):
+        """Give back a session got from acquire
+
+        Args:
+            session (BangumiSession): the session
+        """
+        with self._cond:
+            self._n_in_use[session.email] -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def session(self, email=None):
+        """Context manager for a session got from acquire and released on
+        exit
+
+        Args:
+            email (str): account of the session, see acquire
+        """
+        session = self.acquire(email)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def run(self, func, email=None):
+        """Call func with a session, logging in again and calling it once
+        more if the login expired. func should be safe to call again, e.g.
+        only read or set absolute values
+
+        Args:
+            func (callable): called with the session
+            email (str): account of the session, see acquire
+
+        Returns:
+            object: return value of func
+        """
+        with self.session(email) as session:
+            with self._cond:
+                n_logins = self._n_logins[session.email]
+            try:
+                return func(session)
+            except SessionExpiredError:
+                self._relogin(session, n_logins)
+                return func(session)
+
+    def map(self, func, items, n_workers=None):
+        """Call func with a session and each item from a pool of worker
+        threads, spreading the calls across accounts. See run. An error of
+        one call does not stop the others, and is given in its result
+
+        Args:
+            func (callable): called with a session and an item
+            items (iterable): the items
+            n_workers (int): number of worker threads, None for two per
+                account that can be logged in at a time
+
+        Yields:
+            MapResult: outcome for each item, in order of items, as soon as
+                the calls up to it are done
+        """
+        def call(item):
+            try:
+                return MapResult(item, self.run(
+                    lambda session: func(session, item)))
+            except Exception as e:
+                return MapResult(item, error=e)
+
+        pool = ThreadPool(n_workers or 2 * self._max_sessions)
+        try:
+            for result in pool.imap(call, items):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    def get_dummy_collections(self, sub_type, c_status, user_ids,
+                              n_workers=None):
+        """Get collection lists of many users, spread across accounts. See
+        BangumiSession.get_dummy_collections
+
+        Note:
+            Collections are bound to the session of the account fetching
+            them, which may be logged out later to make room for others
+
+        Args:
+            sub_type (str): must be among 'anime', 'book', 'game', 'real'
+            c_status (int): as in c_status of BangumiSubjectCollection
+            user_ids (list[str]): users to get lists for
+            n_workers (int): number of worker threads, see map
+
+        Returns:
+            dict: list of dummy collections by user id
+
+        Raises:
+            Exception: the first error getting a list, once all are done
+        """
+        results = list(self.map(lambda session, user_id:
+                                session.get_dummy_collections(
+                                    sub_type, c_status, user_id),
+                                user_ids, n_workers))
+        for result in results:
+            if not result.succeeded:
+                raise result.error
+        return {result.item: result.value for result in results}
+
+    def close(self):
+        """Log out all sessions, once no worker uses them"""
+        with self._cond:
+            while any(self._n_in_use.values()):
+                self._cond.wait()
+            sessions = [session for session in self._sessions.values()
+                        if session is not None]
+            self._sessions.clear()
+        for session in sessions:
+            self._logout(session)
+
+    def _pick_account(self):
+        """Pick the account with fewest workers among those logged in, and
+        those not logged in if there is room
+        """
+        has_room = len(self._sessions) < self._max_sessions
+        candidates = [email for email in self._accounts
+                      if has_room or email in self._sessions]
+        return min(candidates, key=lambda email: (
+            self._n_in_use[email], email not in self._sessions))
+
+    def _make_room(self, evicted):
+        """Make room for one more session if there is none, dropping the
+        least recently used idle session into evicted
+
+        Returns:
+            bool: True if there is room
+        """
+        if len(self._sessions) < self._max_sessions:
+            return True
+        for email, session in self._sessions.items():
+            if session is not None and not self._n_in_use[email]:
+                del self._sessions[email]
+                evicted.append(session)
+                return True
+        return False
+
+    def _get_logged_in(self, email):
+        with self._login_locks[email]:
+            with self._cond:
+                session = self._sessions[email]
+            if session is None:
+                session = self._session_factory(
+                    email, self._accounts[email], self._rate_limiters[email])
+                with self._cond:
+                    self._sessions[email] = session
+                    self._n_logins[email] += 1
+            return session
+
+    def _relogin(self, session, n_logins):
+        """Login again unless another worker did since n_logins"""
+        email = session.email
+        with self._login_locks[email]:
+            with self._cond:
+                if self._n_logins[email] != n_logins:
+                    return
+            session.relogin(self._accounts[email])
+            with self._cond:
+                self._n_logins[email] += 1
+
+    def _logout(self, session):
+        try:
+            session.logout()
+        except Exception:
+            # the session is dropped anyway
+            pass
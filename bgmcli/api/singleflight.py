@@ -0,0 +1,76 @@
+"""Single-flight calls: concurrent calls for the same key share one call and
+its result, e.g. one request for many threads fetching the same page
+"""
+
+import sys
+import threading
+
+
+class _Flight(object):
+    """A call in progress, and its outcome once done"""
+
+    __slots__ = ('done', 'result', 'exc_info')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """Runs one call at a time per key. Callers for a key while a call for
+    it is in progress wait for that call and get its result, or its
+    exception raised again. Nothing is cached once the call is done
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
+
+    def do(self, key, func, *args):
+        """Call func(*args) unless a call for key is in progress, otherwise
+        wait for that call
+
+        Args:
+            key (hashable): key of the call, e.g. a url
+            func (callable): the call
+            *args: arguments of func
+
+        Returns:
+            object: return value of func, shared by all waiting callers
+
+        Raises:
+            Exception: any exception raised by func
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+        else:
+            try:
+                flight.result = func(*args)
+            except BaseException:
+                flight.exc_info = sys.exc_info()
+            finally:
+                with self._lock:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+                flight.done.set()
+        if flight.exc_info is not None:
+            raise flight.exc_info[0], flight.exc_info[1], flight.exc_info[2]
+        return flight.result
+
+    def detach(self):
+        """Make calls from now on start new flights instead of waiting for
+        the ones in progress, e.g. after a write their results may not
+        reflect. Callers already waiting still get those results
+        """
+        with self._lock:
+            self._flights.clear()
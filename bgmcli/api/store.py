@@ -0,0 +1,315 @@
+"""Snapshot store of subject collections, indexed by subject id and read
+through mmap, so that one collection can be loaded without reading the
+rest of a large library
+
+Records are encoded as in bgmcli.api.codec, sharing one string table.
+
+Layout::
+
+    header: magic "BGMS", format version, number of collections, offsets
+        of the string table and of the index
+    records: for each collection, the index of its class name and its
+        encoded dict, then its encoded summary
+    string table: count, offsets of the strings, then the strings in utf-8
+    index: one fixed size entry per collection, sorted by subject id, with
+        the string index of the subject id and offsets and lengths of the
+        record and of the summary
+
+Opening a store only reads the header. Strings and index entries are read
+on demand, so lookups take O(log n) reads of the mapped file.
+"""
+
+import io
+import os
+import mmap
+import struct
+from .codec import StringTable, write_varint, read_varint, encode_value,\
+    decode_value, get_class
+
+
+MAGIC = b'BGMS'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct(b'<4sB3xIQQ')
+_OFFSET = struct.Struct(b'<Q')
+_COUNT = struct.Struct(b'<I')
+_ENTRY = struct.Struct(b'<IQIQI')
+
+
+def _get_summary(data):
+    """Get summary fields from to_dict of a subject collection"""
+    subject = data['subject']
+    return {'sub_id': subject['id_'], 'title': subject['title'],
+            'ch_title': subject['ch_title'], 'n_eps': subject.get('n_eps'),
+            'c_status': data['c_status'], 'rating': data['rating'],
+            'n_watched_eps': data.get('n_watched_eps')}
+
+
+class SnapshotStoreWriter(object):
+    """Writes subject collections to a snapshot store. The file is written
+    to a temporary path and moved into place on close, so readers never see
+    a partial store. Closing as incomplete discards it, keeping the store
+    already in place.
+
+    It has the interface of the sinks in bgmcli.api.pipeline, so it can be
+    the sink of a Pipeline.
+
+    Args:
+        path (str or unicode): path of the store, replaced if it exists
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._tmp_path = path + '.tmp'
+        self._file = io.open(self._tmp_path, 'wb')
+        self._file.write(b'\0' * _HEADER.size)
+        self._offset = _HEADER.size
+        self._strings = StringTable()
+        # sub_id -> (record offset, record length, summary offset,
+        # summary length), so a subject written again replaces the entry
+        self._entries = {}
+
+    def write(self, sub_coll):
+        """Write a subject collection
+
+        Args:
+            sub_coll (BangumiSubjectCollection): the collection
+        """
+        data = sub_coll.to_dict()
+        buf = bytearray()
+        write_varint(buf, self._strings.index(type(sub_coll).__name__))
+        encode_value(buf, data, self._strings)
+        record_length = len(buf)
+        encode_value(buf, _get_summary(data), self._strings)
+        self._entries[sub_coll.subject.id_] = (
+            self._offset, record_length, self._offset + record_length,
+            len(buf) - record_length)
+        self._file.write(buf)
+        self._offset += len(buf)
+
+    def close(self, complete=True):
+        """Write the string table and the index, and move the store into
+        place
+
+        Args:
+            complete (bool): False to discard the collections written,
+                e.g. when a Pipeline writing them was cancelled or failed
+        """
+        if not complete:
+            self._file.close()
+            os.remove(self._tmp_path)
+            return
+        entries = [(self._strings.index(sub_id),) + entry
+                   for sub_id, entry in sorted(self._entries.items())]
+        strings_offset = self._offset
+        encoded = [string.encode('utf-8') if isinstance(string, unicode)
+                   else string for string in self._strings.strings]
+        self._file.write(_COUNT.pack(len(encoded)))
+        offset = 0
+        for string in encoded:
+            self._file.write(_OFFSET.pack(offset))
+            offset += len(string)
+        self._file.write(_OFFSET.pack(offset))
+        self._file.write(b''.join(encoded))
+        index_offset = (strings_offset + _COUNT.size +
+                        _OFFSET.size * (len(encoded) + 1) + offset)
+        for entry in entries:
+            self._file.write(_ENTRY.pack(*entry))
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(entries),
+                                      strings_offset, index_offset))
+        self._file.close()
+        if os.path.exists(self._path):
+            os.remove(self._path)
+        os.rename(self._tmp_path, self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(exc_type is None)
+
+
+def write_snapshot_store(path, sub_colls):
+    """Write subject collections to a snapshot store
+
+    Args:
+        path (str or unicode): path of the store, replaced if it exists
+        sub_colls (iterable[BangumiSubjectCollection]): the collections
+    """
+    with SnapshotStoreWriter(path) as writer:
+        for sub_coll in sub_colls:
+            writer.write(sub_coll)
+
+
+class _MappedStrings(object):
+    """String table of a mapped store, decoding strings on first access"""
+
+    def __init__(self, data, offset):
+        self._data = data
+        self._count = _COUNT.unpack_from(data, offset)[0]
+        self._offsets_offset = offset + _COUNT.size
+        self._blob_offset = (self._offsets_offset +
+                             _OFFSET.size * (self._count + 1))
+        self._cache = {}
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        string = self._cache.get(index)
+        if string is None:
+            if not 0 <= index < self._count:
+                raise IndexError(index)
+            start, end = struct.unpack_from(
+                b'<QQ', self._data, self._offsets_offset +
+                _OFFSET.size * index)
+            string = self._data[self._blob_offset + start:
+                                self._blob_offset + end].decode('utf-8')
+            self._cache[index] = string
+        return string
+
+
+class SnapshotStore(object):
+    """Read-only snapshot store opened with mmap
+
+    Args:
+        path (str or unicode): path of the store
+
+    Raises:
+        ValueError: if the file is not a snapshot store
+    """
+
+    def __init__(self, path):
+        with io.open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._data) < _HEADER.size:
+                raise ValueError("Not a snapshot store")
+            magic, version, self._n_entries, strings_offset, \
+                self._index_offset = _HEADER.unpack_from(self._data, 0)
+            if magic != MAGIC:
+                raise ValueError("Not a snapshot store")
+            if version != FORMAT_VERSION:
+                raise ValueError("Unsupported format version {0}"
+                                 .format(version))
+            self._strings = _MappedStrings(self._data, strings_offset)
+        except (ValueError, struct.error):
+            self._data.close()
+            raise
+
+    def __len__(self):
+        return self._n_entries
+
+    def __contains__(self, sub_id):
+        return self._find(sub_id) is not None
+
+    def __iter__(self):
+        return self.iter_sub_ids()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Unmap the file"""
+        self._data.close()
+
+    def get(self, sub_id):
+        """Load the collection of one subject, without reading others
+
+        Args:
+            sub_id (str or unicode): subject id
+
+        Returns:
+            BangumiSubjectCollection: the collection
+
+        Raises:
+            KeyError: if there is no collection for sub_id
+        """
+        entry = self._find(sub_id)
+        if entry is None:
+            raise KeyError(sub_id)
+        return self._load_record(entry[1], entry[2])
+
+    def get_summary(self, sub_id):
+        """Get summary fields of the collection of one subject
+
+        Args:
+            sub_id (str or unicode): subject id
+
+        Returns:
+            dict: with keys "sub_id", "title", "ch_title", "n_eps",
+                "c_status", "rating" and "n_watched_eps"
+
+        Raises:
+            KeyError: if there is no collection for sub_id
+        """
+        entry = self._find(sub_id)
+        if entry is None:
+            raise KeyError(sub_id)
+        return self._load_summary(entry[3], entry[4])
+
+    def iter_sub_ids(self):
+        """Iterate over subject ids in the store, in sorted order
+
+        Yields:
+            unicode: subject id
+        """
+        for i in xrange(self._n_entries):
+            yield self._strings[self._entry(i)[0]]
+
+    def iter_summaries(self):
+        """Iterate over summary fields of all collections, without decoding
+        the collections, in order of subject id
+
+        Yields:
+            dict: summary, see get_summary
+        """
+        for i in xrange(self._n_entries):
+            entry = self._entry(i)
+            yield self._load_summary(entry[3], entry[4])
+
+    def iter_collections(self):
+        """Iterate over all collections in order of subject id, loading one
+        at a time
+
+        Yields:
+            BangumiSubjectCollection: the collection
+        """
+        for i in xrange(self._n_entries):
+            entry = self._entry(i)
+            yield self._load_record(entry[1], entry[2])
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._data,
+                                  self._index_offset + _ENTRY.size * i)
+
+    def _find(self, sub_id):
+        """Binary search of the index for sub_id"""
+        sub_id = sub_id.decode('utf-8') if isinstance(sub_id, str) \
+            else sub_id
+        low, high = 0, self._n_entries
+        while low < high:
+            mid = (low + high) // 2
+            entry = self._entry(mid)
+            mid_id = self._strings[entry[0]]
+            if mid_id == sub_id:
+                return entry
+            if mid_id < sub_id:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def _load_record(self, offset, length):
+        data = bytearray(self._data[offset:offset + length])
+        name, pos = read_varint(data, 0)
+        value = decode_value(data, pos, self._strings)[0]
+        return get_class(self._strings[name]).from_dict(value)
+
+    def _load_summary(self, offset, length):
+        data = bytearray(self._data[offset:offset + length])
+        return decode_value(data, 0, self._strings)[0]
@@ -37,6 +37,19 @@ def get_encoding_from_html(html):
         return ""
 
 
+def decode_html(content):
+    """Decode raw html with the encoding it declares, utf-8 if it does not
+    
+    Args:
+        content (str): raw html
+        
+    Returns:
+        unicode: decoded html
+    """
+    encoding = get_encoding_from_html(content) or 'utf-8'
+    return content.decode(encoding, 'replace')
+
+
 def get_checked_values(soup):
     """Get the values for checked input tags
     
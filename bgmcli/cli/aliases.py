@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache of pinyin aliases for Chinese titles
+"""
+
+from __future__ import unicode_literals
+import os
+import io
+import json
+from bgmcli.api.utils import to_unicode
+
+
+ALIAS_CACHE_FILE_NAME = '.bgmcli-pinyin-cache'
+
+
+def get_alias_cache_path():
+    """Get the path of the alias cache file, "~/.bgmcli-pinyin-cache"
+
+    Returns:
+        str or unicode: path of the alias cache file
+    """
+    return os.path.join(os.path.expanduser('~'), ALIAS_CACHE_FILE_NAME)
+
+
+class PinyinAliasCache(object):
+    """Memoizes pinyin aliases of titles in a file. The pinyin engine, which
+    loads its whole dictionary, is only created when a title missing from
+    the cache shows up.
+
+    Aliases shorter than _MIN_ALIAS_LEN, e.g. initials of two character
+    titles, are left out, as they are aliases of many titles and are turned
+    into corrections of ordinary words typed.
+
+    Args:
+        path (str or unicode): path of the cache file, defaults to
+            "~/.bgmcli-pinyin-cache"
+    """
+
+    _MIN_ALIAS_LEN = 3
+
+    def __init__(self, path=None):
+        self._path = path or get_alias_cache_path()
+        self._pinyin = None
+        self._dirty = False
+        try:
+            with io.open(self._path, encoding='utf-8') as f:
+                self._aliases = json.load(f)
+            if not isinstance(self._aliases, dict):
+                raise ValueError("Corrupted alias cache")
+        except (IOError, ValueError):
+            self._aliases = {}
+
+    def get_aliases(self, title):
+        """Get pinyin aliases for title, i.e. full pinyin and pinyin initials
+        in lower case, e.g. ['xingjiniuzi', 'xjnz'] for '星际牛仔'
+
+        Args:
+            title (unicode): title to get aliases for
+
+        Returns:
+            list[unicode]: aliases of the title, without duplicates
+        """
+        if title not in self._aliases:
+            self._aliases[title] = self._compute_aliases(title)
+            self._dirty = True
+        # also drops short aliases cached by earlier versions
+        return [alias for alias in self._aliases[title]
+                if len(alias) >= self._MIN_ALIAS_LEN]
+
+    def save(self):
+        """Write the cache to file if new titles were added"""
+        if not self._dirty:
+            return
+        tmp_path = self._path + '.tmp'
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(to_unicode(json.dumps(self._aliases, ensure_ascii=False)))
+        os.rename(tmp_path, self._path)
+        self._dirty = False
+
+    def _compute_aliases(self, title):
+        if self._pinyin is None:
+            from xpinyin import Pinyin
+            self._pinyin = Pinyin()
+        aliases = []
+        for alias in (self._pinyin.get_pinyin(title, ''),
+                      self._pinyin.get_initials(title, '').lower()):
+            if (alias != title and alias not in aliases and
+                    len(alias) >= self._MIN_ALIAS_LEN):
+                aliases.append(alias)
+        return aliases
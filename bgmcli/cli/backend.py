@@ -2,10 +2,18 @@
 
 from __future__ import unicode_literals
 import re
+import threading
 from prompt_toolkit.key_binding.manager import KeyBindingManager
-from xpinyin import Pinyin
-from bgmcli.api import BangumiSession
-from .command_executor import CommandExecutorIndex
+from bgmcli.api import BangumiSession, RateLimiter
+from bgmcli.api.exception import SessionExpiredError
+from bgmcli.api.collection import BangumiDummySubjectCollection
+from .command_executor import CommandExecutorIndex, match_collection
+from .snapshot import load_snapshot, save_snapshot
+from .aliases import PinyinAliasCache
+from .title_index import TitleIndex, TitleCompleter
+from .matcher import SubjectMatcher
+from .prefetch import CollectionPrefetcher
+from .exception import CommandError
 
 
 key_bindings_manager = KeyBindingManager()
@@ -34,52 +42,170 @@ def _(event):
 
 class CLIBackend(object):
     """Backend for CLI, takes and parses command from CLI, and proxies calls
-    to and results from API
+    to and results from API.
+
+    The backend starts from the local snapshot of the last known collections
+    if there is one, while login and refreshing of collections run in a
+    background thread. Commands wait for login to finish, and raise
+    CommandError if it failed. Refreshed collections are merged in when they
+    are available. After login, regular
+    collections for all watching subjects are loaded in background, in the
+    order of the list, i.e. most recently updated first.
     
     Args:
         email (str or unicode): email address for login
         password (str or unicode) password for login
+        snapshot_path (str or unicode): path of the snapshot file, defaults
+            to "~/.bgmcli-snapshot"
+        alias_cache_path (str or unicode): path of the pinyin alias cache
+            file, defaults to "~/.bgmcli-pinyin-cache"
     """
     
     _VALID_COMMANDS = CommandExecutorIndex.valid_commands
+    _MAX_REQUEST_RATE = 10
+    # seconds episode commands on the same subject are combined within
+    _COALESCE_WINDOW = 0.5
+    # seconds close waits at most for background loading and login
+    _CLOSE_TIMEOUT = 5
 #     ['kandao', 'kanguo', 'xiangkan', 'paoqi', 'chexiao',
 #                        'watched-up-to', 'watched', 'drop', 'want-to-watch',
 #                        'remove', 'ls-watching', 'ls-zaikan', 'ls-eps', 'undo']
     
-    def __init__(self, email, password):
-        self._session = BangumiSession(email, password)
-        self._colls = self._session.get_dummy_collections('anime', 3)
-        # add pinyin to valid titles and setup auto correction behaviors
-        pinyin = Pinyin()
-        for coll in self._colls:
-            if not coll.subject.ch_title:
-                continue
-            pinyin_title = pinyin.get_pinyin(coll.subject.ch_title, '')
-            if not coll.subject.other_info.get('aliases'):
-                coll.subject.other_info['aliases'] = [pinyin_title]
-            else:
-                coll.subject.other_info['aliases'].append(pinyin_title)
-            corrections.update({pinyin_title: coll.subject.ch_title})
-
-        self._titles = set()
-        self._update_titles()
+    def __init__(self, email, password, snapshot_path=None,
+                 alias_cache_path=None):
+        self._email = email
+        self._password = password
+        self._snapshot_path = snapshot_path
+        self._alias_cache_path = alias_cache_path
+        self._session = None
+        self._error = None
+        self._login_error = None
+        self._lock = threading.RLock()
+        # number of logins renewed, to login again once per expiry
+        self._n_logins = 0
+        self._relogin_lock = threading.Lock()
+        self._logged_in = threading.Event()
+        self._refreshed = threading.Event()
+
+        self._user_id, self._colls = load_snapshot(email, snapshot_path)
+        # indexes are built in background, see _refresh
+        self._titles = TitleIndex()
+        self._matcher = SubjectMatcher()
+        self._update_corrections(self._colls)
+        self._prefetcher = CollectionPrefetcher(self._swap_collection)
+
+        self._refresher = threading.Thread(target=self._refresh,
+                                           name='bgmcli-refresh')
+        self._refresher.daemon = True
+        self._refresher.start()
+        if self._user_id is None:
+            # nothing to show before login without a snapshot
+            self._wait_for_session()
     
     def execute_command(self, command):
-        """Execute given command
+        """Execute given command. If the login has expired, login again and
+        execute it once more.
+
+        Changes of episodes are queued and sent together with changes of the
+        same subject made within _COALESCE_WINDOW seconds, so the command
+        returns without waiting for them. Changes that failed to be sent by
+        then are reported by the next command, once it is executed
         
         Args:
             command (unicode): command from user interface
             
         Raises:
             InvalidCommandError: if command head is not valid
+            CommandError: if changes of episodes queued by earlier commands
+                were not saved on Bangumi
         """
         if not command or not command.strip():
             return
-        parsed = self._parse_command(command)
-        executor = (CommandExecutorIndex
-                    .get_command_executor(parsed[0])(parsed, self._colls))
-        executor.execute()
-        self._update_titles()
+        self._wait_for_titles()
+        with self._lock:
+            saved = self._check_writes()
+            parsed = self._parse_command(command)
+            executor_class = CommandExecutorIndex.get_command_executor(
+                parsed[0])
+            executor = executor_class(parsed, self._colls, self._matcher,
+                                      self._prefetcher)
+            # commands are idempotent, safe to run again. Changes queued
+            # before the expiry are kept and sent again as well
+            self.run_with_relogin(executor.execute)
+            self._update_titles()
+        if not saved:
+            raise CommandError("Some changes of earlier commands were not "
+                               "saved on Bangumi, please run them again")
+
+    def run_with_relogin(self, func):
+        """Call func, and if the login has expired, login again and call it
+        once more. The login is renewed once for all threads that found it
+        expired at the same time
+        
+        Args:
+            func (callable): called without arguments, should be safe to
+                call again, e.g. only set absolute values
+            
+        Returns:
+            object: return value of func
+        """
+        n_logins = self._n_logins
+        try:
+            return func()
+        except SessionExpiredError:
+            self._relogin(n_logins)
+            return func()
+    
+    def parse_command(self, command):
+        """Split command into command head, subject title, and other
+        trailing information, without executing it
+        
+        Args:
+            command (unicode): command from user interface
+            
+        Returns:
+            list[unicode]: parsed command
+        """
+        self._wait_for_titles()
+        with self._lock:
+            return self._parse_command(command)
+
+    def find_collection(self, name, strict=False):
+        """Get the collection of the subject matching name
+        
+        Args:
+            name (unicode): subject name
+            strict (bool): refuse ambiguous names, see match_collection
+            
+        Returns:
+            BangumiSubjectCollection: collection of the subject, which may be
+                dummy, see get_regular_collection
+            
+        Raises:
+            InvalidCommandError: if subject not found, or ambiguous for
+                strict matching
+        """
+        self._wait_for_titles()
+        with self._lock:
+            return match_collection(self._colls, name, self._matcher, strict)
+
+    def get_regular_collection(self, coll):
+        """Get the regular collection for a collection found with
+        find_collection. Safe to be called from several threads, as the
+        collection is loaded without holding the lock of the backend
+        
+        Args:
+            coll (BangumiSubjectCollection): collection of a subject
+            
+        Returns:
+            BangumiSubjectCollection: regular collection, coll itself if it is
+                not dummy
+        """
+        if not isinstance(coll, BangumiDummySubjectCollection):
+            return coll
+        regular_coll = self._prefetcher.get_regular(coll)
+        self._swap_collection(coll, regular_coll)
+        return regular_coll
     
     def get_user_id(self):
         """Get the user id for current user
@@ -87,7 +213,9 @@ class CLIBackend(object):
         Returns:
             str or unicode: user id
         """
-        return self._session.user_id
+        if self._user_id is None:
+            self._wait_for_session()
+        return self._user_id
     
     def get_completion_list(self):
         """Get the list of names for auto completion
@@ -95,7 +223,18 @@ class CLIBackend(object):
         Returns:
             list[unicode]: commands and titles
         """
-        return self._VALID_COMMANDS + list(self._titles)
+        with self._lock:
+            return self._VALID_COMMANDS + list(self._titles)
+
+    def get_completer(self):
+        """Get completer for commands and titles, which stays up to date with
+        titles after commands and refresh
+        
+        Returns:
+            TitleCompleter: completer for prompt_toolkit
+        """
+        return TitleCompleter(self._VALID_COMMANDS, lambda: self._titles,
+                              lambda: self._matcher)
     
     def get_valid_commands(self):
         """Get valid command head
@@ -105,10 +244,36 @@ class CLIBackend(object):
         """
         return tuple(self._VALID_COMMANDS)
     
+    def wait_for_refresh(self, timeout=None):
+        """Block until login and refreshing of collections finished
+        
+        Args:
+            timeout (float): seconds to wait at most, None for no limit
+            
+        Returns:
+            bool: True if refresh finished, False if timed out
+        """
+        self._refreshed.wait(timeout)
+        return self._refreshed.is_set()
+    
     def close(self):
-        """Close the session
+        """Send changes of episodes still queued and close the session.
+        Background loading and login are waited for at most _CLOSE_TIMEOUT
+        seconds each, and left to be stopped on exit otherwise
+
+        Returns:
+            bool: True if all changes queued were saved on Bangumi
         """
-        self._session.logout()
+        self._prefetcher.close(self._CLOSE_TIMEOUT)
+        self._refresher.join(self._CLOSE_TIMEOUT)
+        if self._session is None:
+            return True
+        try:
+            saved = self._check_writes()
+            return (self.run_with_relogin(self._session.wait_for_writes) and
+                    saved)
+        finally:
+            self._session.logout()
         
     def _parse_command(self, command):
         """Parses the command and split it up into command head, subject
@@ -119,26 +284,199 @@ class CLIBackend(object):
             return splitted
         else:
             head, tail = splitted
-            iterator = re.finditer('\s+', tail, flags=re.UNICODE)
-            pos = [i.start() for i in iterator]
-            # reverse to matched longest name first
-            pos.reverse()
-            for idx in pos:
-                if tail[:idx] in self._titles:
-                    if tail[idx:].strip():
-                        return [head, tail[:idx], tail[idx:].strip()]
-                    else:
-                        return [head, tail[:idx]]
-            return [head, tail.strip()]
+            title = self._titles.longest_prefix(tail)
+            if title == tail:
+                # exact title, even if it ends with what looks like an episode
+                return [head, title]
+            if title is not None and tail[len(title):].strip():
+                return [head, title, tail[len(title):].strip()]
+            # no exact title, split off trailing episode if the rest is a
+            # closer match to a subject name
+            tail = tail.strip()
+            splitted_tail = tail.rsplit(None, 1)
+            if (len(splitted_tail) == 2 and
+                    re.match('^[a-zA-Z]*[0-9]+$', splitted_tail[1]) and
+                    self._match_score(splitted_tail[0]) >
+                    self._match_score(tail)):
+                return [head] + splitted_tail
+            return [head, tail]
+
+    def _match_score(self, name):
+        """Get score of the best subject name matching name
+        """
+        matches = self._matcher.match(name, 1)
+        return matches[0][2] if matches else 0
         
     
     def _update_titles(self):
         """update valid titles
         """
-        for coll in self._colls:
+        self._add_titles(self._titles, self._matcher, self._colls)
+
+    def _rebuild_titles(self):
+        """Build new title indexes for current collections and swap them in,
+        as completer may be reading the current ones
+        """
+        with self._lock:
+            colls = list(self._colls)
+        titles, matcher = TitleIndex(), SubjectMatcher()
+        self._add_titles(titles, matcher, colls)
+        with self._lock:
+            self._titles, self._matcher = titles, matcher
+            # catch up with collections changed by commands meanwhile
+            self._update_titles()
+
+    @staticmethod
+    def _add_titles(titles, matcher, colls):
+        """Insert titles and aliases of subjects in colls into titles and
+        matcher
+        """
+        for coll in colls:
             sub = coll.subject
             names = ([sub.title, sub.ch_title] +
                      sub.other_info.get('aliases', []))
             for name in names:
-                if name and name not in self._titles:
-                    self._titles.add(name)
\ No newline at end of file
+                if name and name not in titles:
+                    titles.add(name)
+            matcher.add(sub.id_, names)
+
+    def _refresh(self):
+        """Login and fetch collections, runs in background thread
+        """
+        try:
+            self._rebuild_titles()
+            session = self._login()
+            with self._lock:
+                self._session = session
+                self._user_id = session.user_id
+                for coll in self._colls:
+                    coll.session = session
+                self._prefetcher.prefetch(self._colls)
+            self._logged_in.set()
+            colls = session.get_dummy_collections('anime', 3)
+            self._add_pinyin_aliases(colls)
+            self._merge_collections(colls)
+            with self._lock:
+                self._prefetcher.prefetch(self._colls)
+            save_snapshot(self._email, session.user_id, colls,
+                          self._snapshot_path)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._logged_in.set()
+            self._refreshed.set()
+
+    def _login(self):
+        """Login in background thread, recording the error if it failed
+        """
+        try:
+            return BangumiSession(
+                self._email, self._password,
+                rate_limiter=RateLimiter(self._MAX_REQUEST_RATE,
+                                         self._MAX_REQUEST_RATE),
+                coalesce_window=self._COALESCE_WINDOW)
+        except Exception as e:
+            self._login_error = e
+            raise
+
+    def _relogin(self, n_logins):
+        """Login again unless another thread did since n_logins
+        """
+        with self._relogin_lock:
+            if self._n_logins == n_logins:
+                self._session.relogin(self._password)
+                self._n_logins += 1
+
+    def _check_writes(self):
+        """Check changes of episodes sent since the last command, logging in
+        again to send the ones failed as the login expired
+
+        Returns:
+            bool: True if all of them were saved on Bangumi
+        """
+        if self._session is None:
+            return True
+        n_logins = self._n_logins
+        try:
+            return self._session.check_writes()
+        except SessionExpiredError:
+            self._relogin(n_logins)
+            return self._session.wait_for_writes()
+
+    def _wait_for_session(self):
+        """Block until login finished
+        
+        Raises:
+            CommandError: if login failed
+        """
+        self._wait(self._logged_in)
+        if self._session is None:
+            error = self._login_error or self._error
+            raise CommandError("Failed to login to Bangumi, please check the "
+                               "network and the account in config: {0}"
+                               .format(getattr(error, 'message', None) or
+                                       repr(error)))
+
+    def _wait_for_titles(self):
+        """Block until there are titles to parse commands with
+        """
+        self._wait_for_session()
+        if not self._colls:
+            # no snapshot, titles are only known after refresh
+            self._wait(self._refreshed)
+
+    @staticmethod
+    def _wait(event):
+        """Wait for event with timeout so that KeyboardInterrupt is not
+        blocked
+        """
+        while not event.wait(0.1):
+            pass
+
+    def _merge_collections(self, colls):
+        """Replace current collections with refreshed ones, keeping regular
+        collections that have been loaded by commands
+        """
+        with self._lock:
+            regular_colls = {coll.subject.id_: coll for coll in self._colls
+                             if not isinstance(coll,
+                                               BangumiDummySubjectCollection)}
+            self._colls[:] = [regular_colls.get(coll.subject.id_, coll)
+                              for coll in colls]
+            self._update_corrections(self._colls)
+        self._rebuild_titles()
+
+    def _swap_collection(self, dummy_coll, regular_coll):
+        """Replace dummy collection of the same subject with the regular
+        collection loaded in background
+        """
+        with self._lock:
+            for idx, coll in enumerate(self._colls):
+                if (coll.subject.id_ == dummy_coll.subject.id_ and
+                        isinstance(coll, BangumiDummySubjectCollection)):
+                    self._colls[idx] = regular_coll
+                    return
+
+    def _add_pinyin_aliases(self, colls):
+        """Add pinyin and pinyin initials of Chinese titles to aliases of
+        subjects
+        """
+        alias_cache = PinyinAliasCache(self._alias_cache_path)
+        for coll in colls:
+            if not coll.subject.ch_title:
+                continue
+            aliases = coll.subject.other_info.setdefault('aliases', [])
+            aliases.extend(alias for alias
+                           in alias_cache.get_aliases(coll.subject.ch_title)
+                           if alias not in aliases)
+        alias_cache.save()
+
+    @staticmethod
+    def _update_corrections(colls):
+        """Setup auto correction from aliases to Chinese titles
+        """
+        for coll in colls:
+            if not coll.subject.ch_title:
+                continue
+            for alias in coll.subject.other_info.get('aliases', []):
+                corrections.update({alias: coll.subject.ch_title})
\ No newline at end of file
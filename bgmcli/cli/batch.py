@@ -0,0 +1,271 @@
+"""Non-interactive execution of commands read from a file, used by
+"bgmcli --batch"
+"""
+
+from __future__ import unicode_literals
+import time
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from bgmcli.api.utils import get_ep_colls_up_to_this
+from .command_executor import (CommandExecutorIndex, WatchedCommandExecutor,
+                               WatchedUpToCommandExecutor)
+from .exception import InvalidCommandError
+
+
+class BatchCommand(object):
+    """A command in a batch and its outcome
+
+    Attributes:
+        line_no (int): line number of the command in the batch, from 1
+        text (unicode): the command as read
+        parsed (list[unicode]): the parsed command, None if parsing failed
+        error (Exception): error of the command, None if it succeeded
+        latency (float): seconds from the start of the batch until the
+            command finished
+    """
+
+    __slots__ = ('line_no', 'text', 'parsed', 'error', 'latency')
+
+    def __init__(self, line_no, text):
+        self.line_no = line_no
+        self.text = text
+        self.parsed = None
+        self.error = None
+        self.latency = None
+
+    @property
+    def succeeded(self):
+        """bool: True if the command finished without error"""
+        return self.latency is not None and self.error is None
+
+
+class BatchReport(object):
+    """Outcome of a batch
+
+    Args:
+        commands (list[BatchCommand]): commands in the batch
+        n_writes (int): number of write requests sent to Bangumi
+        elapsed (float): seconds the batch took
+    """
+
+    def __init__(self, commands, n_writes, elapsed):
+        self.commands = commands
+        self.n_writes = n_writes
+        self.elapsed = elapsed
+
+    @property
+    def failed(self):
+        """list[BatchCommand]: commands that failed"""
+        return [command for command in self.commands
+                if not command.succeeded]
+
+    def format_summary(self):
+        """Get the summary of the batch to show to user, including errors of
+        failed commands, counts and latencies
+
+        Returns:
+            unicode: the summary
+        """
+        lines = []
+        for command in self.failed:
+            lines.append('line {0}: {1}: {2}'.format(
+                command.line_no, command.text,
+                getattr(command.error, 'message', None) or command.error))
+        n_failed = len(self.failed)
+        lines.append('{0} commands: {1} succeeded, {2} failed, {3} write '
+                     'requests'.format(len(self.commands),
+                                       len(self.commands) - n_failed,
+                                       n_failed, self.n_writes))
+        latencies = sorted(command.latency for command in self.commands
+                           if command.latency is not None)
+        if latencies:
+            lines.append('latency: min {0:.0f}ms, median {1:.0f}ms, '
+                         'max {2:.0f}ms'.format(
+                             latencies[0] * 1000,
+                             latencies[len(latencies) // 2] * 1000,
+                             latencies[-1] * 1000))
+        lines.append('total: {0:.2f}s'.format(self.elapsed))
+        return '\n'.join(lines)
+
+
+class _SubjectGroup(object):
+    __slots__ = ('coll', 'commands')
+
+    def __init__(self, coll):
+        self.coll = coll
+        self.commands = []
+
+
+class BatchRunner(object):
+    """Runs a batch of commands with a CLIBackend, in the order of the
+    batch.
+
+    Adjacent commands marking subjects or episodes as watched are grouped
+    by subject, and the groups run concurrently in a pool of threads, as
+    marking as watched gives the same result in any order. Within a group,
+    commands are coalesced: all episodes they mark as watched are sent in a
+    single request, followed by a single request for the subject status if
+    the subject is marked as watched. Episodes already watched are not sent
+    again. Other commands run one by one, once the commands before them are
+    done. Requests are sent through the backend, which logs in again if the
+    login expired.
+
+    Args:
+        backend (CLIBackend): the backend to run commands with
+        n_workers (int): number of subjects updated concurrently
+    """
+
+    _WATCHED_COMMANDS = WatchedCommandExecutor._VALID_COMMANDS
+    _WATCHED_UP_TO_COMMANDS = WatchedUpToCommandExecutor._VALID_COMMANDS
+
+    def __init__(self, backend, n_workers=8):
+        self._backend = backend
+        self._n_workers = n_workers
+        self._start = None
+        self._n_writes = 0
+        self._lock = threading.Lock()
+
+    def run(self, lines):
+        """Run commands in lines
+
+        Args:
+            lines (iterable[unicode]): commands, one per line. Empty lines and
+                lines starting with "#" are skipped
+
+        Returns:
+            BatchReport: outcome of the batch
+        """
+        self._start = time.time()
+        self._n_writes = 0
+        commands = []
+        for line_no, line in enumerate(lines, 1):
+            text = line.strip()
+            if text and not text.startswith('#'):
+                commands.append(BatchCommand(line_no, text))
+
+        groups = OrderedDict()
+        for command in commands:
+            try:
+                coll = self._parse(command)
+            except Exception as e:
+                command.error = e
+                self._finish(command)
+                continue
+            if coll is None:
+                # watched commands before it are done first
+                self._run_groups(list(groups.values()))
+                groups.clear()
+                try:
+                    self._backend.execute_command(command.text)
+                except Exception as e:
+                    command.error = e
+                self._finish(command)
+                continue
+            group = groups.get(coll.subject.id_)
+            if group is None:
+                group = groups[coll.subject.id_] = _SubjectGroup(coll)
+            group.commands.append(command)
+        self._run_groups(list(groups.values()))
+        return BatchReport(commands, self._n_writes,
+                           time.time() - self._start)
+
+    def _parse(self, command):
+        """Parse a command, and find the collection of its subject if it is
+        to be grouped
+
+        Returns:
+            BangumiSubjectCollection: collection of the subject of a command
+                marking as watched, None for other commands
+        """
+        command.parsed = self._backend.parse_command(command.text)
+        executor_class = CommandExecutorIndex.get_command_executor(
+            command.parsed[0])
+        # validates number of arguments
+        executor_class(command.parsed, [])
+        if (command.parsed[0] not in self._WATCHED_COMMANDS and
+                command.parsed[0] not in self._WATCHED_UP_TO_COMMANDS):
+            return None
+        return self._backend.find_collection(command.parsed[1], strict=True)
+
+    def _run_groups(self, groups):
+        """Run groups of commands concurrently, returning once all are done
+        """
+        if not groups:
+            return
+        pool = ThreadPool(min(self._n_workers, len(groups)))
+        try:
+            pool.map(self._run_group, groups)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _run_group(self, group):
+        """Run coalesced commands on a subject, in a worker thread
+        """
+        try:
+            coll = self._backend.run_with_relogin(
+                lambda: self._backend.get_regular_collection(group.coll))
+        except Exception as e:
+            for command in group.commands:
+                command.error = e
+                self._finish(command)
+            return
+
+        ep_colls = set()
+        ep_commands = []
+        sub_commands = []
+        for command in group.commands:
+            if len(command.parsed) == 2:
+                sub_commands.append(command)
+                continue
+            try:
+                ep_coll = coll.find_ep_coll(command.parsed[2])
+            except AttributeError:
+                # malformed episode info
+                ep_coll = None
+            if not ep_coll:
+                command.error = InvalidCommandError(
+                    "Episode name {0} not found".format(command.parsed[2]))
+                self._finish(command)
+                continue
+            if command.parsed[0] in self._WATCHED_UP_TO_COMMANDS:
+                ep_colls.update(id(ep_c) for ep_c
+                                in get_ep_colls_up_to_this(ep_coll))
+            else:
+                ep_colls.add(id(ep_coll))
+            ep_commands.append(command)
+
+        to_watch = [ep_c for ep_c in coll.ep_collections
+                    if id(ep_c) in ep_colls and ep_c.c_status != 'watched']
+        if to_watch:
+            self._write(ep_commands,
+                        lambda: coll.watched_eps_with_sync(to_watch))
+        else:
+            for command in ep_commands:
+                self._finish(command)
+        if sub_commands:
+            self._write(sub_commands, lambda: self._set_sub_watched(coll))
+
+    @staticmethod
+    def _set_sub_watched(coll):
+        coll.c_status = 2
+        return coll.sync_collection()
+
+    def _write(self, commands, write):
+        """Send a write request for commands coalesced into it, and finish
+        them
+        """
+        with self._lock:
+            self._n_writes += 1
+        try:
+            if not self._backend.run_with_relogin(write):
+                raise InvalidCommandError("Update rejected by Bangumi")
+        except Exception as e:
+            for command in commands:
+                command.error = e
+        for command in commands:
+            self._finish(command)
+
+    def _finish(self, command):
+        command.latency = time.time() - self._start
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Thin client that sends a command to the bgmcli daemon over a Unix domain
+socket. It only imports the standard library, so it starts fast.
+
+Usage:
+    bgmc kandao 星际牛仔 EP3
+"""
+
+from __future__ import unicode_literals
+import os
+import sys
+import json
+import socket
+
+
+SOCKET_FILE_NAME = '.bgmcli.sock'
+
+
+def get_socket_path():
+    """Get the path of the socket of the daemon, "~/.bgmcli.sock"
+
+    Returns:
+        str or unicode: path of the socket
+    """
+    return os.path.join(os.path.expanduser('~'), SOCKET_FILE_NAME)
+
+
+def send_command(command, path=None):
+    """Send a command to the daemon and wait for its result
+
+    Args:
+        command (unicode): the command, as typed in the interactive prompt
+        path (str or unicode): path of the socket, defaults to
+            "~/.bgmcli.sock"
+
+    Returns:
+        tuple(bool, unicode): whether the command succeeded, and its output
+            or error message
+
+    Raises:
+        socket.error: if the daemon is not running
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or get_socket_path())
+        sock.sendall(command.replace('\n', ' ').encode('utf-8') + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    result = json.loads(b''.join(chunks).decode('utf-8'))
+    return result['ok'], result['output']
+
+
+def main():
+    """Entry point of the client, sends the command in arguments"""
+    encoding = sys.stdin.encoding or 'utf-8'
+    command = ' '.join(arg.decode(encoding) for arg in sys.argv[1:])
+    if not command.strip():
+        sys.stderr.write('usage: bgmc COMMAND\n')
+        sys.exit(2)
+    try:
+        ok, output = send_command(command)
+    except socket.error as e:
+        sys.stderr.write('Cannot connect to bgmcli daemon, start it with '
+                         '"bgmcli --daemon": {0}\n'.format(e))
+        sys.exit(2)
+    if output:
+        stream = sys.stdout if ok else sys.stderr
+        stream.write(output.encode('utf-8'))
+        if not output.endswith('\n'):
+            stream.write(b'\n')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
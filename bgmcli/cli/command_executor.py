@@ -2,7 +2,8 @@
 """
 
 from __future__ import unicode_literals
-from .exception import WrongCommandExcecutorError, InvalidCommandError
+from .exception import WrongCommandExcecutorError, InvalidCommandError,\
+    CommandError
 from bgmcli.api.collection import BangumiDummySubjectCollection
 from .utils import get_display_width, get_full_width_count, resolve_status
 
@@ -67,7 +68,7 @@ class BaseCommandExecutor(object):
     _MAX_COMMAND_LEN = 3
     _MIN_COMMAND_LEN = 1 
 
-    def __init__(self, parsed, collections):
+    def __init__(self, parsed, collections, matcher=None, prefetcher=None):
         if parsed[0] not in self._VALID_COMMANDS:
             raise WrongCommandExcecutorError("{0} does not support command {1}"
                                              .format(self.__class__.__name__,
@@ -75,11 +76,29 @@ class BaseCommandExecutor(object):
         self._parsed = parsed
         self._length = len(parsed)
         self._collections = collections
+        self._matcher = matcher
+        self._prefetcher = prefetcher
         self._validate_command()
         
     def execute(self):
         """Executes the command"""
         raise NotImplementedError
+
+    @staticmethod
+    def _wait_for_writes(colls):
+        """Send changes of episodes of colls still queued, for commands
+        reading their episodes
+
+        Raises:
+            CommandError: if changes of them queued earlier were not saved
+                on Bangumi
+        """
+        session = colls[0].session if colls else None
+        if session is None:
+            return
+        if not session.wait_for_writes(coll.subject.id_ for coll in colls):
+            raise CommandError("Some changes of episodes were not saved on "
+                               "Bangumi, please mark them again")
         
     def _validate_command(self):
         if (self._length < self._MIN_COMMAND_LEN or
@@ -90,24 +109,99 @@ class BaseCommandExecutor(object):
                                               self._length - 1))
 
 
+_MIN_MATCH_SCORE = 0.5
+# min lead of the best fuzzy match over the runner-up for strict matching
+_MIN_MATCH_MARGIN = 0.15
+
+
+def match_collection(collections, name, matcher=None, strict=False):
+    """Get subject collection that matches provided name. Subject names are
+    looked up with matcher if provided, which tolerates typos, and by exact
+    match on titles and aliases otherwise
+
+    Args:
+        collections (list[BangumiSubjectCollection]): collections to search
+        name (unicode): subject name
+        matcher (SubjectMatcher): index of names of subjects in collections
+        strict (bool): only accept a name matching a single subject exactly,
+            or a fuzzy match scoring clearly above the runner-up, e.g. for
+            commands that change collections
+
+    Returns:
+        BangumiSubjectCollection: the first subject collection that matches
+            provided name, which may be dummy
+
+    Raises:
+        InvalidCommandError: if not found, or ambiguous for strict matching
+    """
+    if matcher is None:
+        found = []
+        for coll in collections:
+            sub = coll.subject
+            names = ([sub.title, sub.ch_title] +
+                     sub.other_info.get('aliases', []))
+            if name in names:
+                found.append(coll)
+                if not strict:
+                    break
+        if len(found) > 1:
+            raise InvalidCommandError("Subject name {0} is ambiguous, did "
+                                      "you mean: {1}".format(name, ', '.join(
+                                          coll.subject.title
+                                          for coll in found)))
+        if found:
+            return found[0]
+        raise InvalidCommandError("Subject name {0} not found"
+                                  .format(name))
+
+    matches = matcher.match(name)
+    if matches and matches[0][2] >= _MIN_MATCH_SCORE:
+        score = matches[0][2]
+        runner_up_score = matches[1][2] if len(matches) > 1 else 0.0
+        # exact matches come first, so two of them are a tie
+        if strict and (runner_up_score == 1.0 or score < 1.0 and
+                       score - runner_up_score < _MIN_MATCH_MARGIN):
+            raise InvalidCommandError("Subject name {0} is ambiguous, did "
+                                      "you mean: {1}".format(name, ', '.join(
+                                          m[1] for m in matches)))
+        sub_id = matches[0][0]
+        for coll in collections:
+            if coll.subject.id_ == sub_id:
+                return coll
+    if matches:
+        raise InvalidCommandError("Subject name {0} not found, did you "
+                                  "mean: {1}".format(name, ', '.join(
+                                      m[1] for m in matches)))
+    raise InvalidCommandError("Subject name {0} not found".format(name))
+
+
 class SubjectCommandMixin(object):
+    """Mixin for commands on a subject. Subject names are looked up with
+    the SubjectMatcher if the executor has one, which tolerates typos, and
+    by exact match on titles and aliases otherwise. Commands that change
+    collections set _STRICT_MATCH, so that an ambiguous name is not taken
+    for the closest subject, see match_collection
+    """
+
+    _STRICT_MATCH = False
+
     def _find_collection(self, name):
         """Get subject collection that matches provided name
         
         Returns:
             BangumiSubjectCollection: the first subject collection that
-                matches provided name, None if not found
+                matches provided name
+                
+        Raises:
+            InvalidCommandError: if not found
         """
-        for coll in self._collections:
-            sub = coll.subject
-            names = ([sub.title, sub.ch_title] +
-                     sub.other_info.get('aliases', []))
-            if name in names:
-                return self._update_collection(coll)
-        raise InvalidCommandError("Subject name {0} not found".format(name))
+        return self._update_collection(
+            match_collection(self._collections, name, self._matcher,
+                             self._STRICT_MATCH))
     
     def _update_collection(self, coll):
-        """Transform collection to regular one if it's dummy.
+        """Transform collection to regular one if it's dummy, replacing it
+        in place so that the order of collections is kept
         
         Returns:
             BangumiSubjectCollection: transformed regular collection, self if
@@ -115,9 +209,11 @@ class SubjectCommandMixin(object):
         """
         if (isinstance(coll, BangumiDummySubjectCollection) and
             coll in self._collections):
-            new_coll = coll.to_regular_collection()
-            self._collections.remove(coll)
-            self._collections.append(new_coll)
+            if self._prefetcher is not None:
+                new_coll = self._prefetcher.get_regular(coll)
+            else:
+                new_coll = coll.to_regular_collection()
+            self._collections[self._collections.index(coll)] = new_coll
             return new_coll
         else:
             return coll
@@ -152,9 +248,12 @@ class WatchedCommandExecutor(BaseCommandExecutor, SubjectCommandMixin):
     _VALID_COMMANDS = ['watched', 'kanguo']
     _MAX_COMMAND_LEN = 3
     _MIN_COMMAND_LEN = 2 
+    _STRICT_MATCH = True
     
-    def __init__(self, parsed, collections):
-        super(WatchedCommandExecutor, self).__init__(parsed, collections)
+    def __init__(self, parsed, collections, matcher=None,
+                 prefetcher=None):
+        super(WatchedCommandExecutor, self).__init__(parsed, collections,
+                                                     matcher, prefetcher)
         
     def execute(self):
         """Executes the command, decide whether it is for episode or subject
@@ -181,9 +280,12 @@ class WatchedUpToCommandExecutor(BaseCommandExecutor, SubjectCommandMixin):
     _VALID_COMMANDS = ['watchedupto', 'kandao']
     _MAX_COMMAND_LEN = 3
     _MIN_COMMAND_LEN = 3
+    _STRICT_MATCH = True
     
-    def __init__(self, parsed, collections):
-        super(WatchedUpToCommandExecutor, self).__init__(parsed, collections)
+    def __init__(self, parsed, collections, matcher=None,
+                 prefetcher=None):
+        super(WatchedUpToCommandExecutor, self).__init__(parsed, collections,
+                                                         matcher, prefetcher)
         
     def execute(self):
         coll = self._find_collection(self._parsed[1])
@@ -202,8 +304,10 @@ class ListWatchingCommandExecutor(BaseCommandExecutor, ListCommandMixin):
     _MAX_COMMAND_LEN = 1
     _MIN_COMMAND_LEN = 1
     
-    def __init__(self, parsed, collections):
-        super(ListWatchingCommandExecutor, self).__init__(parsed, collections)
+    def __init__(self, parsed, collections, matcher=None,
+                 prefetcher=None):
+        super(ListWatchingCommandExecutor, self).__init__(parsed, collections,
+                                                          matcher, prefetcher)
         
     def execute(self):
         ch_titles = [coll.subject.ch_title if coll.subject.ch_title
@@ -220,11 +324,14 @@ class ListEpsCommandExecutor(BaseCommandExecutor, ListCommandMixin,
     _MAX_COMMAND_LEN = 2
     _MIN_COMMAND_LEN = 2
     
-    def __init__(self, parsed, collections):
-        super(ListEpsCommandExecutor, self).__init__(parsed, collections)
+    def __init__(self, parsed, collections, matcher=None,
+                 prefetcher=None):
+        super(ListEpsCommandExecutor, self).__init__(parsed, collections,
+                                                     matcher, prefetcher)
         
     def execute(self):
         coll = self._find_collection(self._parsed[1])
+        self._wait_for_writes([coll])
         statuses = [resolve_status(ep_coll.c_status, ep_coll.episode.status)
                     for ep_coll in coll.ep_collections]
         ep_type_nums = ['{0}{1}'.format(ep_coll.episode.ep_type, 
@@ -246,4 +353,100 @@ class ListEpsCommandExecutor(BaseCommandExecutor, ListCommandMixin,
                    'today': '\033[32m'}
 
         return mapping[status]
-        
\ No newline at end of file
+        
+
+class ProgressCommandExecutor(BaseCommandExecutor, ListCommandMixin):
+    """Command to show airing progress of all subjects marked as watching:
+    episodes watched, aired and in total, episodes aired but not watched,
+    and episodes airing today
+    """
+    _VALID_COMMANDS = ['progress', 'jindu']
+    _MAX_COMMAND_LEN = 1
+    _MIN_COMMAND_LEN = 1
+    _HEADER = ['title', 'watched/aired/eps', 'backlog', 'today']
+
+    def __init__(self, parsed, collections, matcher=None,
+                 prefetcher=None):
+        super(ProgressCommandExecutor, self).__init__(parsed, collections,
+                                                      matcher, prefetcher)
+
+    def execute(self):
+        if not self._collections:
+            return
+        session = self._collections[0].session
+        self._wait_for_writes(self._collections)
+        data = list(self._HEADER)
+        for progress in session.get_airing_progress(self._collections):
+            sub = progress.subject
+            data += [sub.ch_title if sub.ch_title else sub.title,
+                     '{0}/{1}/{2}'.format(progress.n_watched,
+                                          progress.n_aired, progress.n_eps),
+                     '{0}'.format(len(progress.backlog)),
+                     ','.join('EP{0}'.format(ep_c.episode.ep_num)
+                              for ep_c in progress.today)]
+        print self._produce_output(data, len(self._HEADER))
+
+
+class CatchUpCommandExecutor(BaseCommandExecutor, ListCommandMixin,
+                             SubjectCommandMixin):
+    """Command to mark all aired episodes as watched for a subject, or for
+    all subjects marked as watching if no subject is given. With
+    "--dry-run", episodes to be marked are listed without being marked
+    """
+    _VALID_COMMANDS = ['catchup', 'zhuijin']
+    _MAX_COMMAND_LEN = 3
+    _MIN_COMMAND_LEN = 1
+    _DRY_RUN_FLAG = '--dry-run'
+    _STRICT_MATCH = True
+
+    def __init__(self, parsed, collections, matcher=None,
+                 prefetcher=None):
+        super(CatchUpCommandExecutor, self).__init__(parsed, collections,
+                                                     matcher, prefetcher)
+
+    def execute(self):
+        args = list(self._parsed[1:])
+        dry_run = False
+        if args and args[-1] == self._DRY_RUN_FLAG:
+            dry_run = True
+            args.pop()
+        elif args and args[-1].endswith(' ' + self._DRY_RUN_FLAG):
+            dry_run = True
+            args[-1] = args[-1][:-len(self._DRY_RUN_FLAG)].strip()
+        if len(args) > 1:
+            raise InvalidCommandError("Unexpected argument: {0}"
+                                      .format(args[-1]))
+        if args:
+            colls = [self._find_collection(args[0])]
+        else:
+            colls = list(self._collections)
+        if not colls:
+            return
+        self._wait_for_writes(colls)
+        results = colls[0].session.catch_up(colls, dry_run)
+        if not results:
+            print 'Nothing to catch up'
+            return
+        data = []
+        for coll, ep_colls, succeeded in results:
+            sub = coll.subject
+            data += [sub.ch_title if sub.ch_title else sub.title,
+                     self._format_eps(ep_colls),
+                     'planned' if succeeded is None
+                     else 'done' if succeeded else 'failed']
+        print self._produce_output(data, 3)
+
+    @staticmethod
+    def _format_eps(ep_colls):
+        """Format episodes as ranges of episode numbers, e.g. EP3,EP5-EP7
+        """
+        nums = [ep_coll.episode.ep_num for ep_coll in ep_colls]
+        ranges = []
+        for num in nums:
+            if ranges and num == ranges[-1][1] + 1:
+                ranges[-1][1] = num
+            else:
+                ranges.append([num, num])
+        return ','.join('EP{0}'.format(first) if first == last
+                        else 'EP{0}-EP{1}'.format(first, last)
+                        for first, last in ranges)
@@ -0,0 +1,121 @@
+"""Resident server that keeps a CLIBackend, i.e. the login session,
+collections, caches and title indexes, in memory and executes commands sent
+by the thin client in bgmcli.cli.client over a Unix domain socket
+"""
+
+from __future__ import unicode_literals
+import os
+import sys
+import json
+import socket
+import signal
+import traceback
+from StringIO import StringIO
+from SocketServer import UnixStreamServer, StreamRequestHandler
+from bgmcli.api.utils import to_unicode
+from .client import get_socket_path
+from .exception import CommandError, DaemonError
+
+
+class _CommandHandler(StreamRequestHandler):
+    """Reads a command terminated by newline, and writes back the result as
+    JSON: {"ok": bool, "output": unicode}
+    """
+
+    def handle(self):
+        command = self.rfile.readline().decode('utf-8').strip()
+        ok, output = self.server.run_command(command)
+        self.wfile.write(json.dumps({'ok': ok, 'output': output})
+                         .encode('utf-8'))
+
+
+class CommandServer(UnixStreamServer):
+    """Server for commands from the thin client. Commands are executed one
+    at a time, with their output captured and sent back to the client.
+
+    The socket is only accessible by the current user. A socket left by a
+    daemon that is not running any more is replaced.
+
+    Args:
+        backend (CLIBackend): the backend to execute commands with
+        path (str or unicode): path of the socket, defaults to
+            "~/.bgmcli.sock"
+
+    Raises:
+        DaemonError: if another daemon is listening on path
+    """
+
+    def __init__(self, backend, path=None):
+        self.backend = backend
+        self.path = path or get_socket_path()
+        self._remove_stale_socket(self.path)
+        umask = os.umask(0o077)
+        try:
+            UnixStreamServer.__init__(self, self.path, _CommandHandler)
+        finally:
+            os.umask(umask)
+
+    def run_command(self, command):
+        """Execute command with the backend and capture what it prints
+
+        Args:
+            command (unicode): the command
+
+        Returns:
+            tuple(bool, unicode): whether the command succeeded, and its
+                output or error message
+        """
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            self.backend.execute_command(command)
+            ok = True
+        except CommandError as e:
+            print e.message
+            ok = False
+        except Exception as e:
+            traceback.print_exc()
+            print 'Failed to execute command: {0}'.format(e)
+            ok = False
+        finally:
+            sys.stdout = stdout
+        return ok, to_unicode(output.getvalue())
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def _remove_stale_socket(path):
+        if not os.path.exists(path):
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except socket.error:
+            os.remove(path)
+        else:
+            raise DaemonError("bgmcli daemon already running on {0}"
+                              .format(path))
+        finally:
+            sock.close()
+
+
+def run_daemon(backend, path=None):
+    """Serve commands until interrupted or terminated
+
+    Args:
+        backend (CLIBackend): the backend to execute commands with
+        path (str or unicode): path of the socket, defaults to
+            "~/.bgmcli.sock"
+    """
+    server = CommandServer(backend, path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print 'bgmcli daemon listening on {0}'.format(server.path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -15,6 +15,11 @@ class ConfigError(BangumiCLIException):
     pass
 
 
+class DaemonError(BangumiCLIException):
+    """Error raised when the daemon cannot be started"""
+    pass
+
+
 class CommandError(BangumiCLIException):
     """Error raised when there's something wrong with a command"""
     pass
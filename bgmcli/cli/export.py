@@ -0,0 +1,136 @@
+"""Export of collections to files and restore from them, used by
+"bgmcli --export", "bgmcli --crawl" and "bgmcli --restore"
+"""
+
+from __future__ import unicode_literals
+import io
+import os
+import sys
+from bgmcli.api.pipeline import JSONLinesSink, SQLiteSink
+from bgmcli.api.jsonlines import iter_load_collections
+from bgmcli.api.store import SnapshotStore, SnapshotStoreWriter
+
+
+_SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+_STORE_EXTENSION = '.bgms'
+
+
+def open_sink(path):
+    """Open a sink for subject collections by extension of path: SQLite
+    for ".db", ".sqlite" and ".sqlite3", snapshot store for ".bgms", JSON
+    lines for others
+
+    Args:
+        path (str or unicode): path of the output file
+
+    Returns:
+        SQLiteSink, SnapshotStoreWriter or JSONLinesSink: the sink
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in _SQLITE_EXTENSIONS:
+        return SQLiteSink(path)
+    if extension == _STORE_EXTENSION:
+        return SnapshotStoreWriter(path)
+    return JSONLinesSink(path)
+
+
+def read_sub_ids(path):
+    """Read subject ids from a file, one per line. Blank lines and lines
+    starting with "#" are skipped
+
+    Args:
+        path (str or unicode): path of the file, "-" for standard input
+
+    Returns:
+        generator: subject ids as unicode, read lazily
+    """
+    f = sys.stdin if path == '-' else io.open(path, encoding='utf-8')
+    try:
+        for line in f:
+            sub_id = line.strip()
+            if sub_id and not sub_id.startswith('#'):
+                yield sub_id
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def export_sub_collections(session, sub_ids, output, n_fetchers=4):
+    """Get subject collections for sub_ids with session and write them to
+    output, printing a summary of the stages at the end
+
+    Args:
+        session (BangumiSession): the session
+        sub_ids (iterable[unicode]): subject ids
+        output (str or unicode): path of the output file, see open_sink
+        n_fetchers (int): number of subjects fetched at once
+
+    Returns:
+        bool: True if all collections were exported
+    """
+    pipeline = session.make_sub_collection_pipeline(sub_ids,
+                                                    open_sink(output),
+                                                    n_fetchers)
+    pipeline.run()
+    for sub_id, error in pipeline.errors:
+        print 'Failed to export subject {0}: {1}'.format(sub_id, error)
+    print pipeline.format_summary()
+    return not pipeline.errors and not pipeline.cancelled
+
+
+def iter_exported_collections(path):
+    """Read subject collections exported to path, one at a time, from a
+    snapshot store if path ends with ".bgms" and from JSON lines otherwise
+
+    Args:
+        path (str or unicode): path of the export
+
+    Yields:
+        BangumiSubjectCollection: the collections
+    """
+    if os.path.splitext(path)[1].lower() == _STORE_EXTENSION:
+        with SnapshotStore(path) as store:
+            for coll in store.iter_collections():
+                yield coll
+    else:
+        with io.open(path, encoding='utf-8') as f:
+            for coll in iter_load_collections(f):
+                yield coll
+
+
+def restore_sub_collections(session, path, checkpoint_path=None,
+                            n_workers=4, dry_run=False):
+    """Restore subject collections exported to path into the account of
+    session, printing writes for dry run and a summary at the end
+
+    Args:
+        session (BangumiSession): the session
+        path (str or unicode): path of the export, see
+            iter_exported_collections
+        checkpoint_path (str or unicode): path of the checkpoint file,
+            defaults to path with ".checkpoint" appended
+        n_workers (int): number of subjects restored at once
+        dry_run (bool): only print the writes
+
+    Returns:
+        bool: True if all collections were restored
+    """
+    results = session.restore_collections(
+        iter_exported_collections(path),
+        checkpoint_path or path + '.checkpoint', n_workers, dry_run)
+    n_colls = n_skipped = n_failed = n_writes = 0
+    for result in results:
+        n_colls += 1
+        n_skipped += result.skipped
+        n_failed += not result.succeeded
+        n_writes += len(result.writes)
+        title = result.collection.subject.title
+        if result.error is not None:
+            print 'Failed to restore {0}: {1}'.format(
+                title, getattr(result.error, 'message', None) or result.error)
+        elif dry_run and result.writes:
+            print '{0}: {1}'.format(title, ', '.join(result.writes))
+    print ('{0} collections: {1} already restored, {2} failed, {3} writes{4}'
+           .format(n_colls, n_skipped, n_failed, n_writes,
+                   ' to send' if dry_run else ''))
+    return n_failed == 0
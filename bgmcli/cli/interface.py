@@ -3,13 +3,21 @@
 
 from __future__ import unicode_literals
 import os
+import io
+import sys
+import argparse
 from prompt_toolkit import AbortAction
 from prompt_toolkit.shortcuts import get_input
 from prompt_toolkit.history import InMemoryHistory
-from prompt_toolkit.contrib.completers import WordCompleter
+from bgmcli.api import BangumiSession, RateLimiter
+from bgmcli.api.parsing import ParserPool
 from bgmcli.cli.exception import ConfigError
 from bgmcli.cli.backend import CLIBackend, key_bindings_manager
 from bgmcli.cli.exception import CommandError
+from bgmcli.cli.batch import BatchRunner
+from bgmcli.cli.daemon import run_daemon
+from bgmcli.cli.export import export_sub_collections, read_sub_ids,\
+    restore_sub_collections
 
 
 def read_config():
@@ -32,11 +40,170 @@ def read_config():
     return email, password
 
 
+def parse_args(argv=None):
+    """Parse command line arguments
+
+    Args:
+        argv (list[str]): arguments, defaults to sys.argv[1:]
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog='bgmcli')
+    parser.add_argument('--batch', metavar='FILE',
+                        help='run commands in FILE, one per line, instead of '
+                        'the interactive prompt. "-" for standard input')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running and execute commands sent with '
+                        '"bgmc COMMAND" over a Unix domain socket')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='number of subjects updated concurrently in '
+                        'batch mode and by --restore')
+    parser.add_argument('--export', metavar='OUTPUT',
+                        help='export collections of anime being watched to '
+                        'OUTPUT, an SQLite database if it ends with ".db", '
+                        '".sqlite" or ".sqlite3", JSON lines otherwise')
+    parser.add_argument('--crawl', metavar='IDS_FILE',
+                        help='export collections of subjects in IDS_FILE, '
+                        'one id per line, to the file given by --output. '
+                        '"-" for standard input')
+    parser.add_argument('--output', metavar='OUTPUT',
+                        help='output file of --crawl, same formats as '
+                        '--export')
+    parser.add_argument('--fetchers', type=int, default=4,
+                        help='number of subjects fetched concurrently by '
+                        '--export and --crawl')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='number of processes parsing pages for '
+                        '--export and --crawl, 0 to parse in one thread')
+    parser.add_argument('--restore', metavar='INPUT',
+                        help='restore collections exported to INPUT into '
+                        'the account, writing only what differs')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='checkpoint of --restore, to resume it where it '
+                        'stopped. Defaults to INPUT.checkpoint')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only print writes --restore would send')
+    args = parser.parse_args(argv)
+    if args.crawl is not None and args.output is None:
+        parser.error('--crawl requires --output')
+    return args
+
+
+def run_batch(backend, path, n_workers):
+    """Run commands from a file with backend and print the summary
+
+    Args:
+        backend (CLIBackend): the backend
+        path (str): path of the file, "-" for standard input
+        n_workers (int): number of subjects updated concurrently
+
+    Returns:
+        bool: True if all commands succeeded
+    """
+    if path == '-':
+        lines = [line.decode('utf-8') for line in sys.stdin]
+    else:
+        with io.open(path, encoding='utf-8') as f:
+            lines = f.readlines()
+    report = BatchRunner(backend, n_workers).run(lines)
+    print report.format_summary()
+    return not report.failed
+
+
+def run_restore(args):
+    """Run --restore with a session of its own
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        bool: True if all collections were restored
+    """
+    email, password = read_config()
+    with BangumiSession(email, password,
+                        rate_limiter=RateLimiter(
+                            CLIBackend._MAX_REQUEST_RATE,
+                            CLIBackend._MAX_REQUEST_RATE)) as session:
+        return restore_sub_collections(session, args.restore,
+                                       args.checkpoint, args.workers,
+                                       args.dry_run)
+
+
+def run_export(args):
+    """Run --export or --crawl with a session of its own
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        bool: True if all collections were exported
+    """
+    # worker processes are forked before the session starts any thread
+    parser_pool = ParserPool(args.processes) if args.processes > 0 else None
+    try:
+        email, password = read_config()
+        with BangumiSession(email, password,
+                            rate_limiter=RateLimiter(
+                                CLIBackend._MAX_REQUEST_RATE,
+                                CLIBackend._MAX_REQUEST_RATE),
+                            parser_pool=parser_pool) as session:
+            if args.crawl is not None:
+                sub_ids, output = read_sub_ids(args.crawl), args.output
+            else:
+                sub_ids = [coll.subject.id_ for coll
+                           in session.get_dummy_collections('anime', 3)]
+                output = args.export
+            return export_sub_collections(session, sub_ids, output,
+                                          args.fetchers)
+    finally:
+        if parser_pool is not None:
+            parser_pool.close()
+
+
+def close_backend(backend):
+    """Close backend, reporting changes it could not save
+
+    Args:
+        backend (CLIBackend): the backend
+
+    Returns:
+        bool: True if all changes were saved
+    """
+    saved = backend.close()
+    if not saved:
+        print 'Some changes were not saved on Bangumi'
+    return saved
+
+
 def run():
     """The function that runs the CLI"""
-    backend = CLIBackend(*read_config())
+    args = parse_args()
+    if args.export is not None or args.crawl is not None:
+        sys.exit(0 if run_export(args) else 1)
+    if args.restore is not None:
+        sys.exit(0 if run_restore(args) else 1)
+    try:
+        backend = CLIBackend(*read_config())
+    except CommandError as e:
+        # login failed without a snapshot to start from
+        print e.message
+        sys.exit(1)
+    if args.batch is not None:
+        try:
+            succeeded = run_batch(backend, args.batch, args.workers)
+        finally:
+            saved = close_backend(backend)
+        sys.exit(0 if succeeded and saved else 1)
+    if args.daemon:
+        try:
+            run_daemon(backend)
+        finally:
+            close_backend(backend)
+        return
+
     history = InMemoryHistory()
-    completer = WordCompleter(backend.get_completion_list())
+    completer = backend.get_completer()
     user_id = backend.get_user_id()
 
     while True:
@@ -55,13 +222,10 @@ def run():
             except CommandError as e:
                 print e.message
             except Exception:
-                backend.close()
+                close_backend(backend)
                 raise
-            else:
-                # update word completer
-                completer = WordCompleter(backend.get_completion_list())
             
-    backend.close()
+    close_backend(backend)
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,115 @@
+"""Typo tolerant matching of subject names with a trigram index
+"""
+
+from __future__ import unicode_literals
+import math
+from collections import defaultdict
+
+
+def _normalize(name):
+    return ''.join(name.lower().split())
+
+
+def _trigrams(name):
+    padded = '  ' + _normalize(name) + ' '
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+
+class SubjectMatcher(object):
+    """Index of subject names (titles, Chinese titles and aliases such as
+    pinyin and pinyin initials) for exact and typo tolerant lookup.
+
+    Names are broken into trigrams once when added. A name scoring at least
+    min_score (Dice coefficient of the trigram sets) must share a minimum
+    number of trigrams with the query, hence must contain one of the rarest
+    trigrams of the query. Only names in posting lists of those rarest
+    trigrams are scored, so frequent trigrams never get scanned. Once
+    max_candidates is reached, collecting stops after the 4 rarest trigrams,
+    as a single typo changes at most 3 trigrams.
+
+    Args:
+        min_score (float): min score for a name to be a fuzzy match
+        max_candidates (int): number of candidates after which less rare
+            trigrams are skipped
+    """
+
+    _MIN_GRAMS_SCANNED = 4
+
+    def __init__(self, min_score=0.4, max_candidates=300):
+        self._min_score = min_score
+        self._max_candidates = max_candidates
+        self._exact = defaultdict(list)
+        self._names = []
+        self._postings = defaultdict(list)
+
+    def add(self, sub_id, names):
+        """Add names of a subject. Names already added for the subject are
+        skipped
+
+        Args:
+            sub_id (str): subject id
+            names (list[unicode]): names of the subject
+        """
+        for name in names:
+            if not name:
+                continue
+            key = _normalize(name)
+            if sub_id in self._exact[key]:
+                continue
+            self._exact[key].append(sub_id)
+            grams = frozenset(_trigrams(name))
+            name_idx = len(self._names)
+            self._names.append((name, sub_id, grams))
+            for gram in grams:
+                self._postings[gram].append(name_idx)
+
+    def match(self, query, limit=5):
+        """Find subjects matching query, best first
+
+        Args:
+            query (unicode): name to look up
+            limit (int): max number of results
+
+        Returns:
+            list[tuple(str, unicode, float)]: subject id, matched name and
+                score for each subject. Score is 1.0 for exact matches
+        """
+        key = _normalize(query)
+        results = []
+        seen = set()
+        for sub_id in self._exact.get(key, []):
+            results.append((sub_id, query, 1.0))
+            seen.add(sub_id)
+        if len(results) >= limit:
+            return results[:limit]
+
+        grams = _trigrams(query)
+        # overlap o with a name of n trigrams gives 2o / (q + n) >= min_score
+        # and o <= n, so o >= min_score * q / (2 - min_score)
+        min_overlap = int(math.ceil(self._min_score * len(grams) /
+                                    (2 - self._min_score)))
+        rarest = sorted(grams, key=lambda g: len(self._postings.get(g, ())))
+        candidates = set()
+        for i, gram in enumerate(rarest[:len(grams) - min_overlap + 1]):
+            if (i >= self._MIN_GRAMS_SCANNED and
+                    len(candidates) >= self._max_candidates):
+                break
+            candidates.update(self._postings.get(gram, ()))
+        scored = []
+        for name_idx in candidates:
+            name, sub_id, name_grams = self._names[name_idx]
+            overlap = len(grams & name_grams)
+            score = 2.0 * overlap / (len(grams) + len(name_grams))
+            if score >= self._min_score:
+                scored.append((score, name, sub_id))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        for score, name, sub_id in scored:
+            if len(results) >= limit:
+                break
+            if sub_id not in seen:
+                seen.add(sub_id)
+                results.append((sub_id, name, score))
+        return results
+
+    def __len__(self):
+        return len(self._names)
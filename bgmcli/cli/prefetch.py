@@ -0,0 +1,137 @@
+"""Background loading of regular collections for dummy collections, so that
+commands on a subject do not wait for fetching its pages
+"""
+
+from __future__ import unicode_literals
+import time
+import threading
+from Queue import Queue
+from bgmcli.api.collection import BangumiDummySubjectCollection
+
+
+class _PrefetchEntry(object):
+    __slots__ = ('coll', 'started', 'done', 'result', 'error')
+
+    def __init__(self, coll):
+        self.coll = coll
+        self.started = False
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CollectionPrefetcher(object):
+    """Loads regular collections for dummy collections with a pool of worker
+    threads, in the order they are submitted.
+
+    A collection requested with get_regular() is loaded right away in the
+    calling thread if no worker has started on it, or waited for if one has,
+    so it is never fetched twice.
+
+    Args:
+        on_loaded (callable): called with the dummy collection and the
+            regular collection loaded by a worker, after the result is
+            available to get_regular()
+        n_workers (int): number of worker threads
+    """
+
+    def __init__(self, on_loaded, n_workers=4):
+        self._on_loaded = on_loaded
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._queue = Queue()
+        self._closed = False
+        self._workers = []
+        for i in xrange(n_workers):
+            worker = threading.Thread(target=self._work,
+                                      name='bgmcli-prefetch-{0}'.format(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def prefetch(self, colls):
+        """Queue dummy collections in colls for loading. Collections of
+        subjects already queued are skipped
+
+        Args:
+            colls (list[BangumiSubjectCollection]): collections in the order
+                to be loaded
+        """
+        with self._lock:
+            for coll in colls:
+                if not isinstance(coll, BangumiDummySubjectCollection):
+                    continue
+                entry = self._entries.get(coll.subject.id_)
+                if entry is not None and entry.error is None:
+                    continue
+                entry = _PrefetchEntry(coll)
+                self._entries[coll.subject.id_] = entry
+                self._queue.put(entry)
+
+    def get_regular(self, coll):
+        """Get regular collection for a dummy collection
+
+        Args:
+            coll (BangumiDummySubjectCollection): dummy collection
+
+        Returns:
+            BangumiSubjectCollection: the regular collection
+        """
+        with self._lock:
+            entry = self._entries.get(coll.subject.id_)
+            if entry is None or entry.error is not None:
+                entry = _PrefetchEntry(coll)
+                self._entries[coll.subject.id_] = entry
+            run_here = not entry.started
+            entry.started = True
+        if run_here:
+            self._load(entry)
+        else:
+            entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def close(self, timeout=None):
+        """Drop queued collections and wait for workers to finish the ones
+        being loaded
+
+        Args:
+            timeout (float): seconds to wait at most, None for no limit.
+                Workers still loading then are left to finish in background,
+                as daemon threads
+        """
+        with self._lock:
+            self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        deadline = time.time() + timeout if timeout is not None else None
+        for worker in self._workers:
+            worker.join(max(0, deadline - time.time())
+                        if deadline is not None else None)
+
+    def _work(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            with self._lock:
+                if self._closed:
+                    return
+                if entry.started:
+                    continue
+                entry.started = True
+            self._load(entry)
+            if entry.error is None:
+                self._on_loaded(entry.coll, entry.result)
+
+    @staticmethod
+    def _load(entry):
+        try:
+            entry.result = entry.coll.to_regular_collection()
+            # load episodes here rather than in the command using them
+            entry.result.ep_collections
+        except Exception as e:
+            entry.error = e
+        finally:
+            entry.done.set()
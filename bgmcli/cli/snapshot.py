@@ -0,0 +1,72 @@
+"""Local snapshot of the library so that the CLI can start without waiting
+for login and list crawling
+"""
+
+from __future__ import unicode_literals
+import os
+import io
+import json
+from bgmcli.api.collection import BangumiDummySubjectCollection
+from bgmcli.api.utils import to_unicode
+
+
+SNAPSHOT_FILE_NAME = '.bgmcli-snapshot'
+
+
+def get_snapshot_path():
+    """Get the path of the snapshot file, "~/.bgmcli-snapshot"
+
+    Returns:
+        str or unicode: path of the snapshot file
+    """
+    return os.path.join(os.path.expanduser('~'), SNAPSHOT_FILE_NAME)
+
+
+def load_snapshot(email, path=None):
+    """Load last known user id and collections for given account
+
+    Args:
+        email (str or unicode): email address the snapshot was saved for
+        path (str or unicode): path of the snapshot file, defaults to
+            "~/.bgmcli-snapshot"
+
+    Returns:
+        user_id, collections: user id and list of
+            BangumiDummySubjectCollection. None, [] if there is no usable
+            snapshot for the account
+    """
+    path = path or get_snapshot_path()
+    try:
+        with io.open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data['email'] != to_unicode(email):
+            return None, []
+        # collections were json text of their own in older snapshots
+        colls = [BangumiDummySubjectCollection.from_json(coll)
+                 if isinstance(coll, basestring)
+                 else BangumiDummySubjectCollection.from_dict(coll)
+                 for coll in data['collections']]
+    except (IOError, ValueError, KeyError, TypeError):
+        return None, []
+    return data['user_id'], colls
+
+
+def save_snapshot(email, user_id, collections, path=None):
+    """Save user id and collections for given account. The file is replaced
+    atomically so that a concurrent start never sees a partial snapshot
+
+    Args:
+        email (str or unicode): email address of the account
+        user_id (str or unicode): user id of the account
+        collections (list[BangumiDummySubjectCollection]): collections to
+            save
+        path (str or unicode): path of the snapshot file, defaults to
+            "~/.bgmcli-snapshot"
+    """
+    path = path or get_snapshot_path()
+    data = {'email': to_unicode(email), 'user_id': user_id,
+            'collections': [coll.to_dict() for coll in collections]}
+    tmp_path = path + '.tmp'
+    with io.open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(to_unicode(json.dumps(data, ensure_ascii=False)))
+    os.rename(tmp_path, path)
@@ -0,0 +1,169 @@
+"""Prefix trie of subject titles, shared by command parsing and completion
+"""
+
+from __future__ import unicode_literals
+from prompt_toolkit.completion import Completer, Completion
+
+
+class _TrieNode(object):
+    __slots__ = ('children', 'is_title')
+
+    def __init__(self):
+        self.children = {}
+        self.is_title = False
+
+
+class TitleIndex(object):
+    """Prefix trie of titles. Lookups cost time proportional to the length
+    of the text looked up rather than the number of titles.
+    """
+
+    def __init__(self, titles=None):
+        self._root = _TrieNode()
+        self._len = 0
+        for title in titles or []:
+            self.add(title)
+
+    def add(self, title):
+        """Insert a title
+
+        Args:
+            title (unicode): title to insert
+
+        Returns:
+            bool: True if title was not in the index before
+        """
+        node = self._root
+        for char in title:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+        if node.is_title:
+            return False
+        node.is_title = True
+        self._len += 1
+        return True
+
+    def longest_prefix(self, text):
+        """Find the longest title that text starts with, and that is followed
+        by whitespace or the end of text
+
+        Args:
+            text (unicode): text to search in
+
+        Returns:
+            unicode or None: the title found, None if not found
+        """
+        node = self._root
+        longest = None
+        for idx, char in enumerate(text):
+            if node.is_title and char.isspace():
+                longest = idx
+            node = node.children.get(char)
+            if node is None:
+                break
+        else:
+            if node.is_title:
+                longest = len(text)
+        return text[:longest] if longest is not None else None
+
+    def iter_prefixed(self, prefix, limit=None):
+        """Iterate titles starting with prefix in sorted order
+
+        Args:
+            prefix (unicode): prefix of titles
+            limit (int): max number of titles to yield, None for no limit
+
+        Yields:
+            unicode: titles starting with prefix
+        """
+        node = self._find_node(prefix)
+        if node is None or limit == 0:
+            return
+        count = 0
+        # depth first search, children pushed in reversed order so that
+        # titles come out sorted
+        stack = [(prefix, node)]
+        while stack:
+            text, node = stack.pop()
+            if node.is_title:
+                yield text
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+            for char in sorted(node.children, reverse=True):
+                stack.append((text + char, node.children[char]))
+
+    def _find_node(self, prefix):
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def __contains__(self, title):
+        node = self._find_node(title)
+        return node is not None and node.is_title
+
+    def __iter__(self):
+        return self.iter_prefixed('')
+
+    def __len__(self):
+        return self._len
+
+
+class TitleCompleter(Completer):
+    """Completer for prompt_toolkit that completes command heads, and
+    subject titles after a command head using a TitleIndex. If no title
+    starts with the text typed, names suggested by the SubjectMatcher are
+    offered instead
+
+    Args:
+        commands (list[unicode]): valid command heads
+        get_title_index (callable): returns the current TitleIndex
+        get_matcher (callable): returns the current SubjectMatcher, None
+            for no suggestions of similar names
+        max_completions (int): max number of titles suggested, which keeps
+            the cost of every keystroke flat however many titles there are
+    """
+
+    _MIN_FUZZY_LEN = 2
+    _MAX_FUZZY_COMPLETIONS = 5
+
+    def __init__(self, commands, get_title_index, get_matcher=None,
+                 max_completions=50):
+        self._commands = sorted(commands)
+        self._get_title_index = get_title_index
+        self._get_matcher = get_matcher
+        self._max_completions = max_completions
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor.lstrip()
+        splitted = text.split(None, 1)
+        if not splitted:
+            return
+        if len(splitted) == 1 and not text[-1].isspace():
+            for command in self._commands:
+                if command.startswith(text):
+                    yield Completion(command, -len(text))
+            return
+        title_prefix = splitted[1] if len(splitted) > 1 else ''
+        index = self._get_title_index()
+        matched = index.longest_prefix(title_prefix)
+        if matched is not None and len(matched) < len(title_prefix):
+            # title is complete, now typing episode
+            return
+        found = False
+        for title in index.iter_prefixed(title_prefix,
+                                         self._max_completions):
+            found = True
+            yield Completion(title, -len(title_prefix))
+        if (found or self._get_matcher is None or
+                len(title_prefix.strip()) < self._MIN_FUZZY_LEN):
+            return
+        matches = self._get_matcher().match(title_prefix,
+                                            self._MAX_FUZZY_COMPLETIONS)
+        for _, name, _ in matches:
+            yield Completion(name, -len(title_prefix))
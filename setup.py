@@ -15,6 +15,7 @@ setup(
     entry_points={
         'console_scripts': [
             'bgmcli = bgmcli.cli.interface:run',
+            'bgmc = bgmcli.cli.client:main',
         ]
     },
 )
\ No newline at end of file
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from bgmcli.cli.aliases import PinyinAliasCache
+
+
+class PinyinAliasCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'pinyin-cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_aliases(self):
+        cache = PinyinAliasCache(self.path)
+        self.assertEqual([u'xingjiniuzi', u'xjnz'],
+                         cache.get_aliases(u'星际牛仔'))
+        # initials of two characters are too short
+        self.assertEqual([u'longzhu'], cache.get_aliases(u'龙珠'))
+        self.assertEqual([], cache.get_aliases(u'abc'))
+
+    def test_persistence(self):
+        cache = PinyinAliasCache(self.path)
+        # nothing to write yet
+        cache.save()
+        self.assertFalse(os.path.exists(self.path))
+        cache.get_aliases(u'星际牛仔')
+        cache.save()
+        self.assertEqual([u'pinyin-cache'], os.listdir(self.tmp_dir))
+        with io.open(self.path, encoding='utf-8') as f:
+            self.assertEqual({u'星际牛仔': [u'xingjiniuzi', u'xjnz']},
+                             json.load(f))
+
+        cache = PinyinAliasCache(self.path)
+        cache.get_aliases(u'星际牛仔')
+        # cached, not written again
+        os.remove(self.path)
+        cache.save()
+        self.assertFalse(os.path.exists(self.path))
+        # new titles are added to the file
+        cache.get_aliases(u'东之伊甸')
+        cache.save()
+        with io.open(self.path, encoding='utf-8') as f:
+            self.assertEqual({u'星际牛仔', u'东之伊甸'}, set(json.load(f)))
+
+    def test_cached_without_pinyin(self):
+        with io.open(self.path, 'w', encoding='utf-8') as f:
+            f.write(u'{"星际牛仔": ["xingjiniuzi", "xjnz"], "龙珠": '
+                    u'["longzhu", "lz"]}')
+        xpinyin = sys.modules.get('xpinyin')
+        # importing xpinyin fails from now on
+        sys.modules['xpinyin'] = None
+        try:
+            cache = PinyinAliasCache(self.path)
+            self.assertEqual([u'xingjiniuzi', u'xjnz'],
+                             cache.get_aliases(u'星际牛仔'))
+            # short aliases cached by earlier versions are dropped
+            self.assertEqual([u'longzhu'], cache.get_aliases(u'龙珠'))
+            self.assertRaises(ImportError, cache.get_aliases, u'东之伊甸')
+        finally:
+            if xpinyin is None:
+                del sys.modules['xpinyin']
+            else:
+                sys.modules['xpinyin'] = xpinyin
+
+    def test_corrupted(self):
+        for content in (u'{"星际牛仔": ["xingji', u'["xjnz"]'):
+            with io.open(self.path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            cache = PinyinAliasCache(self.path)
+            self.assertEqual([u'xingjiniuzi', u'xjnz'],
+                             cache.get_aliases(u'星际牛仔'))
+            cache.save()
+            with io.open(self.path, encoding='utf-8') as f:
+                self.assertEqual([u'星际牛仔'], list(json.load(f)))
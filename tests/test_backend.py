@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+from bgmcli.api.element import BangumiDummySubject
+from bgmcli.api.collection import BangumiDummySubjectCollection
+from bgmcli.api.exception import LoginFailedError
+from bgmcli.cli.backend import CLIBackend
+from bgmcli.cli.title_index import TitleIndex
+from bgmcli.cli.matcher import SubjectMatcher
+from bgmcli.cli.exception import CommandError
+
+
+class FakeRegularCollection(object):
+
+    def __init__(self, subject):
+        self.subject = subject
+
+
+def make_dummy_collection(id_, title):
+    return BangumiDummySubjectCollection(BangumiDummySubject(id_, title), 3)
+
+
+def make_backend(colls):
+    """Backend started from a snapshot of colls, without login and refresher
+    running
+    """
+    backend = CLIBackend.__new__(CLIBackend)
+    backend._lock = threading.RLock()
+    backend._session = None
+    backend._error = None
+    backend._login_error = None
+    backend._logged_in = threading.Event()
+    backend._refreshed = threading.Event()
+    backend._user_id = '123'
+    backend._colls = colls
+    backend._titles = TitleIndex()
+    backend._matcher = SubjectMatcher()
+    backend._update_titles()
+    return backend
+
+
+class CLIBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.colls = [make_dummy_collection('253', u'カウボーイビバップ'),
+                      make_dummy_collection('1451', u'東のエデン'),
+                      make_dummy_collection('8484', u'機動警察パトレイバー')]
+        self.backend = make_backend(list(self.colls))
+
+    def test_merge_collections(self):
+        regular_coll = FakeRegularCollection(self.colls[1].subject)
+        self.backend._swap_collection(self.colls[1], regular_coll)
+        refreshed = [make_dummy_collection('1451', u'東のエデン'),
+                     make_dummy_collection('9717', u'魔法少女まどか☆マギカ'),
+                     make_dummy_collection('253', u'カウボーイビバップ')]
+        self.backend._merge_collections(refreshed)
+        # collection loaded by commands is kept, in the refreshed order
+        self.assertEqual([regular_coll, refreshed[1], refreshed[2]],
+                         self.backend._colls)
+        self.assertIn(u'魔法少女まどか☆マギカ', self.backend._titles)
+        self.assertNotIn(u'機動警察パトレイバー', self.backend._titles)
+
+    def test_parse_command(self):
+        self.backend._colls.append(make_dummy_collection('2048',
+                                                         u'東のエデン 2'))
+        self.backend._update_titles()
+        parse = self.backend._parse_command
+        self.assertEqual([u'lseps', u'東のエデン 2'],
+                         parse(u'lseps 東のエデン 2'))
+        self.assertEqual([u'watched', u'東のエデン 2', u'ep3'],
+                         parse(u'watched 東のエデン 2 ep3'))
+        self.assertEqual([u'watched', u'東のエデン', u'3'],
+                         parse(u'watched 東のエデン 3'))
+        self.assertEqual([u'watched', u'東のエデソ', u'3'],
+                         parse(u'watched 東のエデソ 3'))
+
+    def test_login_failed(self):
+        self.backend._login_error = LoginFailedError("Wrong password")
+        self.backend._logged_in.set()
+        self.assertEqual('123', self.backend.get_user_id())
+        with self.assertRaises(CommandError) as cm:
+            self.backend.execute_command(u'lseps 東のエデン')
+        self.assertIn('Wrong password', cm.exception.message)
+
+
+if __name__ == '__main__':
+    unittest.main()
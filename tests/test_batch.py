@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import unittest
+from bgmcli.api.element import BangumiAnime
+from bgmcli.api.collection import BangumiAnimeCollection
+from bgmcli.api.exception import SessionExpiredError
+from bgmcli.cli.batch import BatchRunner
+from bgmcli.cli.command_executor import match_collection
+from test_utils import module_path
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.calls = []
+        self.expired = False
+
+    def _set_watched_eps_in_sub(self, ep_colls):
+        if self.expired:
+            raise SessionExpiredError("Login expired")
+        self.calls.append([ep_c.episode.ep_num for ep_c in ep_colls])
+        for ep_c in ep_colls:
+            ep_c.c_status = 'watched'
+        return True
+
+    def set_collection(self, coll):
+        self.calls.append(coll.c_status)
+        return True
+
+    def _add_dirty(self, coll):
+        pass
+
+    def _discard_dirty(self, coll):
+        pass
+
+
+class FakeBackend(object):
+
+    def __init__(self, colls):
+        self.colls = colls
+        self.executed = []
+        self.n_relogins = 0
+
+    def parse_command(self, command):
+        # titles of the fixture have no spaces
+        return command.split()
+
+    def find_collection(self, name, strict=False):
+        return match_collection(self.colls, name, strict=strict)
+
+    def get_regular_collection(self, coll):
+        return coll
+
+    def run_with_relogin(self, func):
+        try:
+            return func()
+        except SessionExpiredError:
+            self.n_relogins += 1
+            self.colls[0].session.expired = False
+            return func()
+
+    def execute_command(self, command):
+        self.executed.append(command)
+
+
+class BatchRunnerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.split(module_path(cls.setUpClass))[0]
+        with open(os.path.join(path, 'ep_html')) as f:
+            cls._ep_html = f.read()
+        with open(os.path.join(path, 'sub_html')) as f:
+            cls._sub_html = f.read()
+
+    def setUp(self):
+        sub = BangumiAnime.from_html(self._sub_html, self._ep_html)
+        self.session = FakeSession()
+        self.coll = BangumiAnimeCollection.from_html_with_subject(
+            sub, self._sub_html, self._ep_html)
+        self.coll.session = self.session
+        self.backend = FakeBackend([self.coll])
+
+    def _run(self, lines):
+        return BatchRunner(self.backend).run(lines)
+
+    def test_coalesce(self):
+        title = self.coll.subject.title
+        report = self._run(['kanguo {0} ED1'.format(title),
+                            '',
+                            '# comment',
+                            'kandao {0} EP26'.format(title),
+                            'kanguo {0} EP25'.format(title),
+                            'kanguo {0}'.format(title)])
+        self.assertEqual([], report.failed)
+        self.assertEqual(4, len(report.commands))
+        self.assertEqual(2, report.n_writes)
+        self.assertEqual([[25, 26, 1], 2], self.session.calls)
+
+    def test_errors(self):
+        title = self.coll.subject.title
+        report = self._run(['kanguo {0} EP1'.format(title),
+                            'kandao {0} EP99'.format(title),
+                            'kandao {0}'.format(title),
+                            'bogus',
+                            'lswatching'])
+        self.assertEqual([2, 3, 4],
+                         [command.line_no for command in report.failed])
+        self.assertEqual(0, report.n_writes)
+        self.assertEqual([], self.session.calls)
+        self.assertEqual(['lswatching'], self.backend.executed)
+        self.assertIn('2 succeeded, 3 failed', report.format_summary())
+
+    def test_order(self):
+        title = self.coll.subject.title
+        calls = self.session.calls
+        self.backend.execute_command = calls.append
+        report = self._run(['kanguo {0} EP25'.format(title),
+                            'kanguo {0} ED1'.format(title),
+                            'lswatching',
+                            'kanguo {0} EP26'.format(title)])
+        self.assertEqual([], report.failed)
+        self.assertEqual([[25, 1], 'lswatching', [26]], calls)
+
+    def test_relogin(self):
+        title = self.coll.subject.title
+        self.session.expired = True
+        report = self._run(['kanguo {0} EP25'.format(title)])
+        self.assertEqual([], report.failed)
+        self.assertEqual(1, self.backend.n_relogins)
+        self.assertEqual([[25]], self.session.calls)
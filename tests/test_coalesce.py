@@ -0,0 +1,90 @@
+import time
+import threading
+import unittest
+from bgmcli.api.coalesce import WriteCoalescer
+
+
+class WriteCoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.sent_event = threading.Event()
+
+    def send(self, key, items):
+        self.sent.append((key, items))
+        self.sent_event.set()
+        return 'fail' not in items
+
+    def test_window(self):
+        coalescer = WriteCoalescer(0.2, self.send)
+        for item in ('EP3', 'EP4', 'EP5'):
+            coalescer.submit('253', item)
+        coalescer.submit('265', 'EP1')
+        self.assertEqual(4, len(coalescer))
+        self.assertEqual([], self.sent)
+        self.assertTrue(self.sent_event.wait(5))
+        self.assertEqual([], coalescer.flush())
+        self.assertEqual([('253', ['EP3', 'EP4', 'EP5']), ('265', ['EP1'])],
+                         sorted(self.sent))
+        self.assertEqual(0, len(coalescer))
+
+    def test_flush(self):
+        coalescer = WriteCoalescer(60, self.send)
+        coalescer.submit('253', 'EP3')
+        coalescer.submit('253', 'fail')
+        coalescer.submit('265', 'EP1')
+        start = time.time()
+        failures = coalescer.flush()
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual([('253', ['EP3', 'fail'], None)], failures)
+        self.assertEqual(2, len(self.sent))
+        # reported once
+        self.assertEqual([], coalescer.flush())
+
+    def test_error(self):
+        def send(key, items):
+            raise ValueError(key)
+
+        coalescer = WriteCoalescer(60, send)
+        coalescer.submit('253', 'EP3')
+        (key, items, error), = coalescer.flush()
+        self.assertTrue(isinstance(error, ValueError))
+
+    def test_requeue(self):
+        coalescer = WriteCoalescer(60, self.send)
+        coalescer.submit('253', 'EP4')
+        coalescer.requeue('253', ['EP3'])
+        coalescer.requeue('265', ['EP1'])
+        self.assertEqual(3, len(coalescer))
+        self.assertEqual([], coalescer.flush())
+        self.assertEqual([('253', ['EP3', 'EP4']), ('265', ['EP1'])],
+                         sorted(self.sent))
+        # requeued without a timer, sent with a later submit
+        self.sent_event.clear()
+        coalescer = WriteCoalescer(0.1, self.send)
+        coalescer.requeue('253', ['EP5'])
+        coalescer.submit('253', 'EP6')
+        self.assertTrue(self.sent_event.wait(5))
+        self.assertEqual(('253', ['EP5', 'EP6']), self.sent[-1])
+
+    def test_flush_keys(self):
+        coalescer = WriteCoalescer(60, self.send)
+        coalescer.submit('253', 'fail')
+        coalescer.submit('265', 'EP1')
+        # only 253 is sent, and only its failure reported
+        self.assertEqual([('253', ['fail'], None)], coalescer.flush(['253']))
+        self.assertEqual([('253', ['fail'])], self.sent)
+        self.assertEqual(1, len(coalescer))
+        self.assertEqual([], coalescer.flush(['8484']))
+        self.assertEqual(1, len(coalescer))
+
+    def test_take_failures(self):
+        coalescer = WriteCoalescer(0.05, self.send)
+        coalescer.submit('265', 'fail')
+        self.assertTrue(self.sent_event.wait(5))
+        # sent by the timer, failure kept until taken
+        time.sleep(0.2)
+        self.assertEqual([], coalescer.take_failures(['253']))
+        self.assertEqual([('265', ['fail'], None)],
+                         coalescer.take_failures())
+        self.assertEqual([], coalescer.take_failures())
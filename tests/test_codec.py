@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from bs4 import BeautifulSoup
+from bgmcli.api import codec
+from bgmcli.api.element import BangumiAnime
+from bgmcli.api.collection import BangumiAnimeCollection,\
+    BangumiDummySubjectCollection
+from test_utils import module_path
+
+
+class CodecTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.split(module_path(cls.setUpClass))[0]
+        with open(os.path.join(path, 'ep_html')) as f:
+            cls._ep_html = f.read()
+        with open(os.path.join(path, 'sub_html')) as f:
+            cls._sub_html = f.read()
+        with open(os.path.join(path, 'on_hold_page')) as f:
+            cls._on_hold_soup = BeautifulSoup(f.read(), 'html.parser')
+
+    def test_values(self):
+        value = {'none': None, 'bools': [True, False],
+                 'ints': [0, 1, -1, 127, 128, -300, 2 ** 70, -2 ** 70],
+                 'float': 8.5, 'str': u'佳作', 'nested': [{'a': []}, {}]}
+        strings = codec.StringTable()
+        buf = bytearray()
+        codec.encode_value(buf, value, strings)
+        self.assertEqual((value, len(buf)),
+                         codec.decode_value(buf, 0, strings.strings))
+        self.assertRaises(TypeError, codec.encode_value, buf, set(),
+                          strings)
+
+    def test_dict_keys(self):
+        strings = codec.StringTable()
+        buf = bytearray()
+        # integer keys become strings, as in json
+        codec.encode_value(buf, {1: u'EP1', -2 ** 70: None}, strings)
+        self.assertEqual({u'1': u'EP1', unicode(-2 ** 70): None},
+                         codec.decode_value(buf, 0, strings.strings)[0])
+        for key in (None, True, 1.5, (1, 2)):
+            with self.assertRaises(ValueError):
+                codec.encode_value(bytearray(), {key: 1}, strings)
+        # nothing else is added to the table
+        self.assertEqual(3, len(strings))
+        sub = BangumiAnime('253', u'title')
+        sub.other_info[3] = u'three'
+        self.assertEqual(u'three',
+                         codec.loads(codec.dumps([sub]))[0].other_info[u'3'])
+
+    def test_round_trip(self):
+        sub_coll = BangumiAnimeCollection.from_html(self._sub_html,
+                                                    self._ep_html)
+        sub_coll.tags = [u'科幻', u'TV']
+        sub_coll.subject.other_info['aliases'] = [u'xjnz']
+        dummy_colls = [BangumiDummySubjectCollection.from_soup_for_li(li, 4)
+                       for li in (self._on_hold_soup.find(id='browserItemList')
+                                  .find_all('li'))]
+        objects = [sub_coll] + dummy_colls + [sub_coll.subject]
+        decoded = codec.loads(codec.dumps(objects))
+        self.assertEqual([type(obj) for obj in objects],
+                         [type(obj) for obj in decoded])
+        # same as through json
+        for obj, new_obj in zip(objects, decoded):
+            self.assertEqual(type(obj).from_json(obj.to_json()).to_dict(),
+                             new_obj.to_dict())
+        self.assertEqual(sub_coll.ep_collections, decoded[0].ep_collections)
+        self.assertIs(decoded[0].subject,
+                      decoded[0].ep_collections[0].episode.subject)
+        self.assertEqual(sub_coll.subject.eps, decoded[-1].eps)
+
+    def test_string_table(self):
+        sub = BangumiAnime.from_html(self._sub_html, self._ep_html)
+        data = codec.dumps([sub] * 10)
+        # strings of later copies are only indexes
+        self.assertTrue(len(data) < 3 * len(codec.dumps([sub])))
+
+    def test_invalid(self):
+        data = codec.dumps([BangumiAnime('253', u'title')])
+        self.assertRaises(ValueError, codec.loads, b'JSON' + data[4:])
+        self.assertRaises(ValueError, codec.loads, data[:-3])
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
+import io
 import os
+import json
+import time
+import threading
 import unittest
 from bs4 import BeautifulSoup
 from bgmcli.api import BangumiSession
@@ -42,6 +46,14 @@ class BangumiEpisodeCollectionTest(unittest.TestCase):
         for c_status, c_status_expected in zip(c_statuses, self._c_statuses):
             self.assertEqual(c_status_expected, c_status)
              
+    def test_ep_colls_from_soup(self):
+        soup = BeautifulSoup(self._ep_html, 'html.parser')
+        ep_colls = BangumiEpisodeCollection.ep_colls_from_soup(soup)
+        self.assertEqual(self._c_statuses,
+                         [ep_coll.c_status for ep_coll in ep_colls])
+        self.assertEqual(26, sum(ep_coll.episode.ep_type == 'EP'
+                                 for ep_coll in ep_colls))
+
     def test_from_to_json(self):
         ep_id = "519"
         ep_coll = BangumiEpisodeCollection.from_html(ep_id, self._ep_html)
@@ -82,6 +94,7 @@ class BangumiAnimeCollectionTest(unittest.TestCase):
         cls._tags = [u'科幻', u'TV', u'SUNRISE']
         cls._comment = u'佳作'
         cls._n_watched_eps = 25
+        cls._legacy_json_path = os.path.join(path, 'legacy_json')
          
     def test_from_html(self):
         sub_coll = BangumiAnimeCollection.from_html(self._sub_html,
@@ -105,6 +118,31 @@ class BangumiAnimeCollectionTest(unittest.TestCase):
         json_text = sub_coll.to_json()
         sub_coll_new = BangumiAnimeCollection.from_json(json_text)
         self.assertEqual(sub_coll, sub_coll_new)
+
+    def test_from_to_dict(self):
+        sub_coll = BangumiAnimeCollection.from_html(self._sub_html,
+                                                    self._ep_html)
+        data = sub_coll.to_dict()
+        # nested objects are dicts, episodes only in episode collections
+        self.assertEqual('519', data['ep_collections'][0]['episode']['id_'])
+        self.assertEqual([], data['subject']['eps'])
+        sub_coll_new = BangumiAnimeCollection.from_dict(data)
+        self.assertEqual(sub_coll, sub_coll_new)
+        self.assertEqual(sub_coll.ep_collections, sub_coll_new.ep_collections)
+        self.assertIs(sub_coll_new.subject,
+                      sub_coll_new.ep_collections[0].episode.subject)
+        self.assertEqual(2, json.loads(sub_coll.to_json())['schema'])
+
+    def test_from_legacy_json(self):
+        # json text of nested json text, written before to_dict
+        with io.open(self._legacy_json_path, encoding='utf-8') as f:
+            json_text = f.readline()
+        sub_coll = BangumiAnimeCollection.from_json(json_text)
+        expected = BangumiAnimeCollection.from_html(self._sub_html,
+                                                    self._ep_html)
+        self.assertEqual(expected, sub_coll)
+        self.assertEqual(expected.ep_collections, sub_coll.ep_collections)
+        self.assertEqual(expected.subject.eps, sub_coll.subject.eps)
          
     def test_n_watched_eps(self):
         sub_coll = BangumiAnimeCollection.from_html(self._sub_html,
@@ -128,6 +166,135 @@ class BangumiAnimeCollectionTest(unittest.TestCase):
         self.assertEqual(sub_coll.ep_collections[-1],
                          sub_coll.find_ep_coll("ED3"))
         self.assertIsNone(sub_coll.find_ep_coll("ED5"))
+
+    def test_dirty_fields(self):
+        class FakeSession(object):
+            def __init__(self):
+                self.dirty = set()
+                self.sent = []
+
+            def set_collection(self, coll):
+                self.sent.append(coll.dirty_fields)
+                coll._mark_clean(*coll._SYNCED_FIELDS)
+                return True
+
+            def _add_dirty(self, coll):
+                self.dirty.add(coll)
+
+            def _discard_dirty(self, coll):
+                self.dirty.discard(coll)
+
+        sub_coll = BangumiAnimeCollection.from_html(self._sub_html,
+                                                    self._ep_html)
+        session = FakeSession()
+        sub_coll.session = session
+        self.assertFalse(sub_coll.is_dirty)
+        # same values as loaded
+        sub_coll.c_status = sub_coll.c_status
+        sub_coll.tags = list(sub_coll.tags)
+        self.assertTrue(sub_coll.sync_collection())
+        self.assertEqual([], session.sent)
+
+        sub_coll.rating = 9
+        sub_coll.comment = u'神作'
+        sub_coll.n_watched_eps = 3
+        self.assertEqual({'rating', 'comment', 'n_watched_eps'},
+                         sub_coll.dirty_fields)
+        self.assertEqual({sub_coll}, session.dirty)
+        self.assertTrue(sub_coll.sync_collection())
+        self.assertEqual([{'rating', 'comment', 'n_watched_eps'}],
+                         session.sent)
+        self.assertEqual({'n_watched_eps'}, sub_coll.dirty_fields)
+        self.assertTrue(sub_coll.sync_collection())
+        self.assertEqual(1, len(session.sent))
+
+        ep_coll = sub_coll.ep_collections[-1]
+        ep_coll.c_status = 'queue'
+        self.assertEqual({'c_status'}, ep_coll.dirty_fields)
+        self.assertEqual({sub_coll, ep_coll}, session.dirty)
+        # not compared
+        self.assertEqual(sub_coll, BangumiAnimeCollection.from_json(
+            sub_coll.to_json()))
+
+        # nothing is dirty in a loaded collection, unless sync is forced
+        loaded = BangumiAnimeCollection.from_json(sub_coll.to_json())
+        loaded.session = session
+        n_sent = len(session.sent)
+        self.assertFalse(loaded.is_dirty)
+        self.assertTrue(loaded.sync_collection())
+        self.assertEqual(n_sent, len(session.sent))
+        self.assertTrue(loaded.sync_collection(force=True))
+        self.assertEqual(n_sent + 1, len(session.sent))
+
+    def test_lazy_ep_collections(self):
+        ep_html = self._ep_html
+
+        class FakeSession(object):
+            n_fetched = 0
+
+            def _lock_object(self, obj):
+                return threading.RLock()
+
+            def _get_ep_colls_for_sub_coll(self, sub_coll):
+                self.n_fetched += 1
+                sub_coll.subject.eps = BangumiEpisode.eps_from_html(ep_html)
+                return (BangumiEpisodeCollection
+                        .ep_colls_for_sub_from_html(sub_coll.subject,
+                                                    ep_html))
+
+        sub_soup = BeautifulSoup(self._sub_html, 'html.parser')
+        sub_coll = BangumiAnimeCollection.from_soup(sub_soup, None)
+        self.assertFalse(sub_coll.ep_collections_loaded)
+        self.assertEqual(self._n_watched_eps, sub_coll.n_watched_eps)
+        with self.assertRaises(AttributeError):
+            sub_coll.ep_collections
+        sub_coll_new = BangumiAnimeCollection.from_json(sub_coll.to_json())
+        self.assertFalse(sub_coll_new.ep_collections_loaded)
+        self.assertEqual(sub_coll, sub_coll_new)
+        session = FakeSession()
+        sub_coll.session = session
+        self.assertEqual(31, len(sub_coll.ep_collections))
+        self.assertEqual('watched', sub_coll.find_ep_coll('EP1').c_status)
+        self.assertEqual(1, session.n_fetched)
+        self.assertIs(sub_coll, sub_coll.ep_collections[0].sub_collection)
+        self.assertIs(session, sub_coll.ep_collections[0].session)
+
+    def test_lazy_ep_collections_threads(self):
+        ep_html = self._ep_html
+        lock = threading.RLock()
+
+        class FakeSession(object):
+            n_fetched = 0
+
+            def _lock_object(self, obj):
+                return lock
+
+            def _get_ep_colls_for_sub_coll(self, sub_coll):
+                self.n_fetched += 1
+                # other threads access ep_collections meanwhile
+                time.sleep(0.05)
+                sub_coll.subject.eps = BangumiEpisode.eps_from_html(ep_html)
+                return (BangumiEpisodeCollection
+                        .ep_colls_for_sub_from_html(sub_coll.subject,
+                                                    ep_html))
+
+        sub_soup = BeautifulSoup(self._sub_html, 'html.parser')
+        sub_coll = BangumiAnimeCollection.from_soup(sub_soup, None)
+        session = FakeSession()
+        sub_coll.session = session
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(sub_coll.ep_collections))
+            for _ in xrange(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(1, session.n_fetched)
+        self.assertEqual(32, len(results))
+        # all threads see the same episode collections
+        self.assertTrue(all(result[0] is results[0][0]
+                            for result in results))
          
     def test_watched_up_to_with_sync(self):
         with BangumiSession('glennqjy@gmail.com', '15263748') as session:
@@ -177,6 +344,7 @@ class BangumiDummySubjectCollectionTest(unittest.TestCase):
         cls.c_statuses = [4, 4, 4]
         cls.ratings = [6, 6, 7]
         cls.n_eps = [11, None, 47]
+        cls.legacy_json_path = os.path.join(path, 'legacy_json')
         
     def test_from_soup_for_li(self):
         items = self.soup.find(id='browserItemList').find_all('li')
@@ -187,6 +355,26 @@ class BangumiDummySubjectCollectionTest(unittest.TestCase):
         self.assertEqual(self.c_statuses, c_statuses)
         self.assertEqual(self.ratings, ratings)
         
+    def test_from_to_json(self):
+        items = self.soup.find(id='browserItemList').find_all('li')
+        for item in items:
+            coll = BangumiDummySubjectCollection.from_soup_for_li(
+                item, self.c_status)
+            coll.subject.other_info['aliases'] = [u'alias']
+            coll_new = BangumiDummySubjectCollection.from_json(coll.to_json())
+            self.assertEqual(coll, coll_new)
+            self.assertEqual(coll.subject, coll_new.subject)
+
+    def test_from_legacy_json(self):
+        with io.open(self.legacy_json_path, encoding='utf-8') as f:
+            json_text = f.readlines()[1]
+        item = self.soup.find(id='browserItemList').find('li')
+        expected = BangumiDummySubjectCollection.from_soup_for_li(
+            item, self.c_status)
+        coll = BangumiDummySubjectCollection.from_json(json_text)
+        self.assertEqual(expected, coll)
+        self.assertEqual(expected.subject, coll.subject)
+
     def test_to_regular_collection(self):
         with BangumiSession('glennqjy@gmail.com', '15263748') as session:
             dummy_colls = session.get_dummy_collections('anime', 4)
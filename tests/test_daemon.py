@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from bgmcli.cli.client import send_command
+from bgmcli.cli.daemon import CommandServer
+from bgmcli.cli.exception import InvalidCommandError, DaemonError
+
+
+class FakeBackend(object):
+
+    def execute_command(self, command):
+        if command == 'bogus':
+            raise InvalidCommandError("Got invalid command: bogus")
+        print 'executed', command
+
+
+class CommandServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'sock')
+        self.server = CommandServer(FakeBackend(), self.path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_send_command(self):
+        self.assertEqual((True, 'executed 星际牛仔 EP1\n'),
+                         send_command('星际牛仔 EP1', self.path))
+        self.assertEqual((False, 'Got invalid command: bogus\n'),
+                         send_command('bogus', self.path))
+
+    def test_socket(self):
+        # no access for group and others
+        self.assertEqual(0, os.stat(self.path).st_mode & 0o077)
+        self.assertRaises(DaemonError, CommandServer, FakeBackend(),
+                          self.path)
+
+    def test_stale_socket(self):
+        path = os.path.join(self.tmp_dir, 'stale')
+        server = CommandServer(FakeBackend(), path)
+        # socket file left behind, e.g. by a killed daemon
+        server.socket.close()
+        server = CommandServer(FakeBackend(), path)
+        server.server_close()
+        self.assertFalse(os.path.exists(path))
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+import datetime
 from bs4 import BeautifulSoup
 from bgmcli.api import BangumiSession
 from bgmcli.api.element import BangumiAnime, BangumiEpisode,\
@@ -116,6 +117,36 @@ class BangumiAnimeTest(unittest.TestCase):
         self.assertEqual(self._n_eps, sub.n_eps)
         sub.n_eps = 10
         self.assertEqual(10, sub.n_eps)
+
+    def test_info_box(self):
+        sub = BangumiAnime.from_html(self._sub_html, self._ep_html)
+        self.assertIsNone(sub._info)
+        self.assertEqual(datetime.date(1998, 10, 23), sub.air_date)
+        self.assertEqual(u'サンライズ', sub.studio)
+        self.assertEqual([u'菅野よう子', u'シートベルツ'], sub.info_box[u'音乐'])
+        self.assertEqual(5, len(sub.info_box[u'别名']))
+        self.assertIs(sub.info_box, sub.info_box)
+        new_sub = BangumiAnime.from_json(sub.to_json())
+        self.assertEqual(sub.info_box, new_sub.info_box)
+        self.assertIsNone(BangumiAnime('253').air_date)
+
+    def test_lazy_eps(self):
+        sub_soup = BeautifulSoup(self._sub_html, 'html.parser')
+        sub = BangumiAnime.from_soup(sub_soup, None)
+        self.assertFalse(sub.eps_loaded)
+        self.assertEqual(self._n_eps, sub.n_eps)
+        with self.assertRaises(AttributeError):
+            sub.eps
+        new_sub = BangumiAnime.from_json(sub.to_json())
+        self.assertFalse(new_sub.eps_loaded)
+        self.assertEqual(sub, new_sub)
+        calls = []
+        sub.set_eps_loader(lambda: calls.append(1) or
+                           BangumiEpisode.eps_from_html(self._ep_html))
+        self.assertEqual(31, len(sub.eps))
+        self.assertEqual(31, len(sub.eps))
+        self.assertEqual(1, len(calls))
+        self.assertIs(sub, sub.eps[0].subject)
         
     def test_eps(self):
         sub = BangumiAnime.from_html(self._sub_html, self._ep_html)
@@ -0,0 +1,77 @@
+import gc
+import os
+import unittest
+from bs4 import BeautifulSoup
+from bgmcli.api.identity import IdentityMap
+from bgmcli.api.element import BangumiAnime, BangumiEpisode
+from bgmcli.api.collection import BangumiAnimeCollection,\
+    BangumiEpisodeCollection
+from test_utils import module_path
+
+
+class IdentityMapTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.split(module_path(cls.setUpClass))[0]
+        with open(os.path.join(path, 'ep_html')) as f:
+            cls._ep_html = f.read()
+        with open(os.path.join(path, 'sub_html')) as f:
+            cls._sub_html = f.read()
+
+    def setUp(self):
+        self.identity_map = IdentityMap()
+
+    def test_intern_subject(self):
+        sub = self.identity_map.intern_subject(
+            BangumiAnime.from_html(self._sub_html, self._ep_html))
+        sub.other_info['aliases'] = ['xjnz']
+        new_sub = BangumiAnime.from_html(self._sub_html, self._ep_html)
+        new_sub.n_eps = 24
+        self.assertIs(sub, self.identity_map.intern_subject(new_sub))
+        # updated in place, keeping other_info
+        self.assertEqual(24, sub.n_eps)
+        self.assertEqual(['xjnz'], sub.other_info['aliases'])
+        self.assertIs(sub, sub.eps[0].subject)
+        self.assertIs(sub.eps[0], self.identity_map.get_episode('519'))
+
+    def test_not_loaded_eps_kept(self):
+        sub = self.identity_map.intern_subject(
+            BangumiAnime.from_html(self._sub_html, self._ep_html))
+        eps = sub.eps
+        sub_soup = BeautifulSoup(self._sub_html, 'html.parser')
+        new_sub = BangumiAnime.from_soup(sub_soup, None)
+        self.assertIs(sub, self.identity_map.intern_subject(new_sub))
+        self.assertEqual(eps, sub.eps)
+
+    def test_intern_episode(self):
+        sub = self.identity_map.intern_subject(
+            BangumiAnime.from_html(self._sub_html, self._ep_html))
+        ep = BangumiEpisode.from_html('519', self._ep_html)
+        ep.status = 'na'
+        interned = self.identity_map.intern_episode(ep)
+        self.assertIs(sub.eps[0], interned)
+        self.assertEqual('na', interned.status)
+        self.assertIs(sub, interned.subject)
+        self.assertEqual(interned, sub.eps[0])
+
+    def test_intern_collections(self):
+        sub_coll = BangumiAnimeCollection.from_html(self._sub_html,
+                                                    self._ep_html)
+        self.identity_map.intern_sub_collection(sub_coll)
+        new_sub_coll = BangumiAnimeCollection.from_html(self._sub_html,
+                                                        self._ep_html)
+        self.identity_map.intern_sub_collection(new_sub_coll)
+        self.assertIs(sub_coll.subject, new_sub_coll.subject)
+        self.assertIs(sub_coll.ep_collections[3].episode,
+                      new_sub_coll.ep_collections[3].episode)
+        ep_coll = BangumiEpisodeCollection.from_html('519', self._ep_html)
+        self.identity_map.intern_ep_collection(ep_coll)
+        self.assertIs(sub_coll.subject.eps[0], ep_coll.episode)
+
+    def test_weak_references(self):
+        self.identity_map.intern_subject(
+            BangumiAnime.from_html(self._sub_html, self._ep_html))
+        gc.collect()
+        self.assertEqual(0, len(self.identity_map))
+        self.assertIsNone(self.identity_map.get_subject('253'))
@@ -0,0 +1,61 @@
+import io
+import os
+import unittest
+from bs4 import BeautifulSoup
+from bgmcli.api.jsonlines import dump_collections, iter_load_collections
+from bgmcli.api.collection import BangumiAnimeCollection,\
+    BangumiDummySubjectCollection
+from test_utils import module_path
+
+
+class JSONLinesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.split(module_path(cls.setUpClass))[0]
+        with open(os.path.join(path, 'ep_html')) as f:
+            ep_html = f.read()
+        with open(os.path.join(path, 'sub_html')) as f:
+            sub_html = f.read()
+        with open(os.path.join(path, 'on_hold_page')) as f:
+            soup = BeautifulSoup(f.read(), 'html.parser')
+        cls.sub_coll = BangumiAnimeCollection.from_html(sub_html, ep_html)
+        cls.dummy_colls = [
+            BangumiDummySubjectCollection.from_soup_for_li(li, 4)
+            for li in soup.find(id='browserItemList').find_all('li')]
+        cls.legacy_json_path = os.path.join(path, 'legacy_json')
+
+    def test_dump_load(self):
+        colls = self.dummy_colls + [self.sub_coll]
+        f = io.StringIO()
+        writes = []
+        f.write = lambda text, write=f.write: (writes.append(text),
+                                               write(text))
+        # a generator, consumed while writing
+        n_written = dump_collections((coll for coll in colls), f,
+                                     buffer_size=1)
+        self.assertEqual(4, n_written)
+        self.assertEqual(4, len(writes))
+        f.seek(0)
+        loaded = iter_load_collections(f)
+        self.assertFalse(isinstance(loaded, list))
+        loaded = list(loaded)
+        self.assertEqual([type(coll) for coll in colls],
+                         [type(coll) for coll in loaded])
+        self.assertEqual(colls, loaded)
+        self.assertEqual(self.sub_coll.ep_collections,
+                         loaded[-1].ep_collections)
+
+    def test_load_legacy(self):
+        with io.open(self.legacy_json_path, encoding='utf-8') as f:
+            loaded = list(iter_load_collections(f))
+        self.assertEqual([BangumiAnimeCollection,
+                          BangumiDummySubjectCollection],
+                         [type(coll) for coll in loaded])
+
+    def test_invalid_line(self):
+        f = io.StringIO(self.sub_coll.to_json() + u'\n\n{"a": 1}\n')
+        loaded = iter_load_collections(f, BangumiAnimeCollection)
+        self.assertEqual(self.sub_coll, next(loaded))
+        with self.assertRaisesRegexp(ValueError, 'line 3'):
+            next(loaded)
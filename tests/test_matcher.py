@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import unittest
+from bgmcli.cli.matcher import SubjectMatcher
+from bgmcli.cli.command_executor import match_collection
+from bgmcli.cli.exception import InvalidCommandError
+
+
+class SubjectMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = SubjectMatcher()
+        self.matcher.add('253', [u'カウボーイビバップ', u'星际牛仔',
+                                 u'xingjiniuzi', u'xjnz'])
+        self.matcher.add('1451', [u'東のエデン', u'东之伊甸',
+                                  u'dongzhiyidian', u'dzyd'])
+        self.matcher.add('8484', [u'機動警察パトレイバー', u'机动警察',
+                                  u'jidongjingcha', u'jdjc'])
+
+    def test_add(self):
+        self.assertEqual(12, len(self.matcher))
+        self.matcher.add('253', [u'星际牛仔', None, u'Cowboy Bebop'])
+        self.assertEqual(13, len(self.matcher))
+
+    def test_exact(self):
+        self.assertEqual([('253', u'xjnz', 1.0)],
+                         self.matcher.match(u'xjnz', 1))
+        self.assertEqual('1451', self.matcher.match(u'东之伊甸')[0][0])
+
+    def test_typo(self):
+        self.assertEqual('253', self.matcher.match(u'xingjinuizi')[0][0])
+        self.assertEqual('8484', self.matcher.match(u'jidong jingca')[0][0])
+        self.assertEqual('253', self.matcher.match(u'xjn')[0][0])
+
+    def test_not_found(self):
+        self.assertEqual([], self.matcher.match(u'abcdefg'))
+        self.assertEqual([], self.matcher.match(u''))
+
+
+class FakeSubject(object):
+
+    def __init__(self, id_, title):
+        self.id_ = id_
+        self.title = title
+        self.ch_title = None
+        self.other_info = {}
+
+
+class FakeCollection(object):
+
+    def __init__(self, id_, title):
+        self.subject = FakeSubject(id_, title)
+
+
+class MatchCollectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.colls = [FakeCollection('253', u'xingjiniuzi'),
+                      FakeCollection('254', u'xingjiniuzi2'),
+                      FakeCollection('1451', u'dongzhiyidian')]
+        self.matcher = SubjectMatcher()
+        for coll in self.colls:
+            self.matcher.add(coll.subject.id_, [coll.subject.title])
+
+    def _match(self, name, strict, matcher=True):
+        return match_collection(self.colls, name,
+                                self.matcher if matcher else None,
+                                strict).subject.id_
+
+    def test_strict(self):
+        # exact, or clearly closer than the runner-up
+        self.assertEqual('253', self._match(u'xingjiniuzi', True))
+        self.assertEqual('1451', self._match(u'dongzhiyidan', True))
+        # as close to both
+        self.assertEqual('253', self._match(u'xingjiniuz', False))
+        with self.assertRaises(InvalidCommandError) as cm:
+            self._match(u'xingjiniuz', True)
+        self.assertIn(u'xingjiniuzi2', cm.exception.message)
+
+    def test_strict_same_names(self):
+        self.colls.append(FakeCollection('255', u'xingjiniuzi'))
+        self.matcher.add('255', [u'xingjiniuzi'])
+        for matcher in (True, False):
+            self.assertEqual('253', self._match(u'xingjiniuzi', False,
+                                                matcher))
+            with self.assertRaises(InvalidCommandError):
+                self._match(u'xingjiniuzi', True, matcher)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from bgmcli.api.element import BangumiEpisode
+from bgmcli.api.collection import BangumiSubjectCollectionFactory,\
+    BangumiAnimeCollection, BangumiDummySubjectCollection
+from bgmcli.api.parsing import ParserPool
+from test_utils import module_path
+
+
+class ParserPoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.split(module_path(cls.setUpClass))[0]
+        with open(os.path.join(path, 'ep_html')) as f:
+            cls._ep_content = f.read()
+        with open(os.path.join(path, 'sub_html')) as f:
+            cls._sub_content = f.read()
+        with open(os.path.join(path, 'on_hold_page')) as f:
+            cls._list_content = f.read()
+        cls._pool = ParserPool(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._pool.close()
+
+    def test_parse_sub_collection(self):
+        expected = BangumiSubjectCollectionFactory.from_html(
+            self._sub_content.decode('utf-8'),
+            self._ep_content.decode('utf-8'))
+        sub_coll = self._pool.parse_sub_collection(self._sub_content,
+                                                   self._ep_content)
+        self.assertIsInstance(sub_coll, BangumiAnimeCollection)
+        self.assertEqual(expected, sub_coll)
+        self.assertEqual(expected.subject, sub_coll.subject)
+        self.assertIs(sub_coll, sub_coll.ep_collections[0].sub_collection)
+
+    def test_parse_dummy_colls(self):
+        results = [self._pool.parse_dummy_colls_async(self._list_content, 4)
+                   for _ in range(3)]
+        colls = [result.get() for result in results]
+        self.assertEqual(colls[0], colls[2])
+        self.assertTrue(colls[0])
+        for coll in colls[0]:
+            self.assertIsInstance(coll, BangumiDummySubjectCollection)
+            self.assertEqual(4, coll.c_status)
+
+    def test_parse_eps(self):
+        expected = BangumiEpisode.eps_from_html(
+            self._ep_content.decode('utf-8'))
+        self.assertEqual(expected, self._pool.parse_eps(self._ep_content))
+        ep_colls = self._pool.parse_ep_colls(self._ep_content)
+        self.assertEqual(expected, [ep_c.episode for ep_c in ep_colls])
+        self.assertEqual('watched', ep_colls[0].c_status)
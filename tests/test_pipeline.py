@@ -0,0 +1,144 @@
+import io
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from bgmcli.api.pipeline import Pipeline, JSONLinesSink, SQLiteSink,\
+    CallbackSink
+
+
+class FakeSubject(object):
+
+    def __init__(self, id_):
+        self.id_ = id_
+
+
+class FakeCollection(object):
+
+    _SUB_TYPE = 'anime'
+
+    def __init__(self, sub_id):
+        self.subject = FakeSubject(sub_id)
+
+    def to_json(self):
+        return json.dumps({'sub_id': self.subject.id_})
+
+
+class ClosingSink(CallbackSink):
+    """Records whether it was closed as complete"""
+
+    def __init__(self, callback):
+        super(ClosingSink, self).__init__(callback)
+        self.closed = []
+
+    def close(self, complete=True):
+        self.closed.append(complete)
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_run(self):
+        stored = []
+        sink = ClosingSink(stored.append)
+        pipeline = Pipeline(xrange(100), lambda i: i * 2, lambda i: i + 1,
+                            sink, n_fetchers=4, n_parsers=2, max_queued=2)
+        fetch, parse, store = pipeline.run()
+        self.assertEqual(range(1, 200, 2), sorted(stored))
+        self.assertEqual([True], sink.closed)
+        self.assertEqual([100, 100, 100],
+                         [m.processed for m in (fetch, parse, store)])
+        # queues are bounded
+        self.assertTrue(all(m.max_queued <= 2
+                            for m in (fetch, parse, store)))
+        self.assertEqual([], pipeline.errors)
+        self.assertRaises(RuntimeError, pipeline.run)
+
+    def test_errors(self):
+        def fetch(i):
+            if i % 10 == 0:
+                raise ValueError(i)
+            return i
+
+        stored = []
+        pipeline = Pipeline(xrange(50), fetch, str,
+                            CallbackSink(stored.append))
+        fetch_metrics = pipeline.run()[0]
+        self.assertEqual(45, len(stored))
+        self.assertEqual(5, fetch_metrics.errors)
+        self.assertEqual([0, 10, 20, 30, 40],
+                         sorted(item for item, _ in pipeline.errors))
+
+    def test_items_error(self):
+        def items():
+            for i in xrange(10):
+                yield i
+            raise IOError("export cut short")
+
+        stored = []
+        sink = ClosingSink(stored.append)
+        pipeline = Pipeline(items(), lambda i: i, lambda i: i, sink,
+                            max_queued=2)
+        with self.assertRaises(IOError):
+            pipeline.run()
+        # items before the error are stored
+        self.assertEqual(range(10), sorted(stored))
+        self.assertEqual([False], sink.closed)
+
+    def test_cancel(self):
+        stored = []
+        blocked = threading.Event()
+
+        def parse(i):
+            if i == 5:
+                pipeline.cancel()
+            return i
+
+        def items():
+            for i in xrange(10000):
+                yield i
+            blocked.set()
+
+        sink = ClosingSink(stored.append)
+        pipeline = Pipeline(items(), lambda i: i, parse, sink, max_queued=4)
+        pipeline.run()
+        self.assertTrue(pipeline.cancelled)
+        self.assertEqual([False], sink.closed)
+        # producer stopped early as queues were full
+        self.assertFalse(blocked.is_set())
+        self.assertTrue(len(stored) < 100)
+
+
+class SinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_json_lines_sink(self):
+        path = os.path.join(self.tmp_dir, 'colls.jsonl')
+        sink = JSONLinesSink(path)
+        sink.write(FakeCollection('253'))
+        sink.write(FakeCollection('254'))
+        sink.close()
+        with io.open(path, encoding='utf-8') as f:
+            self.assertEqual(['253', '254'],
+                             [json.loads(line)['sub_id'] for line in f])
+
+    def test_sqlite_sink(self):
+        path = os.path.join(self.tmp_dir, 'colls.db')
+        for _ in xrange(2):
+            sink = SQLiteSink(path, commit_every=1)
+            sink.write(FakeCollection('253'))
+            sink.write(FakeCollection('254'))
+            sink.close()
+        conn = sqlite3.connect(path)
+        rows = conn.execute('SELECT sub_id, sub_type FROM collections '
+                            'ORDER BY sub_id').fetchall()
+        conn.close()
+        # written again, not duplicated
+        self.assertEqual([('253', 'anime'), ('254', 'anime')], rows)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from bgmcli.api.element import BangumiAnime
+from bgmcli.api.collection import BangumiAnimeCollection
+from bgmcli.api.planner import PlannedWrite, make_write_plan
+from test_utils import module_path
+
+
+class MakeWritePlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.split(module_path(cls.setUpClass))[0]
+        with open(os.path.join(path, 'ep_html')) as f:
+            cls._ep_html = f.read()
+        with open(os.path.join(path, 'sub_html')) as f:
+            cls._sub_html = f.read()
+
+    def setUp(self):
+        self.current = BangumiAnimeCollection.from_html(self._sub_html,
+                                                        self._ep_html)
+        self.target = BangumiAnimeCollection.from_html(self._sub_html,
+                                                       self._ep_html)
+        self.ep_ids = [ep_coll.episode.id_
+                       for ep_coll in self.target.ep_collections]
+
+    def _actions(self, plan):
+        return [(write.action, write.ep_ids, write.value) for write in plan]
+
+    def test_no_writes(self):
+        self.target.tags = list(reversed(self.target.tags))
+        self.assertEqual(0, len(make_write_plan(self.target, self.current)))
+
+    def test_ep_writes(self):
+        ep_colls = self.target.ep_collections
+        ep_colls[24].c_status = 'watched'
+        ep_colls[26].c_status = 'queue'
+        ep_colls[27].c_status = 'watched'
+        # status not in target is removed
+        self.current.ep_collections[29].c_status = 'drop'
+        self.target.rating = 9
+        plan = make_write_plan(self.target, self.current)
+        self.assertEqual(
+            [(PlannedWrite.SET_COLLECTION, [], None),
+             (PlannedWrite.REMOVE_EP_STATUS, [self.ep_ids[29]], None),
+             (PlannedWrite.MARK_WATCHED,
+              [self.ep_ids[24], self.ep_ids[27]], None),
+             (PlannedWrite.SET_EP_STATUS, [self.ep_ids[26]], 'queue')],
+            self._actions(plan))
+        self.assertFalse(plan.succeeded)
+        self.assertIn(u'mark_watched ep ' + self.ep_ids[24], plan.format())
+
+    def test_uncollected_ep(self):
+        # status of uncollected episodes parsed from a bare "status" class
+        self.target.ep_collections[30]._c_status = ''
+        self.current.ep_collections[30].c_status = 'queue'
+        plan = make_write_plan(self.target, self.current)
+        self.assertEqual(
+            [(PlannedWrite.REMOVE_EP_STATUS, [self.ep_ids[30]], None)],
+            self._actions(plan))
+        # None and '' are both uncollected
+        self.current.ep_collections[30]._c_status = None
+        self.assertEqual(0, len(make_write_plan(self.target, self.current)))
+
+    def test_watched_up_to(self):
+        self.target.ep_collections[28].c_status = 'watched_up_to'
+        plan = make_write_plan(self.target, self.current)
+        # "queue" and "drop" episodes are overridden, the rest are watched
+        self.assertEqual(
+            [(PlannedWrite.MARK_WATCHED, self.ep_ids[24:29], None)],
+            self._actions(plan))
+
+    def test_n_watched_eps(self):
+        target = BangumiAnimeCollection(self.target.subject, 3, 8,
+                                        self.target.tags,
+                                        self.target.comment, 20)
+        plan = make_write_plan(target, self.current)
+        self.assertEqual([(PlannedWrite.SET_N_WATCHED_EPS, [], 20)],
+                         self._actions(plan))
+
+    def test_remove_collection(self):
+        target = BangumiAnimeCollection(self.target.subject)
+        self.assertEqual([(PlannedWrite.REMOVE_COLLECTION, [], None)],
+                         self._actions(make_write_plan(target,
+                                                       self.current)))
+
+    def test_different_subject(self):
+        other = BangumiAnimeCollection(BangumiAnime('265'), 3)
+        with self.assertRaises(ValueError):
+            make_write_plan(self.target, other)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+from bgmcli.api.element import BangumiDummySubject
+from bgmcli.api.collection import BangumiDummySubjectCollection
+from bgmcli.cli.prefetch import CollectionPrefetcher
+from bgmcli.cli.command_executor import ListEpsCommandExecutor
+
+
+class FakeRegularCollection(object):
+
+    def __init__(self, subject):
+        self.subject = subject
+        self.ep_collections = []
+
+
+def make_dummy_collection(id_, title, started=None, release=None):
+    """Dummy collection loading a fake regular collection without session,
+    recording the threads it is loaded in
+    """
+    coll = BangumiDummySubjectCollection(BangumiDummySubject(id_, title), 3)
+    coll.started = started
+    coll.loaded_in = []
+
+    def to_regular_collection():
+        coll.loaded_in.append(threading.current_thread())
+        if started is not None:
+            started.set()
+        if release is not None:
+            release.wait(5)
+        return FakeRegularCollection(coll.subject)
+
+    coll.to_regular_collection = to_regular_collection
+    return coll
+
+
+class CollectionPrefetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loaded = []
+        self.prefetcher = CollectionPrefetcher(
+            lambda coll, new_coll: self.loaded.append(coll), 1)
+
+    def tearDown(self):
+        self.prefetcher.close(5)
+
+    def test_load_in_caller(self):
+        coll = make_dummy_collection('253', u'カウボーイビバップ')
+        new_coll = self.prefetcher.get_regular(coll)
+        self.assertIs(coll.subject, new_coll.subject)
+        self.assertEqual([threading.current_thread()], coll.loaded_in)
+        self.assertIs(new_coll, self.prefetcher.get_regular(coll))
+        self.assertEqual(1, len(coll.loaded_in))
+        self.assertEqual([], self.loaded)
+
+    def test_wait_for_worker(self):
+        started = threading.Event()
+        release = threading.Event()
+        coll = make_dummy_collection('253', u'カウボーイビバップ', started,
+                                     release)
+        self.prefetcher.prefetch([coll])
+        self.assertTrue(started.wait(5))
+        results = []
+        getter = threading.Thread(
+            target=lambda: results.append(self.prefetcher.get_regular(coll)))
+        getter.start()
+        getter.join(0.2)
+        self.assertTrue(getter.is_alive())
+        release.set()
+        getter.join(5)
+        self.assertEqual(1, len(results))
+        self.assertEqual(1, len(coll.loaded_in))
+        self.assertIsNot(threading.current_thread(), coll.loaded_in[0])
+        self.assertIs(coll.subject, results[0].subject)
+
+    def test_close_timeout(self):
+        release = threading.Event()
+        coll = make_dummy_collection('253', u'カウボーイビバップ',
+                                     threading.Event(), release)
+        self.prefetcher.prefetch([coll])
+        self.assertTrue(coll.started.wait(5))
+        self.prefetcher.close(0.1)
+        self.assertTrue(any(worker.is_alive()
+                            for worker in self.prefetcher._workers))
+        release.set()
+
+    def test_update_in_place(self):
+        colls = [make_dummy_collection('253', u'カウボーイビバップ'),
+                 make_dummy_collection('1451', u'東のエデン'),
+                 make_dummy_collection('8484', u'機動警察パトレイバー')]
+        collections = list(colls)
+        executor = ListEpsCommandExecutor(['lseps', u'東のエデン'],
+                                          collections,
+                                          prefetcher=self.prefetcher)
+        new_coll = executor._find_collection(u'東のエデン')
+        self.assertIsInstance(new_coll, FakeRegularCollection)
+        self.assertEqual([colls[0], new_coll, colls[2]], collections)
+        self.assertEqual(['253', '1451', '8484'],
+                         [coll.subject.id_ for coll in collections])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from bs4 import BeautifulSoup
+from bgmcli.api.element import BangumiAnime
+from bgmcli.api.collection import BangumiEpisodeCollection
+from bgmcli.api.progress import BangumiAiringProgress
+from test_utils import module_path
+
+
+class BangumiAiringProgressTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.split(module_path(cls.setUpClass))[0]
+        with open(os.path.join(path, 'ep_html')) as f:
+            cls._ep_html = f.read()
+        with open(os.path.join(path, 'sub_html')) as f:
+            cls._sub_html = f.read()
+
+    def setUp(self):
+        self.sub = BangumiAnime.from_html(self._sub_html, self._ep_html)
+        soup = BeautifulSoup(self._ep_html, 'html.parser')
+        self.ep_colls = BangumiEpisodeCollection.ep_colls_from_soup(soup)
+
+    def test_counts(self):
+        progress = BangumiAiringProgress(self.sub, self.ep_colls)
+        self.assertIs(self.sub, progress.subject)
+        self.assertEqual(26, progress.n_eps)
+        self.assertEqual(26, progress.n_aired)
+        self.assertEqual(24, progress.n_watched)
+        # EP25 is queued, EP26 is dropped
+        self.assertEqual([25], [ep_coll.episode.ep_num
+                                for ep_coll in progress.backlog])
+        self.assertEqual([], progress.today)
+
+    def test_today(self):
+        self.ep_colls[24].episode.status = 'today'
+        self.ep_colls[25].episode.status = 'today'
+        self.ep_colls[25].c_status = 'queue'
+        progress = BangumiAiringProgress(self.sub, self.ep_colls)
+        self.assertEqual(24, progress.n_aired)
+        self.assertEqual([], progress.backlog)
+        self.assertEqual([25, 26], [ep_coll.episode.ep_num
+                                    for ep_coll in progress.today])
@@ -0,0 +1,32 @@
+import time
+import threading
+import unittest
+from bgmcli.api.ratelimit import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_burst(self):
+        limiter = RateLimiter(20, 5)
+        start = time.time()
+        for _ in range(5):
+            limiter.acquire()
+        self.assertLess(time.time() - start, 0.04)
+        limiter.acquire()
+        self.assertGreater(time.time() - start, 0.04)
+
+    def test_threads(self):
+        limiter = RateLimiter(50)
+        start = time.time()
+        threads = [threading.Thread(target=limiter.acquire)
+                   for _ in range(11)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # first one goes out at once, the others 20ms apart
+        self.assertGreater(time.time() - start, 0.19)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, RateLimiter, 0)
+        self.assertRaises(ValueError, RateLimiter, 1, 0)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from bgmcli.api.element import BangumiAnime
+from bgmcli.api.collection import BangumiAnimeCollection,\
+    BangumiDummySubjectCollection
+from bgmcli.api.element import BangumiDummySubject
+from bgmcli.api.restore import RestoreCheckpoint, plan_writes,\
+    SET_COLLECTION, SET_N_WATCHED_EPS, SUBJECT_DONE
+
+
+class PlanWritesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.exported = BangumiAnimeCollection(
+            BangumiAnime('253', n_eps=26), 3, 8, [u'科幻', u'TV'], u'佳作',
+            12)
+        self.current = BangumiAnimeCollection(
+            BangumiAnime('253', n_eps=26), 3, 8, [u'TV', u'科幻'], u'佳作',
+            12)
+
+    def test_no_writes(self):
+        self.assertEqual([], plan_writes(self.exported, self.current))
+
+    def test_writes(self):
+        self.current.rating = 7
+        self.assertEqual([SET_COLLECTION],
+                         plan_writes(self.exported, self.current))
+        self.current.n_watched_eps = 0
+        self.assertEqual([SET_COLLECTION, SET_N_WATCHED_EPS],
+                         plan_writes(self.exported, self.current))
+
+    def test_not_collected(self):
+        current = BangumiAnimeCollection(BangumiAnime('253', n_eps=26))
+        self.assertEqual([SET_COLLECTION, SET_N_WATCHED_EPS],
+                         plan_writes(self.exported, current))
+        # no episodes can be watched for "wish"
+        self.exported.c_status = 1
+        self.assertEqual([SET_COLLECTION],
+                         plan_writes(self.exported, current))
+
+    def test_dummy_collection(self):
+        exported = BangumiDummySubjectCollection(
+            BangumiDummySubject('253'), 4, 8, [u'TV'])
+        self.assertEqual([SET_COLLECTION],
+                         plan_writes(exported, self.current))
+
+
+class RestoreCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'restore.checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_resume(self):
+        with RestoreCheckpoint(self.path) as checkpoint:
+            checkpoint.record('253', SET_COLLECTION)
+            checkpoint.record('253', SUBJECT_DONE)
+            checkpoint.record('265', SET_COLLECTION)
+        # killed while writing a record
+        with io.open(self.path, 'a', encoding='utf-8') as f:
+            f.write(u'{"sub_id": "265", "wri')
+        with RestoreCheckpoint(self.path) as checkpoint:
+            self.assertEqual(3, len(checkpoint))
+            self.assertTrue(checkpoint.is_done(u'253', SUBJECT_DONE))
+            self.assertTrue(checkpoint.is_done(u'265', SET_COLLECTION))
+            self.assertFalse(checkpoint.is_done(u'265', SET_N_WATCHED_EPS))
+            checkpoint.record('265', SET_N_WATCHED_EPS)
+        with RestoreCheckpoint(self.path) as checkpoint:
+            self.assertTrue(checkpoint.is_done(u'265', SET_N_WATCHED_EPS))
+
+    def test_read_only(self):
+        with RestoreCheckpoint(self.path, read_only=True) as checkpoint:
+            self.assertEqual(0, len(checkpoint))
+            self.assertRaises(IOError, checkpoint.record, '253',
+                              SET_COLLECTION)
+        self.assertFalse(os.path.exists(self.path))
+        with RestoreCheckpoint(self.path) as checkpoint:
+            checkpoint.record('253', SET_COLLECTION)
+        with RestoreCheckpoint(self.path, read_only=True) as checkpoint:
+            self.assertTrue(checkpoint.is_done(u'253', SET_COLLECTION))
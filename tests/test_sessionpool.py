@@ -0,0 +1,160 @@
+import time
+import threading
+import unittest
+from bgmcli.api.exception import LoginFailedError, SessionExpiredError
+from bgmcli.api.sessionpool import SessionPool
+
+
+class FakeSession(object):
+
+    def __init__(self, email, password, rate_limiter):
+        if password != 'password':
+            raise LoginFailedError("Login failed.")
+        self.email = email
+        self.rate_limiter = rate_limiter
+        self.expired = False
+        self.n_relogins = 0
+        self.logged_out = False
+
+    def relogin(self, password):
+        self.n_relogins += 1
+        self.expired = False
+
+    def logout(self):
+        self.logged_out = True
+
+    def get_dummy_collections(self, sub_type, c_status, user_id):
+        if self.expired:
+            raise SessionExpiredError("Login expired")
+        # let other workers take other accounts
+        time.sleep(0.05)
+        return [(self.email, user_id)]
+
+
+class SessionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = {'a@example.com': 'password',
+                         'b@example.com': 'password',
+                         'c@example.com': 'password'}
+        self.sessions = []
+
+    def factory(self, email, password, rate_limiter):
+        session = FakeSession(email, password, rate_limiter)
+        self.sessions.append(session)
+        return session
+
+    def test_reuse(self):
+        with SessionPool(self.accounts, session_factory=self.factory,
+                         max_request_rate=5) as pool:
+            with pool.session('a@example.com') as session:
+                self.assertEqual(5, session.rate_limiter.rate)
+            with pool.session('a@example.com') as session_again:
+                self.assertIs(session, session_again)
+            with self.assertRaises(KeyError):
+                pool.acquire('d@example.com')
+        self.assertEqual(1, len(self.sessions))
+        self.assertTrue(session.logged_out)
+
+    def test_max_sessions(self):
+        pool = SessionPool(self.accounts, max_sessions=2,
+                           session_factory=self.factory)
+        session_a = pool.acquire('a@example.com')
+        with pool.session('b@example.com'):
+            pass
+        # b is idle and evicted for c
+        with pool.session('c@example.com'):
+            self.assertEqual(2, len(pool))
+        self.assertTrue(self.sessions[1].logged_out)
+        self.assertFalse(session_a.logged_out)
+        # c is evicted once idle, after a is given back
+        acquired = []
+        thread = threading.Thread(
+            target=lambda: acquired.append(pool.acquire('b@example.com')))
+        pool.acquire('c@example.com')
+        thread.start()
+        thread.join(0.2)
+        self.assertEqual([], acquired)
+        pool.release(self.sessions[2])
+        thread.join(5)
+        self.assertEqual(1, len(acquired))
+        self.assertTrue(self.sessions[2].logged_out)
+
+    def test_login_failed(self):
+        self.accounts['b@example.com'] = 'wrong'
+        pool = SessionPool(self.accounts, max_sessions=1,
+                           session_factory=self.factory)
+        with self.assertRaises(LoginFailedError):
+            pool.acquire('b@example.com')
+        # the room is given back
+        with pool.session('a@example.com'):
+            self.assertEqual(1, len(pool))
+
+    def test_spread(self):
+        pool = SessionPool(self.accounts, session_factory=self.factory)
+        lists = pool.get_dummy_collections('anime', 3,
+                                           [str(i) for i in xrange(12)],
+                                           n_workers=3)
+        self.assertEqual(12, len(lists))
+        self.assertEqual('7', lists['7'][0][1])
+        self.assertEqual(set(self.accounts),
+                         set(coll[0] for colls in lists.values()
+                             for coll in colls))
+
+    def test_relogin(self):
+        pool = SessionPool({'a@example.com': 'password'},
+                           session_factory=self.factory)
+        with pool.session() as session:
+            session.expired = True
+        lists = pool.get_dummy_collections('anime', 3,
+                                           [str(i) for i in xrange(8)],
+                                           n_workers=8)
+        self.assertEqual(8, len(lists))
+        # once for all workers getting the expired login
+        self.assertEqual(1, session.n_relogins)
+
+    def test_run_relogin(self):
+        pool = SessionPool(self.accounts, session_factory=self.factory)
+        calls = []
+
+        def expire_once(session):
+            calls.append(session)
+            if len(calls) == 1:
+                raise SessionExpiredError("Login expired")
+            return session.email
+
+        self.assertEqual('a@example.com',
+                         pool.run(expire_once, 'a@example.com'))
+        # called again with the same session, logged in again
+        self.assertEqual(2, len(calls))
+        self.assertIs(calls[0], calls[1])
+        self.assertEqual(1, calls[0].n_relogins)
+
+        def always_expired(session):
+            raise SessionExpiredError("Login expired")
+
+        # called once more only
+        with self.assertRaises(SessionExpiredError):
+            pool.run(always_expired, 'a@example.com')
+        self.assertEqual(2, calls[0].n_relogins)
+
+    def test_map_errors(self):
+        pool = SessionPool(self.accounts, session_factory=self.factory)
+
+        def func(session, item):
+            if item == 3:
+                raise ValueError(item)
+            return item * 2
+
+        results = list(pool.map(func, xrange(6), n_workers=3))
+        self.assertEqual(range(6), [result.item for result in results])
+        self.assertEqual([0, 2, 4, None, 8, 10],
+                         [result.value for result in results])
+        self.assertEqual([True, True, True, False, True, True],
+                         [result.succeeded for result in results])
+        self.assertIsInstance(results[3].error, ValueError)
+
+        pool = SessionPool({'a@example.com': 'wrong'},
+                           session_factory=self.factory)
+        with self.assertRaises(LoginFailedError):
+            pool.get_dummy_collections('anime', 3, ['1', '2'])
@@ -0,0 +1,72 @@
+import time
+import threading
+import unittest
+from bgmcli.api.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.n_calls = 0
+
+    def fetch(self, url):
+        self.n_calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if url == 'fail':
+            raise ValueError(url)
+        return [url]
+
+    def _run(self, key, n_threads):
+        results = []
+
+        def run():
+            try:
+                results.append(self.flights.do(key, self.fetch, key))
+            except ValueError as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=run) for _ in xrange(n_threads)]
+        threads[0].start()
+        self.assertTrue(self.started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        return threads, results
+
+    def _join(self, threads):
+        # let the other threads wait for the call in progress
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+
+    def test_shared(self):
+        threads, results = self._run('/subject/253', 8)
+        self._join(threads)
+        self.assertEqual(1, self.n_calls)
+        self.assertEqual(8, len(results))
+        # one result object for all callers
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(0, len(self.flights))
+        # nothing is cached once done
+        self.flights.do('/subject/253', self.fetch, '/subject/253')
+        self.assertEqual(2, self.n_calls)
+
+    def test_error(self):
+        threads, results = self._run('fail', 4)
+        self._join(threads)
+        self.assertEqual(1, self.n_calls)
+        self.assertEqual(4, len(results))
+        self.assertTrue(all(isinstance(result, ValueError)
+                            for result in results))
+
+    def test_detach(self):
+        threads, results = self._run('/subject/253', 1)
+        self.flights.detach()
+        self.release.set()
+        self.flights.do('/subject/253', self.fetch, '/subject/253')
+        self._join(threads)
+        self.assertEqual(2, self.n_calls)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from bgmcli.api.element import BangumiDummySubject
+from bgmcli.api.collection import BangumiDummySubjectCollection
+from bgmcli.cli.snapshot import load_snapshot, save_snapshot
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'snapshot')
+        self.colls = [
+            BangumiDummySubjectCollection(
+                BangumiDummySubject('253', u'カウボーイビバップ', u'星际牛仔'),
+                3, 9, [u'菅野よう子']),
+            BangumiDummySubjectCollection(
+                BangumiDummySubject('1451', u'東のエデン'), 3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertCollsEqual(self, colls):
+        self.assertEqual([coll.to_dict() for coll in self.colls],
+                         [coll.to_dict() for coll in colls])
+
+    def test_save_load(self):
+        save_snapshot('user@example.com', '123', self.colls, self.path)
+        self.assertEqual(['snapshot'], os.listdir(self.tmp_dir))
+        user_id, colls = load_snapshot('user@example.com', self.path)
+        self.assertEqual('123', user_id)
+        self.assertCollsEqual(colls)
+        self.assertIsInstance(colls[0], BangumiDummySubjectCollection)
+        self.assertEqual(u'星际牛仔', colls[0].subject.ch_title)
+
+    def test_email_mismatch(self):
+        save_snapshot('user@example.com', '123', self.colls, self.path)
+        self.assertEqual((None, []),
+                         load_snapshot('other@example.com', self.path))
+
+    def test_missing(self):
+        self.assertEqual((None, []),
+                         load_snapshot('user@example.com', self.path))
+
+    def test_corrupted(self):
+        for text in [u'{"email": "user@example.com", "user_id"',
+                     u'[]',
+                     u'{"email": "user@example.com", "user_id": "123"}',
+                     u'{"email": "user@example.com", "user_id": "123", '
+                     u'"collections": [{"c_status": 3}]}']:
+            with io.open(self.path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            self.assertEqual((None, []),
+                             load_snapshot('user@example.com', self.path))
+
+    def test_legacy_entries(self):
+        # collections were json text of their own in older snapshots
+        data = {'email': 'user@example.com', 'user_id': '123',
+                'collections': [self.colls[0].to_json(),
+                                self.colls[1].to_dict()]}
+        with io.open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False))
+        user_id, colls = load_snapshot('user@example.com', self.path)
+        self.assertEqual('123', user_id)
+        self.assertCollsEqual(colls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from bs4 import BeautifulSoup
+from bgmcli.api.store import SnapshotStore, SnapshotStoreWriter,\
+    write_snapshot_store
+from bgmcli.api.pipeline import Pipeline
+from bgmcli.api.collection import BangumiAnimeCollection,\
+    BangumiDummySubjectCollection
+from test_utils import module_path
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.split(module_path(cls.setUpClass))[0]
+        with open(os.path.join(path, 'ep_html')) as f:
+            ep_html = f.read()
+        with open(os.path.join(path, 'sub_html')) as f:
+            sub_html = f.read()
+        with open(os.path.join(path, 'on_hold_page')) as f:
+            soup = BeautifulSoup(f.read(), 'html.parser')
+        cls.sub_coll = BangumiAnimeCollection.from_html(sub_html, ep_html)
+        cls.sub_coll.n_watched_eps = 3
+        cls.dummy_colls = [
+            BangumiDummySubjectCollection.from_soup_for_li(li, 4)
+            for li in soup.find(id='browserItemList').find_all('li')]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'library.bgms')
+        write_snapshot_store(self.path, self.dummy_colls + [self.sub_coll])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get(self):
+        with SnapshotStore(self.path) as store:
+            self.assertEqual(4, len(store))
+            sub_coll = store.get('253')
+            self.assertEqual(self.sub_coll, sub_coll)
+            self.assertEqual(self.sub_coll.ep_collections,
+                             sub_coll.ep_collections)
+            for dummy_coll in self.dummy_colls:
+                self.assertEqual(dummy_coll.subject,
+                                 store.get(dummy_coll.subject.id_).subject)
+            self.assertTrue(u'253' in store)
+            self.assertFalse('1' in store)
+            self.assertRaises(KeyError, store.get, '1')
+
+    def test_summaries(self):
+        with SnapshotStore(self.path) as store:
+            summaries = list(store.iter_summaries())
+            self.assertEqual(sorted(coll.subject.id_ for coll in
+                                    self.dummy_colls + [self.sub_coll]),
+                             list(store))
+            self.assertEqual([s['sub_id'] for s in summaries], list(store))
+            summary = store.get_summary('253')
+            self.assertEqual(3, summary['n_watched_eps'])
+            self.assertEqual(self.sub_coll.subject.title, summary['title'])
+            self.assertEqual(self.sub_coll.subject.n_eps, summary['n_eps'])
+
+    def test_replace(self):
+        with SnapshotStoreWriter(self.path) as writer:
+            writer.write(self.sub_coll)
+            self.sub_coll.n_watched_eps = 5
+            writer.write(self.sub_coll)
+        self.sub_coll.n_watched_eps = 3
+        with SnapshotStore(self.path) as store:
+            self.assertEqual(1, len(store))
+            self.assertEqual(5, store.get('253').n_watched_eps)
+
+    def test_incomplete(self):
+        writer = SnapshotStoreWriter(self.path)
+        writer.write(self.sub_coll)
+        writer.close(complete=False)
+        # cancelled pipeline does not replace the store either
+        def fetch(coll):
+            pipeline.cancel()
+            return coll
+
+        pipeline = Pipeline([self.sub_coll], fetch, lambda coll: coll,
+                            SnapshotStoreWriter(self.path))
+        pipeline.run()
+        self.assertEqual(['library.bgms'], os.listdir(self.tmp_dir))
+        with SnapshotStore(self.path) as store:
+            self.assertEqual(4, len(store))
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'{"collections": []}' * 4)
+        self.assertRaises(ValueError, SnapshotStore, self.path)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import unittest
+from prompt_toolkit.document import Document
+from bgmcli.cli.title_index import TitleIndex, TitleCompleter
+
+
+class TitleIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.titles = [u'星际牛仔', u'xingjiniuzi', u'xjnz', u'攻壳机动队',
+                       u'攻壳机动队 S.A.C. 2nd GIG', u'东之伊甸']
+        self.index = TitleIndex(self.titles)
+
+    def test_add(self):
+        self.assertEqual(len(self.titles), len(self.index))
+        self.assertFalse(self.index.add(u'xjnz'))
+        self.assertTrue(self.index.add(u'xj'))
+        self.assertIn(u'xj', self.index)
+        self.assertNotIn(u'x', self.index)
+        self.assertEqual(sorted(self.titles + [u'xj']), list(self.index))
+
+    def test_longest_prefix(self):
+        self.assertEqual(u'攻壳机动队 S.A.C. 2nd GIG',
+                         self.index.longest_prefix(
+                             u'攻壳机动队 S.A.C. 2nd GIG EP3'))
+        self.assertEqual(u'攻壳机动队',
+                         self.index.longest_prefix(u'攻壳机动队 EP3'))
+        self.assertEqual(u'xjnz', self.index.longest_prefix(u'xjnz'))
+        self.assertIsNone(self.index.longest_prefix(u'xjnzEP3'))
+        self.assertIsNone(self.index.longest_prefix(u'xj EP3'))
+
+    def test_iter_prefixed(self):
+        self.assertEqual([u'xingjiniuzi', u'xjnz'],
+                         list(self.index.iter_prefixed(u'x')))
+        self.assertEqual([u'xingjiniuzi'],
+                         list(self.index.iter_prefixed(u'x', 1)))
+        self.assertEqual([], list(self.index.iter_prefixed(u'y')))
+
+    def test_completer(self):
+        completer = TitleCompleter([u'kandao', u'kanguo', u'lseps'],
+                                   lambda: self.index)
+
+        def complete(text):
+            return [c.text for c in
+                    completer.get_completions(Document(text), None)]
+        self.assertEqual([u'kandao', u'kanguo'], complete(u'kan'))
+        self.assertEqual([u'攻壳机动队', u'攻壳机动队 S.A.C. 2nd GIG'],
+                         complete(u'kandao 攻壳'))
+        self.assertEqual([], complete(u'kandao 攻壳机动队 EP'))